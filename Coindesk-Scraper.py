@@ -8,143 +8,41 @@ Date: 11/07/2021
 
 
 import argparse
-import json
+import logging
+import os
+import queue
+import random
+import signal
 import sys
-import textwrap as tw
-import pandas as pd
-import grequests
+import threading
 import time
 import datetime
 import pymysql
-import selenium.common.exceptions
 
+import collections
+from collections import Counter
+
+from aggregates import remove_from_aggregates, update_aggregates
+from article_batch import ArticleBatch
+from checkpoint import Checkpoint
 from config import *
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException
-from tabulate import tabulate
+from extractor import article_link, extract_article_data, extract_page_properties, listing_entries
+from governor import governor_for, governors
+from hash_keys import content_hash, sql_key
+from http_cache import ValidatorStore, is_revalidation
+from id_cache import dimension_caches, preload_caches
+from log_queue import UNLIMITED
+from metrics import run_metrics
+from sinks import DatabaseSink, JsonLinesSink, ParquetSink, SQLiteConnection, ndjson_lines, run_file
+from skip_index import StoredLinks
 from datetime import datetime
 from datetime import date
 from datetime import timedelta
 
-
-class Article:
-    """
-        A class to represent an article.
-
-        Attributes
-        ----------
-        article_num : int
-            Number article instance created.
-        title: str
-            Article title.
-        summary: str
-            Article summary.
-        author: str or list of strings
-            Article author(s).
-        link: str
-            Link to article webpage (url).
-        tags: list of str
-            Article hashtags.
-        date_published: datetime
-            Date and time article was published.
-        categories: (str)
-            Categories article falls under.
-
-
-        Methods
-        -------
-        get_article_num():
-            Returns article number of instance created.
-
-        get_title(self):
-            Returns article title
-
-        get_summary(self):
-            Returns article summary
-
-        get_link(self):
-            Returns URL to article page
-
-        get_tags(self):
-            Returns article tags
-
-        get_date_published(self):
-            Returns date and time article was published
-
-        get_categories(self):
-            Returns article category
-
-        get_authors(self):
-            Returns article author(s)
-        """
-    article_num = 0
-
-    def __init__(self, title, summary, author, link, tags, date_published, categories):
-        """
-        Constructs all necessary attributes of the vehicle object.
-        """
-        Article.article_num += 1
-        self.article_num = Article.article_num
-        self.title = title
-        self.summary = summary
-        self.author = author
-        self.link = link
-        self.tags = tags
-        self.date_published = date_published
-        self.categories = categories
-
-    def __str__(self):
-        """
-        Constructs a table when print is called on the article.
-        :return: table
-        """
-        return tabulate(tabular_data=[
-            ['Title', self.title],
-            ['Summary', '\n'.join(tw.wrap(self.summary, width=90))],
-            ['Author', ', '.join(self.author)],
-            ['Categories', ', '.join(self.categories)],
-            ['Link', self.link],
-            ['Tags', ', '.join(self.tags)],
-            ['Date/Time Published', self.date_published]
-        ],
-            headers=['#', self.article_num],
-            tablefmt='plain')
-
-    def get_article_num(self):
-        """:return: article number (int)"""
-        return self.article_num
-
-    def get_title(self):
-        """:return: article title (str)"""
-        return self.title
-
-    def get_summary(self):
-        """:return: article summary"""
-        return self.summary
-
-    def get_link(self):
-        """:return: url (str) to article webpage"""
-        return self.link
-
-    def get_tags(self):
-        """:return: article tags (list)"""
-        return self.tags
-
-    def get_date_published(self):
-        """:return: date and time article was published."""
-        return self.date_published
-
-    def get_categories(self):
-        """:return: the categories the article belongs to"""
-        return self.categories
-
-    def get_authors(self):
-        """:return: the authors that wrote the article"""
-        return self.author
+try:
+    import fcntl
+except ImportError:  # not on windows, where the daemon runs without its lock file
+    fcntl = None
 
 
 # Overriding error function in order to display the help message
@@ -168,15 +66,16 @@ class MyParser(argparse.ArgumentParser):
 
 def welcome():
     """
-    Gets the category and number of articles required by the user, with argparser,
-    and outputs the relevant URL suffix for these articles together with the number of articles.
+    Gets the categories and number of articles required by the user, with argparser,
+    and outputs the relevant URL suffixes for these articles together with the number of articles.
     the program also response to the flag -h for help.
-    return:    category: relevant category URL suffix.
+    return:    categories: list of the relevant category URL suffixes.
                scrape_by: number of articles requested by the user
                username: username for mysql
                password: password for mysql
                host: url of database server
                database: database that the program is going to save the data to
+               pipeline: dictionary with the worker counts and queue depth of the scraping pipeline
     """
 
     category_dict = {
@@ -192,11 +91,12 @@ def welcome():
     coindesk_reader = MyParser(add_help=False)
 
     date_or_num = coindesk_reader.add_mutually_exclusive_group(required=True)
-    coindesk_reader.add_argument('category', type=str.lower, metavar='category',
-                                 help='Choose one of the following categories: '
+    coindesk_reader.add_argument('category', type=str.lower, metavar='category', nargs='+',
+                                 help='Choose one or more of the following categories: '
                                       'latest, tech, business, regulation, people, '
-                                      'features, opinion, markets.',
-                                 choices=['latest', 'tech', 'business', 'regulation', 'people', 'opinion', 'markets'])
+                                      'features, opinion, markets, or all of them with "all". '
+                                      'They are scraped concurrently.',
+                                 choices=list(category_dict) + [ALL_CATEGORIES])
     date_or_num.add_argument('-num', type=int, metavar='num_articles',
                              help=f'You can choose one of the two options: -num or -date.'
                                   f'\nChoose number of articles, from 1 to {MAX_ARTICLES} '
@@ -208,12 +108,53 @@ def welcome():
                                   f'You will get articles published after that date')
     coindesk_reader.add_argument('-u', '--username', help='username of mysql', default=USER)
     required = coindesk_reader.add_argument_group('required arguments')
-    required.add_argument('-p', '--password', help='password of mysql', required=True)
+    required.add_argument('-p', '--password', help='password of mysql (not needed with another --storage)')
     coindesk_reader.add_argument('-host', help='url of database server', default=HOST)
     coindesk_reader.add_argument('-db', '--database', help='Name of database to insert to', default=DATABASE)
+    coindesk_reader.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS, metavar='workers',
+                                 help='Number of workers downloading article batches concurrently')
+    coindesk_reader.add_argument('--writer-workers', type=int, default=WRITER_WORKERS, metavar='workers',
+                                 help='Number of workers saving article batches to the database')
+    coindesk_reader.add_argument('--listing', choices=[HTTP_LISTING, SELENIUM_LISTING], default=HTTP_LISTING,
+                                 help='Read the category listing over plain http (default, falls back to selenium '
+                                      'if the listing data cannot be read) or by clicking "MORE" with selenium')
+    coindesk_reader.add_argument('--show-browser', action='store_true',
+                                 help='Run the selenium listing in a visible browser that loads images, fonts and '
+                                      'third-party scripts (by default it runs headless without them)')
+    coindesk_reader.add_argument('--revalidate', action='store_true',
+                                 help='Also request articles that are already stored (conditionally, so unchanged '
+                                      'ones cost a 304) and update the ones that changed')
+    coindesk_reader.add_argument('--queue-depth', type=int, default=QUEUE_DEPTH, metavar='depth',
+                                 help='Number of batches that may wait between two pipeline stages')
+    coindesk_reader.add_argument('--metrics-report', default=METRICS_REPORT_FILE, metavar='file',
+                                 help='Json file the run metrics (stage times, fetch latencies, rows saved) '
+                                      'are written to')
+    coindesk_reader.add_argument('--metrics-prometheus', default=METRICS_PROMETHEUS_FILE, metavar='file',
+                                 help='Prometheus text file the run metrics are written to')
+    coindesk_reader.add_argument('--storage', choices=[MYSQL_STORAGE, SQLITE_STORAGE, JSONL_STORAGE, PARQUET_STORAGE],
+                                 default=MYSQL_STORAGE,
+                                 help='Where the articles are saved: the mysql database (default), a sqlite database '
+                                      'file with the same tables, or one jsonl / parquet file per run')
+    coindesk_reader.add_argument('--daemon', action='store_true',
+                                 help='Keep running and scrape the new articles of every category every --interval '
+                                      'seconds, keeping the browser, http and database connections open')
+    coindesk_reader.add_argument('--interval', type=float, default=DAEMON_INTERVAL_SECONDS, metavar='seconds',
+                                 help='Seconds between two scrapes of a category in --daemon mode')
+    coindesk_reader.add_argument('--jitter', type=float, default=DAEMON_JITTER, metavar='fraction',
+                                 help='Fraction of the interval each scrape is randomly moved by in --daemon mode')
+    coindesk_reader.add_argument('--resume', action='store_true',
+                                 help=f'Continue the run that stopped with the same categories and -num / -date '
+                                      f'from its checkpoint ({CHECKPOINT_FILE}), without listing, downloading or '
+                                      f'saving again what it already did')
+    coindesk_reader.add_argument('--output', choices=[TABLE_OUTPUT, NDJSON_OUTPUT, NO_OUTPUT], default=TABLE_OUTPUT,
+                                 help='Print each article as a table (default), as one json object per line '
+                                      '(written batch by batch, for piping to other programs) or not at all')
+    coindesk_reader.add_argument('--storage-path', metavar='path',
+                                 help=f'SQLite database file (default {SQLITE_FILE}) or directory of the run files '
+                                      f'(default {RUN_FILES_DIR})')
 
     args = coindesk_reader.parse_args()
-    category = args.category
+    categories = list(category_dict) if ALL_CATEGORIES in args.category else list(dict.fromkeys(args.category))
     scrape_by = {}
     if args.num is not None:
         scrape_by[SCRAPE_BY_TYPE] = NUM_SCRAPE_TYPE
@@ -232,229 +173,1222 @@ def welcome():
         scrape_by[SCRAPE_BY_FUNCTION] = by_date_of_articles
         scrape_by[SCRAPE_BY_PARAMETERS] = from_date
 
-    return category_dict[category], scrape_by, args.username, args.password, args.host, args.database
+    if min(args.fetch_workers, args.writer_workers, args.queue_depth) < 1:
+        coindesk_reader.error("Worker counts and queue depth must be at least 1")
+    if args.interval <= 0 or not 0 <= args.jitter < 1:
+        coindesk_reader.error("The interval must be positive and the jitter between 0 and 1")
+    if args.resume and args.daemon:
+        coindesk_reader.error("--resume cannot be used with --daemon")
+    if args.storage == MYSQL_STORAGE and args.password is None:
+        coindesk_reader.error("the following arguments are required: -p/--password")
+    storage_path = args.storage_path
+    if storage_path is None:
+        storage_path = SQLITE_FILE if args.storage == SQLITE_STORAGE else RUN_FILES_DIR
+    pipeline = {
+        PIPELINE_FETCH_WORKERS: args.fetch_workers,
+        PIPELINE_WRITER_WORKERS: args.writer_workers,
+        PIPELINE_QUEUE_DEPTH: args.queue_depth,
+        PIPELINE_LISTING: args.listing,
+        PIPELINE_REVALIDATE: args.revalidate,
+        PIPELINE_SHOW_BROWSER: args.show_browser,
+        PIPELINE_DAEMON: args.daemon,
+        PIPELINE_INTERVAL: args.interval,
+        PIPELINE_JITTER: args.jitter,
+        PIPELINE_RESUME: args.resume,
+        PIPELINE_OUTPUT: args.output,
+        PIPELINE_METRICS_REPORT: args.metrics_report,
+        PIPELINE_METRICS_PROMETHEUS: args.metrics_prometheus,
+        PIPELINE_STORAGE: args.storage,
+        PIPELINE_STORAGE_PATH: storage_path,
+    }
+
+    return ([category_dict[category] for category in categories], scrape_by, args.username, args.password, args.host,
+            args.database, pipeline)
 
 
-def by_number_of_articles(num_articles, browser):
+def story_state(browser):
+    """
+    :param browser: browser driver
+    :return: (number of stories loaded, text of the last story's time), read with one script call
+    """
+    count, last_time = browser.execute_script(STORY_STATE_SCRIPT)
+    return count, last_time
+
+
+def load_more_stories(browser, state, on_links):
+    """
+    clicks on the 'MORE' button, waits until the story stack grew or its last story changed
+    and hands the links of the new stories to on_links
+    :param browser: browser driver
+    :param state: story_state before the click
+    :param on_links: function receiving the hrefs of the new stories, returning False once no more are wanted
+    :return: the new story_state, or None if no more stories loaded in time or are wanted
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    try:
+        more_button = WebDriverWait(browser, SELENIUM_WAIT_SECONDS, SELENIUM_POLL_SECONDS).until(
+            EC.presence_of_element_located((By.CLASS_NAME, MORE_BUTTON_CLASS)))
+    except TimeoutException:
+        print("Articles did not load in time due to network.", file=sys.stderr)
+        coin_logger.error("Articles did not load in time due to network.")
+        sys.exit(1)
+    more_button.click()
+
+    def stories_changed(driver):
+        new_state = story_state(driver)
+        return new_state if new_state != state else False
+
+    try:
+        state = WebDriverWait(browser, SELENIUM_WAIT_SECONDS, SELENIUM_POLL_SECONDS).until(stories_changed)
+    except TimeoutException:
+        coin_logger.warning(f'No more stories loaded after {state[0]}, keeping the ones loaded.')
+        return None
+    return state if on_links(browser.execute_script(TAKE_STORY_LINKS_SCRIPT)) else None
+
+
+def by_number_of_articles(num_articles, browser, on_links):
     """
     opens the webpage by the number of articles needed
     :param num_articles: number of articles
     :param browser: browser driver
+    :param on_links: function receiving the hrefs of the new stories after every load
     """
-    num_elements = 0
-    while num_elements < num_articles:
-        num_elements = len(browser.find_elements_by_class_name("text-content"))
-        try:
-            more_button = WebDriverWait(browser, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "cta-story-stack")))
-        except TimeoutException:
-            print("Articles did not load in time due to network.")
-            coin_logger.error("Articles did not load in time due to network.")
-            browser.close()
-            sys.exit(1)
-        more_button.click()
-        time.sleep(1)
+    state = story_state(browser)
+    while state is not None and state[0] < num_articles:
+        state = load_more_stories(browser, state, on_links)
+
+
+def published_by(time_text, from_date):
+    """
+    :param time_text: text of a story's time on the listing ('Today ...', 'Yesterday ...' or a date)
+    :param from_date: date limit to scrape to
+    :return: boolean if the story was published on or before the date limit
+    """
+    if not time_text:
+        return False
+    if time_text.startswith(TODAY) or time_text[0].isdigit():
+        time_text = datetime.today().strftime(date_format)
+    elif time_text.startswith(YESTERDAY):
+        time_text = (date.today() - timedelta(days=1)).strftime(date_format)
+    return datetime.strptime(time_text, date_format) <= from_date
 
 
-def by_date_of_articles(from_date, browser):
+def by_date_of_articles(from_date, browser, on_links):
     """
     opens the webpage by the dates of the articles
     :param from_date: date limit to scrape to
     :param browser: browser driver
+    :param on_links: function receiving the hrefs of the new stories after every load
     """
-    page_time = datetime.today()
-    while page_time > from_date:
-        date_published_text = browser.find_elements_by_class_name("time")[-1].text
-        if date_published_text.startswith(TODAY) or date_published_text[0].isdigit():
-            date_published_text = datetime.today().strftime(date_format)
-        elif date_published_text.startswith(YESTERDAY):
-            today = date.today()
-            date_published_text = (today - timedelta(days=1)).strftime(date_format)
-        page_time = datetime.strptime(date_published_text, date_format)
-        try:
-            more_button = WebDriverWait(browser, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "cta-story-stack")))
-        except TimeoutException:
-            print("Articles did not load in time due to network.")
-            coin_logger.error("Articles did not load in time due to network.")
-            browser.close()
-            sys.exit(1)
-        more_button.click()
-        time.sleep(1)
+    state = story_state(browser)
+    while state is not None and not published_by(state[1], from_date):
+        state = load_more_stories(browser, state, on_links)
 
 
-def get_html(url, scrape_by):
+def open_browser(show_browser=False):
+    """
+    starts Chrome: headless, without images, fonts and third-party scripts, and returning from page loads
+    once the DOM is ready, unless show_browser asks for the full visible browser
+    :param show_browser: boolean
+    :return: browser driver
+    """
+    from selenium import webdriver
+    if show_browser:
+        return webdriver.Chrome()
+    options = webdriver.ChromeOptions()
+    for argument in HEADLESS_CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_experimental_option('prefs', CHROME_PREFERENCES)
+    capabilities = webdriver.DesiredCapabilities.CHROME.copy()
+    capabilities['pageLoadStrategy'] = PAGE_LOAD_STRATEGY
+    browser = webdriver.Chrome(options=options, desired_capabilities=capabilities)
+    browser.execute_cdp_cmd('Network.enable', {})
+    browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    return browser
+
+
+def scroll_listing(url, scrape_by, on_links, show_browser=False, browser=None):
     """
-    Opens the url using Chrome driver.
-    Clicks on the 'MORE' button several times.
+    Opens the url using Chrome driver and clicks on the 'MORE' button until enough articles are loaded.
+    The links of the stories are handed to on_links as they appear (the ones of the first page, then the new
+    ones after every load), read from the nodes added to the story stack only.
     :param url: coindesk.com url
     :param scrape_by: dictionary that details how to scrape
-    :return: the page source code as html
+    :param on_links: function receiving a list of story hrefs, returning False once no more are wanted
+    :param show_browser: boolean, use a visible browser loading every resource
+    :param browser: browser driver kept open by the caller, or None to start one for this listing
     """
-    browser = webdriver.Chrome()
+    from selenium.common.exceptions import WebDriverException
+    keep_browser = browser is not None
+    if not keep_browser:
+        browser = open_browser(show_browser)
     try:
         browser.get(url)
-        scrape_by[SCRAPE_BY_FUNCTION](scrape_by[SCRAPE_BY_PARAMETERS], browser)
-    except selenium.common.exceptions.WebDriverException as err:
-        print(err.msg)
+        if not browser.execute_script(WATCH_STORY_LINKS_SCRIPT):
+            coin_logger.error(f'The listing {url} has no story stack.')
+            return
+        if on_links(browser.execute_script(TAKE_STORY_LINKS_SCRIPT)):
+            scrape_by[SCRAPE_BY_FUNCTION](scrape_by[SCRAPE_BY_PARAMETERS], browser, on_links)
+    except WebDriverException as err:
+        print(err.msg, file=sys.stderr)
         coin_logger.error(err.msg)
         exit(1)
-    html = browser.page_source
-    return html
+    finally:
+        if not keep_browser:
+            browser.quit()
+
+
+def story_links(hrefs):
+    """
+    Receives the hrefs of the story links of the listing and returns the urls of the articles,
+    dropping the hrefs of section pages (article_link).
+    :param hrefs: list of hrefs
+    :return: list of article urls, without duplicates
+    """
+    return [link for link in dict.fromkeys(article_link(href) for href in hrefs) if link is not None]
+
+
+def listing_complete(entries, scrape_by):
+    """
+    checks if the listing pages read so far already hold every article the user asked for
+    :param entries: list of (url, publication datetime or None)
+    :param scrape_by: dictionary defining how to scrape
+    :return: boolean
+    """
+    if scrape_by[SCRAPE_BY_TYPE] == NUM_SCRAPE_TYPE:
+        return len(entries) >= scrape_by[SCRAPE_BY_PARAMETERS]
+    dates = [published for _, published in entries if published is not None]
+    return bool(dates) and min(dates) <= scrape_by[SCRAPE_BY_PARAMETERS]
 
 
-def scrape_main(html):
+def crawl_listing(url, scrape_by):
     """
-    Receives the full html from the main page and returns a list of urls to all the articles.
-    :param html: str
-    :return: list
+    Reads the category listing over plain http, page by page (ARTICLES_PER_PAGE articles each),
+    from the next.js data embedded in the listing pages, until it holds enough articles.
+    :param url: coindesk.com category url
+    :param scrape_by: dictionary that details how to scrape
+    :return: list of (article url, publication datetime or None), or None if the listing data could not be read
+    """
+    entries = []
+    seen = set()
+    max_pages = MAX_ARTICLES // ARTICLES_PER_PAGE + 2
+    for page_number in range(1, max_pages + 1):
+        page_url = url if page_number == 1 else f'{url}?{LISTING_PAGE_PARAM}={page_number}'
+        pages = fetch_pages([page_url])
+        if not pages:
+            coin_logger.warning(f'Could not download listing page {page_url}.')
+            break
+        props = extract_page_properties(pages[0][1].content)
+        if props is None:
+            coin_logger.warning(f'Listing page {page_url} has no readable next.js data.')
+            break
+        page_entries = listing_entries(props)
+        new_entries = [entry for entry in page_entries if entry[0] not in seen]
+        if not new_entries:
+            break
+        seen.update(link for link, _ in new_entries)
+        entries += new_entries
+        if listing_complete(entries, scrape_by):
+            break
+    if not entries:
+        return None
+    coin_logger.info(f'Read {len(entries)} article urls from the listing over http.')
+    return entries
+
+
+def get_links(url, scrape_by, listing):
+    """
+    gets the article urls of a category over http, unless selenium was requested or the http listing fails
+    :param url: coindesk.com category url
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING or SELENIUM_LISTING
+    :return: list of article urls and dictionary of url -> publication datetime for the urls the listing dates,
+             or None if the category is to be listed with selenium, while its articles are scraped
     """
-    soup = BeautifulSoup(html, 'html.parser').find('div', class_='story-stack')
-    links = pd.Series(
-        [URL + link.get('href') for link in soup.find_all('a', title=True)
-         if str(link.get('href')).count("/") == 1]).unique()
-    coin_logger.info('Scraped article urls from main page.')
-    return links
+    if listing == SELENIUM_LISTING:
+        return None
+    with run_metrics.stage(STAGE_HTTP_LISTING):
+        entries = crawl_listing(url, scrape_by)
+    if entries is None:
+        coin_logger.warning('Falling back to selenium for the listing.')
+        return None
+    return [link for link, _ in entries], {link: published for link, published in entries if published}
 
 
-def scrape_articles(urls):
+def get_jobs(categories, scrape_by, listing):
     """
-    scraps all of the articles from the url list
+    reads the http listings of the categories concurrently and builds their jobs.
+    The categories listed with selenium get a job without links, that the scraper fills while scrolling.
+    An article listed in several categories is only kept in the first category listing it, so it is fetched once.
+    :param categories: list of category URL suffixes
+    :param scrape_by: dictionary that details how to scrape
+    :param listing: HTTP_LISTING or SELENIUM_LISTING
+    :return: list of ScrapeJob
+    """
+    listings = [None] * len(categories)
+    errors = []
+    abort = threading.Event()
+
+    def read_listing(index):
+        listings[index] = get_links(URL + categories[index], scrape_by, listing)
+
+    threads = [threading.Thread(target=run_stage, args=(read_listing, errors, abort, index), daemon=True)
+               for index in range(len(categories))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    jobs = []
+    claimed = set()
+    for category, listed in zip(categories, listings):
+        if listed is None:
+            jobs.append(ScrapeJob(category, [], scrape_by, listing_url=URL + category))
+            continue
+        links, listing_dates = listed
+        own_links = [link for link in links if link not in claimed]
+        claimed.update(own_links)
+        if len(own_links) < len(links):
+            run_metrics.count(METRIC_CROSS_LISTED_SKIPPED, len(links) - len(own_links))
+            coin_logger.info(f'{category}: {len(links) - len(own_links)} articles are already listed in another '
+                             f'category, fetching them once.')
+        jobs.append(ScrapeJob(category, own_links, scrape_by, listing_dates))
+    return jobs
+
+
+def retry_after(response):
+    """
+    reads the Retry-After header of a response
+    :param response: requests response or None
+    :return: seconds to wait (float) or None if the server did not ask for a delay in seconds
+    """
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def new_http_session():
+    """
+    :return: requests session keeping up to HTTP_POOL_SIZE connections open per host, so the fetch workers
+             reuse their connections (and TLS sessions) from batch to batch
+    """
+    import grequests  # patches the sockets with gevent, so it is imported before requests
+    import requests.adapters
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+http_session = None  # shared by every request of the process, opened by the first one
+http_session_lock = threading.Lock()
+
+
+def shared_http_session():
+    """:return: the http session shared by every request of the process"""
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            http_session = new_http_session()
+        return http_session
+
+
+def fetch_pages(urls, validators=None):
+    """
+    downloads the pages of the urls, sending each host only as many requests at a time as its governor allows.
+    Requests that failed or were answered with 429/5xx are retried up to FETCH_RETRIES times. Pages answered
+    with another 4xx are left out (counted as not found or as fetch failures).
+    With a validator store, the urls the database confirms are stored are requested conditionally and may be
+    answered with 304.
+    :param urls: list of urls
+    :param validators: ValidatorStore or None
+    :return: list of (url, response) for the pages that were downloaded, in the order of urls
+    """
+    import grequests
+    session = shared_http_session()
+    responses = {}
+    conditional = validators.conditional_headers(urls) if validators is not None else {}
+    attempts = dict.fromkeys(urls, 0)
+    pending = list(urls)
+    while pending:
+        governor = governor_for(pending[0])
+        same_host = [url for url in pending if governor_for(url) is governor]
+        granted = governor.acquire(len(same_host))
+        wave = same_host[:granted]
+        in_wave = set(wave)
+        pending = [url for url in pending if url not in in_wave]
+        results = grequests.map([grequests.get(url, timeout=FETCH_TIMEOUT, session=session,
+                                               headers=conditional.get(url))
+                                 for url in wave], size=granted)
+        for url, response in zip(wave, results):
+            status = None if response is None else response.status_code
+            latency = None if response is None else response.elapsed.total_seconds()
+            governor.release(latency, status, retry_after(response))
+            run_metrics.observe_fetch(latency, status, 0 if response is None else len(response.content))
+            if status is not None and status < 400:
+                responses[url] = response
+                if validators is not None and status == 200:
+                    validators.stage(url, response)
+            elif status is not None and status != 429 and status < 500:
+                run_metrics.count(METRIC_NOT_FOUND if status in NOT_FOUND_STATUSES else METRIC_FETCH_FAILURES)
+                coin_logger.warning(f'{url} was answered with {status}, skipping it.')
+            elif attempts[url] < FETCH_RETRIES:
+                attempts[url] += 1
+                pending.append(url)
+            else:
+                run_metrics.count(METRIC_FETCH_FAILURES)
+                coin_logger.error(f'Giving up on {url} after {FETCH_RETRIES} retries (status {status}).')
+    return [(url, responses[url]) for url in urls if url in responses]
+
+
+def scrape_articles(urls, validators=None):
+    """
+    scraps all of the articles from the url list.
+    Pages answered with 304 (not modified since they were saved) are skipped.
+    Each page is dropped as soon as its article was extracted, so the batch only keeps the article fields.
     :param urls: list of urls
-    :return: lists of article data
-    """
-    responses = grequests.map((grequests.get(url) for url in urls))
-    soups = [BeautifulSoup(response.content, 'html.parser') for response in responses]
-    data_dicts = []
-    # TODO: find better way to check for 404s?
-    for soup in soups:
-        props = json.loads(soup.find(SCRIPT_TAG, id=SCRIPT_ID, type=SCRIPT_TYPE).string)[PROPERTIES_TAG][
-            INITIAL_PROPERTIES_TAG][PAGE_PROPERTIES]
-        if DATA_TAG not in props:  # article doesn't exist anymore (404 page)
-            coin_logger.warning('Encountered link that led to an internal 404 will not scrap its data.')
+    :param validators: ValidatorStore or None
+    :return: ArticleBatch of the articles that were scraped, in the order of urls
+    """
+    with run_metrics.stage(STAGE_FETCH):
+        pages = collections.deque(fetch_pages(urls, validators))
+    articles = ArticleBatch()
+    not_modified = 0
+    with run_metrics.stage(STAGE_EXTRACT):
+        while pages:
+            url, response = pages.popleft()
+            if response.status_code == 304:
+                not_modified += 1
+                continue
+            data = extract_article_data(response.content)
+            if data is None:  # article doesn't exist anymore (internal 404 page) or the page has no article data
+                run_metrics.count(METRIC_NOT_FOUND)
+                coin_logger.warning(f'{url} has no article data (internal 404 or error page), will not scrap it.')
+                continue
+            else:
+                articles.append(url, data, is_revalidation(response))
+    if not_modified:
+        run_metrics.count(METRIC_NOT_MODIFIED, not_modified)
+        coin_logger.info(f'{not_modified} articles were not modified since they were saved, skipped them.')
+    return articles
+
+
+FETCH_FINISHED = object()  # sent by each fetch worker to the parse stage when it stops
+
+
+def put_unless_set(target_queue, item, *events):
+    """
+    puts an item on a bounded queue, giving up if one of the events is set while waiting for room
+    :param target_queue: queue to put the item on
+    :param item: the item
+    :param events: events that end the wait (stop condition met, pipeline failed)
+    :return: boolean if the item was queued
+    """
+    while not any(event.is_set() for event in events):
+        try:
+            target_queue.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
             continue
-        else:
-            data_dicts.append(props[DATA_TAG])
+    return False
+
 
-    titles = [data[TITLE_TAG] for data in data_dicts]
-    summaries = [data[SUMMARY_TAG] for data in data_dicts]
-    authors = [[author[AUTHOR_NAME_TAG] for author in data[AUTHORS_TAG]] for data in data_dicts]
-    tags = [[tag[TAG_NAME_TAG] for tag in data[TAGS_TAG]] for data in data_dicts]
-    times_published = [datetime.strptime(data[PUBLISHED_DATE_TAG], PUBLISHED_DATE_FORMAT) for data in data_dicts]
-    categories = [data[TAXONOMY_TAG][CATEGORY_TAG] for data in data_dicts]
-    return titles, summaries, authors, tags, times_published, categories
+def get_unless_set(source_queue, *events):
+    """
+    gets an item from a queue, giving up if one of the events is set while waiting for one
+    :param source_queue: queue to get the item from
+    :param events: events that end the wait (pipeline failed)
+    :return: the item, or None if the wait was ended
+    """
+    while not any(event.is_set() for event in events):
+        try:
+            return source_queue.get(timeout=QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return None
 
 
-def scraper(html, batch, scrape_by, user, password, host, database):
+class ScrapeJob:
     """
-    scrapes the html source code and save the data into the database in batches
-    :param html: string of html source code
-    :param batch: int size of batch
-    :param scrape_by: dictionary defining how to scrape
+        The articles of one category to scrape, and how far the run got with them.
+
+        Attributes
+        ----------
+        category : str
+            Category URL suffix.
+        links: list of str
+            Article urls to fetch, in listing order (cut at the date cut-off when the listing dates it).
+        listing_dates: dict
+            Url -> publication datetime of the links the http listing dates.
+        listing_url: str or None
+            Url of the selenium listing that adds links while the job runs, or None.
+        listing_open: bool
+            True while the selenium listing may still add links.
+        scrape_by: dict
+            Dictionary defining how to scrape (number of articles or date cut-off).
+        budget: int or None
+            Number of articles wanted in num mode.
+        position: int
+            Number of links handed out to the fetch workers.
+        in_flight: int
+            Number of pages requested and not reported yet.
+        scraped: int
+            Number of articles the fetched pages yielded.
+        articles: int
+            Number of articles accepted by stop_condition.
+        done: bool
+            True once stop_condition ended the job.
+        """
+
+    def __init__(self, category, links, scrape_by, listing_dates=None, listing_url=None):
+        """
+        Constructs the job of a category.
+        """
+        self.category = category
+        self.links = list(links)
+        self.listing_url = listing_url
+        self.listing_open = listing_url is not None
+        self.scrape_by = scrape_by
+        self.budget = None
+        if scrape_by[SCRAPE_BY_TYPE] == NUM_SCRAPE_TYPE:
+            self.budget = scrape_by[SCRAPE_BY_PARAMETERS]
+        elif scrape_by[SCRAPE_BY_TYPE] == DATE_SCRAPE_TYPE and listing_dates:
+            too_old = [index for index, link in enumerate(self.links)
+                       if link in listing_dates and listing_dates[link] <= scrape_by[SCRAPE_BY_PARAMETERS]]
+            if too_old:
+                coin_logger.info(f'{category}: skipping {len(self.links) - too_old[0]} links the listing dates '
+                                 f'before the cut-off.')
+                self.links = self.links[:too_old[0]]
+        listing_dates = listing_dates or {}
+        self.listing_dates = {link: listing_dates[link] for link in self.links if link in listing_dates}
+        self.position = 0
+        self.set_number = 0
+        self.in_flight = 0
+        self.scraped = 0
+        self.articles = 0
+        self.stopped = False
+        self.done = False
+
+    def allowed(self, batch):
+        """
+        :param batch: int size of batch
+        :return: number of links that may be handed out now
+        """
+        if self.stopped:
+            return 0
+        wanted = batch
+        if self.budget is not None:
+            wanted = min(wanted, self.budget - self.scraped - self.in_flight)
+        available = len(self.links) - self.position
+        if self.listing_open and available < wanted:
+            return 0  # wait for a full batch while the listing is still scrolling
+        return min(wanted, available)
+
+
+class FetchPlanner:
+    """
+        Hands the shared fetch workers their next batch of links, taking the jobs (categories) in turn
+        and never handing out more links than can still pass stop_condition.
+
+        In num mode the pages in flight count against the number of articles still wanted, and a page that
+        yields no article (404, 304, failed download) gives its share of the budget back.
+        In date mode the links are cut at the first one the listing already dates at or before the cut-off,
+        since stop_condition would end the job there.
+        The links of a selenium listing are added while it scrolls; its job is handed out full batches
+        until the listing is closed.
+
+        Methods
+        -------
+        next_batch():
+            Returns (job, batch number, list of urls) to fetch next, or None when nothing is left to fetch.
+
+        report(job, requested, scraped):
+            Records how many articles a fetched batch yielded.
+
+        add_links(job, links):
+            Appends the links a listing found while the job runs.
+
+        close_listing(job):
+            Records that a listing will add no more links.
+
+        stop(job=None):
+            Ends the planning of a job (stop condition met), or of every job (pipeline failed).
+
+        Once the shutdown event is set no more batches are handed out, the ones in flight are still saved.
+        """
+
+    def __init__(self, jobs, batch, shutdown=None):
+        """
+        Plans the fetching of the jobs' links in listing order.
+        """
+        self.jobs = jobs
+        self.batch = batch
+        self.shutdown = shutdown or threading.Event()
+        self.turn = 0
+        self.owners = {link: job for job in jobs for link in job.links}
+        self.condition = threading.Condition()
+
+    def next_batch(self):
+        """
+        waits until budget is free (only while pages are in flight that may give it back)
+        :return: (job, batch number, list of urls) or None when nothing is left to fetch
+        """
+        with self.condition:
+            while not self.shutdown.is_set():
+                for offset in range(len(self.jobs)):
+                    job = self.jobs[(self.turn + offset) % len(self.jobs)]
+                    allowed = job.allowed(self.batch)
+                    if allowed > 0:
+                        self.turn = (self.turn + offset + 1) % len(self.jobs)
+                        link_set = job.links[job.position:job.position + allowed]
+                        job.position += len(link_set)
+                        job.in_flight += len(link_set)
+                        job.set_number += 1
+                        return job, job.set_number - 1, link_set
+                if not any((job.in_flight or job.listing_open) and not job.stopped for job in self.jobs):
+                    return None
+                self.condition.wait(QUEUE_POLL_SECONDS)
+            return None
+
+    def report(self, job, requested, scraped):
+        """
+        :param job: the job of the batch
+        :param requested: number of pages requested in the batch
+        :param scraped: number of articles the batch yielded
+        """
+        with self.condition:
+            job.in_flight -= requested
+            job.scraped += scraped
+            self.condition.notify_all()
+
+    def add_links(self, job, links):
+        """
+        appends links a listing found while the job runs, dropping the ones it or another job already has
+        :param job: the job of the listing
+        :param links: list of article urls
+        """
+        with self.condition:
+            new_links = [link for link in links if link not in self.owners]
+            cross_listed = sum(self.owners.get(link, job) is not job for link in links)
+            self.owners.update(dict.fromkeys(new_links, job))
+            job.links += new_links
+            self.condition.notify_all()
+        run_metrics.count(METRIC_CROSS_LISTED_SKIPPED, cross_listed)
+
+    def close_listing(self, job):
+        """
+        :param job: the job whose listing will add no more links
+        """
+        with self.condition:
+            job.listing_open = False
+            self.condition.notify_all()
+
+    def stop(self, job=None):
+        """
+        ends the planning of a job, or of every job, waking up the workers waiting for budget
+        :param job: the job to stop, or None for all of them
+        """
+        with self.condition:
+            for stopped in self.jobs if job is None else [job]:
+                stopped.stopped = True
+            self.condition.notify_all()
+
+
+def run_stage(stage, errors, abort, *args):
+    """
+    runs a pipeline stage, recording any failure (including sys.exit) so the main thread can re-raise it
+    :param stage: the stage function
+    :param errors: list collecting the exceptions raised by the stages
+    :param abort: event set when the pipeline failed
+    :param args: arguments of the stage function
+    """
+    try:
+        stage(*args)
+    except BaseException as err:
+        errors.append(err)
+        abort.set()
+
+
+def listing_stage(job, planner, stored_links, checkpoint, show_browser, browsers, abort):
+    """
+    scrolls the selenium listing of a job, handing the planner the links of the new stories after every load,
+    so the fetch workers download them while the listing goes on. Stops scrolling once the job met its
+    stop condition or the planner was shut down.
+    :param job: ScrapeJob with a listing_url
+    :param planner: FetchPlanner of the jobs
+    :param stored_links: StoredLinks dropping the articles already stored, or None
+    :param checkpoint: Checkpoint recording the links found and dropping the ones already committed, or None
+    :param show_browser: boolean, use a visible browser loading every resource
+    :param browsers: dictionary of category -> browser kept open between runs (filled here), or None
+    :param abort: event set when the pipeline failed
+    """
+
+    def on_links(hrefs):
+        links = story_links(hrefs)
+        if stored_links is not None and links:
+            new_links = stored_links.filter_new(links)
+            run_metrics.count(METRIC_KNOWN_URLS_SKIPPED, len(links) - len(new_links))
+            links = new_links
+        if checkpoint is not None:
+            links = [link for link in links if link not in checkpoint.committed]
+        planner.add_links(job, links)
+        if checkpoint is not None:
+            checkpoint.record_job(job)
+        return not job.stopped and not abort.is_set() and not planner.shutdown.is_set()
+
+    browser = None
+    if browsers is not None:
+        if job.category not in browsers:
+            browsers[job.category] = open_browser(show_browser)
+        browser = browsers[job.category]
+    finished = False
+    try:
+        with run_metrics.stage(STAGE_SELENIUM_LISTING):
+            scroll_listing(job.listing_url, job.scrape_by, on_links, show_browser, browser)
+        finished = not abort.is_set() and not planner.shutdown.is_set()
+    except BaseException:
+        planner.stop()
+        if browser is not None:  # the next run starts a fresh browser
+            browsers.pop(job.category).quit()
+        raise
+    finally:
+        planner.close_listing(job)
+        if checkpoint is not None:  # a listing cut short by a failure or a shutdown is scrolled again on resume
+            checkpoint.record_job(job, listing_open=not finished and not job.done)
+    coin_logger.info(f'{job.category}: the listing found {len(job.links)} article urls to scrape.')
+
+
+def fetch_stage(planner, fetched, validators, done, abort):
+    """
+    downloads and extracts the article batches the planner hands out, until it has none left
+    or every job met its stop condition. Ends by sending FETCH_FINISHED to the parse stage.
+    :param planner: FetchPlanner
+    :param fetched: bounded queue of (job, batch number, list of urls, ArticleBatch)
+    :param validators: ValidatorStore or None
+    :param done: event set when every job met its stop condition
+    :param abort: event set when the pipeline failed
+    """
+    try:
+        while not done.is_set() and not abort.is_set():
+            planned = planner.next_batch()
+            if planned is None:
+                return
+            job, set_number, link_set = planned
+            try:
+                articles = scrape_articles(link_set, validators)
+            except BaseException:
+                planner.stop()
+                raise
+            planner.report(job, len(link_set), len(articles))
+            coin_logger.info(f'Scraped {job.category} article batch from their pages')
+            if not put_unless_set(fetched, (job, set_number, link_set, articles), done, abort):
+                return
+    finally:
+        put_unless_set(fetched, FETCH_FINISHED, done, abort)
+
+
+def parse_batch(job, articles, planner, output):
+    """
+    checks the job's stop condition on every article of a batch, cutting the batch at the first one that meets it,
+    and prints the articles kept: one table per article, or the whole batch as json lines in one write
+    :param job: the job of the batch
+    :param articles: ArticleBatch returned by scrape_articles
+    :param planner: FetchPlanner, told to stop the job once the stop condition is met
+    :param output: TABLE_OUTPUT, NDJSON_OUTPUT or NO_OUTPUT
+    :return: the ArticleBatch of the articles kept
+    """
+    for index in range(len(articles)):
+        if stop_condition(articles, index, job.scrape_by, job.articles + 1):
+            job.done = True
+            planner.stop(job)
+            articles.truncate(index)
+            break
+        job.articles += 1
+        if output == TABLE_OUTPUT:
+            print(articles.table(index, job.articles), '\n')
+    if output == NDJSON_OUTPUT and len(articles):
+        sys.stdout.write(ndjson_lines(articles))
+        sys.stdout.flush()  # so the consumers of the stream get each batch as soon as it is parsed
+    return articles
+
+
+def parse_stage(fetched, parsed, fetchers, planner, writers, output, done, abort):
+    """
+    checks each job's batches in listing order, until every fetch worker finished
+    or every job met its stop condition.
+    Ends by sending one None per writer so the writers know there is nothing left.
+    :param fetched: bounded queue of (job, batch number, list of urls, ArticleBatch)
+    :param parsed: bounded queue of ArticleBatch
+    :param fetchers: number of fetch workers
+    :param planner: FetchPlanner of the jobs
+    :param writers: number of writer workers
+    :param output: TABLE_OUTPUT, NDJSON_OUTPUT or NO_OUTPUT
+    :param done: event set when every job met its stop condition
+    :param abort: event set when the pipeline failed
+    """
+    pending = {job: {} for job in planner.jobs}
+    next_set = dict.fromkeys(planner.jobs, 0)
+    finished = 0
+    try:
+        while True:
+            for job in planner.jobs:
+                while not job.done and next_set[job] in pending[job]:
+                    with run_metrics.stage(STAGE_PARSE):
+                        articles = parse_batch(job, pending[job].pop(next_set[job]), planner, output)
+                    next_set[job] += 1
+                    if not put_unless_set(parsed, articles, abort):
+                        return
+            if all(job.done for job in planner.jobs):
+                done.set()
+                return
+            if finished == fetchers:
+                return
+            item = get_unless_set(fetched, abort)
+            if item is None:
+                return
+            if item is FETCH_FINISHED:
+                finished += 1
+            else:
+                job, set_number, _, articles = item
+                if not job.done:
+                    pending[job][set_number] = articles
+    finally:
+        for _ in range(writers):
+            put_unless_set(parsed, None, abort)
+
+
+def write_stage(parsed, sink, validators, stored_links, checkpoint, abort):
+    """
+    saves the article batches to a storage sink until the parse stage signals there is nothing left
+    :param parsed: bounded queue of ArticleBatch
+    :param sink: StorageSink kept open for the whole run
+    :param validators: ValidatorStore or None, told which articles were committed
+    :param stored_links: StoredLinks or None, told which articles were committed
+    :param checkpoint: Checkpoint or None, told which articles were committed
+    :param abort: event set when the pipeline failed
+    """
+    while True:
+        articles = get_unless_set(parsed, abort)
+        if articles is None:
+            return
+        with run_metrics.stage(STAGE_WRITE):
+            sink.write_batch(articles)
+        if validators is not None:
+            validators.commit(articles.links)
+        if stored_links is not None:
+            stored_links.add(articles.links)
+        if checkpoint is not None:
+            checkpoint.commit(articles.links)
+
+
+def open_sinks(pipeline, writers, host, user, password, database, caches):
+    """
+    opens the storage the writers save the batches to.
+    Every MySQL writer gets its own connection; a SQLite database or run file is shared by the writers.
+    :param pipeline: dictionary with the storage and storage path of the run
+    :param writers: number of writer workers
+    :param host: url of database server
     :param user: username of mysql
     :param password: password of mysql
-    :param host: url of database server
     :param database: database to save to
-    :return:
+    :param caches: dictionary of table name -> IdCache, preloaded here for the database storages
+    :return: list of one StorageSink per writer
     """
-    links = scrape_main(html)
-    links = list(split_list(links, batch))
-
-    for set_number, link_set in enumerate(links):
-        articles = []
-        titles, summaries, authors, tags, times_published, categories = scrape_articles(link_set)
-        coin_logger.info('Scraped article batch from their pages')
-        for art_number in range(len(authors)):
-            new_article = Article(
-                title=titles[art_number],
-                summary=summaries[art_number],
-                author=authors[art_number],
-                link=links[set_number][art_number],
-                tags=tags[art_number],
-                date_published=times_published[art_number],
-                categories=categories[art_number]
-            )
-            if stop_condition(new_article, scrape_by):
-                insert_batch(articles, batch, host, user, password, database)
-                coin_logger.info('Finished scraping and saved data to database.')
-                return
-            print(new_article, '\n')
-            articles.append(new_article)
-        insert_batch(articles, batch, host, user, password, database)
-    coin_logger.info('Finished scraping and saved data to database.')
+    storage = pipeline[PIPELINE_STORAGE]
+    path = pipeline[PIPELINE_STORAGE_PATH]
+    if storage == MYSQL_STORAGE:
+        with run_metrics.stage(STAGE_CACHE_PRELOAD):
+            preload_caches(caches, host, user, password, database)
+        return [DatabaseSink(connect_database(host, user, password, database), insert_batch, caches)
+                for _ in range(writers)]
+    if storage == SQLITE_STORAGE:
+        sink = DatabaseSink(SQLiteConnection(path), insert_batch, caches)
+        with run_metrics.stage(STAGE_CACHE_PRELOAD):
+            for cache in caches.values():
+                cache.preload(sink.connection)
+    elif storage == JSONL_STORAGE:
+        sink = JsonLinesSink(run_file(path, JSONL_EXTENSION))
+    else:
+        sink = ParquetSink(run_file(path, PARQUET_EXTENSION))
+    coin_logger.info(f'Saving the articles to {storage} storage at {path}.')
+    return [sink] * writers
+
+
+class WarmResources:
+    """
+        What a scraper run sets up that the daemon keeps open from one run to the next.
 
+        Attributes
+        ----------
+        caches : dict
+            Table name -> IdCache of the author, tag and category ids.
+        sinks: list of StorageSink
+            One sink per writer.
+        browsers: dict
+            Category -> browser driver of its selenium listing, started on first use.
 
-def split_list(lst, n):
+        Methods
+        -------
+        close():
+            Closes the sinks and quits the browsers.
+        """
+
+    def __init__(self, pipeline, host, user, password, database):
+        """
+        Opens the storage of the pipeline, preloading the id caches.
+        """
+        self.caches = dimension_caches()
+        self.sinks = open_sinks(pipeline, pipeline[PIPELINE_WRITER_WORKERS], host, user, password, database,
+                                self.caches)
+        self.browsers = {}
+
+    def close(self):
+        """closes the sinks and quits the browsers"""
+        for sink in dict.fromkeys(self.sinks):
+            sink.close()
+        for browser in self.browsers.values():
+            browser.quit()
+        self.browsers.clear()
+
+
+def scraper(jobs, batch, user, password, host, database, pipeline, validators=None, stored_links=None, warm=None,
+            shutdown=None, checkpoint=None):
     """
-    Yields a generator with lists of n sizes chunks and a remainder if necessary
-    :param lst: list
-    :param n: int
+    scrapes the article urls of every job (category) and save the data into the database in batches.
+    Fetching, parsing and saving run as separate stages connected by bounded queues,
+    so the next batch is downloaded while the previous one is being saved.
+    The jobs share the fetch workers and the writers, which save to the storage chosen in the pipeline.
+    The selenium listings of the jobs that have one run alongside, adding links as they scroll.
+    :param jobs: list of ScrapeJob
+    :param batch: int size of batch
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to save to
+    :param pipeline: dictionary with the worker counts, queue depth and storage of the pipeline
+    :param validators: ValidatorStore used to revalidate known articles with conditional requests, or None
+    :param stored_links: StoredLinks dropping the links the selenium listings find that are already stored, or None
+    :param warm: WarmResources the run uses and leaves open, or None to open (and close) its own storage
+    :param shutdown: event that stops the run gracefully (the batches in flight are still saved), or None
+    :param checkpoint: Checkpoint recording the links listed and the batches committed, or None
     :return:
     """
-    """Yields a generator with lists of n sizes chunks and a remainder if necessary"""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
-
-
-def stop_condition(article, scrape_by):
+    planner = FetchPlanner(jobs, batch, shutdown)
+    writers = pipeline[PIPELINE_WRITER_WORKERS]
+    if warm is None:
+        caches = dimension_caches()
+        sinks = open_sinks(pipeline, writers, host, user, password, database, caches)
+        browsers = None
+    else:
+        caches, sinks, browsers = warm.caches, warm.sinks, warm.browsers
+
+    fetched = queue.Queue(maxsize=pipeline[PIPELINE_QUEUE_DEPTH])
+    parsed = queue.Queue(maxsize=pipeline[PIPELINE_QUEUE_DEPTH])
+    done = threading.Event()
+    abort = threading.Event()
+    errors = []
+
+    fetchers = pipeline[PIPELINE_FETCH_WORKERS]
+    stages = [(listing_stage, job, planner, stored_links, checkpoint, pipeline[PIPELINE_SHOW_BROWSER], browsers,
+               abort)
+              for job in jobs if job.listing_url is not None]
+    stages += [(fetch_stage, planner, fetched, validators, done, abort) for _ in range(fetchers)]
+    stages.append((parse_stage, fetched, parsed, fetchers, planner, writers, pipeline[PIPELINE_OUTPUT], done, abort))
+    stages += [(write_stage, parsed, sink, validators, stored_links, checkpoint, abort) for sink in sinks]
+    threads = [threading.Thread(target=run_stage, args=(stage[0], errors, abort) + stage[1:], daemon=True)
+               for stage in stages]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if warm is None:
+            for sink in dict.fromkeys(sinks):
+                sink.close()
+    if errors:
+        raise errors[0]
+    for job in jobs:
+        coin_logger.info(f'{job.category}: requested {job.position} of {len(job.links)} article pages, '
+                         f'kept {job.articles} articles.')
+    for governor in governors.values():
+        coin_logger.info(f'Fetch governor final state: {governor.snapshot()}')
+    for cache in caches.values():
+        coin_logger.info(str(cache))
+    coin_logger.info(f'Finished scraping and saved data to {pipeline[PIPELINE_STORAGE]} storage.')
+
+
+def stop_condition(articles, index, scrape_by, article_count):
     """
     stop condition for the loop of the scraping (because the html code has more articles than needed)
-    :param article: current article
+    :param articles: ArticleBatch of the current article
+    :param index: index of the current article in the batch
     :param scrape_by: dictionary defining how to scrape by
+    :param article_count: number of the article within its category's run
     :return: boolean
     """
     if scrape_by[SCRAPE_BY_TYPE] == DATE_SCRAPE_TYPE:
-        return article.get_date_published() <= scrape_by[SCRAPE_BY_PARAMETERS]
+        return articles.published[index] <= scrape_by[SCRAPE_BY_PARAMETERS]
     if scrape_by[SCRAPE_BY_TYPE] == NUM_SCRAPE_TYPE:
-        return article.get_article_num() >= scrape_by[SCRAPE_BY_PARAMETERS]
+        return article_count > scrape_by[SCRAPE_BY_PARAMETERS]
     return False
 
 
-def insert_batch(articles, batch_size, host, user, password, database):
+def connect_database(host, user, password, database):
     """
-    insert into database a batch of articles
-    :param articles: list of articles
-    :param batch_size: int batch size (isn't really needed because the list is going to be batch size)
+    opens a connection to the database
     :param host: url of database server
     :param user: username of mysql
     :param password: password of mysql
     :param database: database to save to
-    :return:
+    :return: pymysql connection with dictionary cursors
     """
     try:
-        with pymysql.connect(host=host, user=user, password=password, database=database,
-                             cursorclass=pymysql.cursors.DictCursor) as connection_instance:
-            count = 0
-            for a in articles:
-                if insert_data(a, connection_instance):
-                    count += 1
-                if count == batch_size:
-                    connection_instance.commit()
-                    count = 0
-            connection_instance.commit()
-            coin_logger.info('Finished saving data batch to database')
+        return pymysql.connect(host=host, user=user, password=password, database=database,
+                               cursorclass=pymysql.cursors.DictCursor)
     except pymysql.err.Error as err:
-        print(err.args)
+        print(err.args, file=sys.stderr)
         coin_logger.error(err.args)
         exit(1)
 
 
+def select_rows(cursor, sql, values):
+    """
+    runs a lookup query with one placeholder per value
+    :param cursor: the cursor object (dictionary rows)
+    :param sql: query with {} where the placeholders go, selecting the looked up column AS value
+    :param values: the values looked up (or their content_hash, for the urls and summaries)
+    :return: dictionary of sql_key(value) -> row
+    """
+    values = list(dict.fromkeys(values))
+    if not values:
+        return {}
+    cursor.execute(sql.format(', '.join(['%s'] * len(values))), values)
+    return {sql_key(row[LOOKUP_VALUE]): row for row in cursor.fetchall()}
+
+
+def name_ids(cursor, find_sql, names):
+    """
+    looks up names in a dimension table and maps the rows found back to the names. The collation may match
+    a name to a row sql_key doesn't see as equal (accents, e.g. 'Sebastián' and 'Sebastian'); such names are
+    looked up one at a time.
+    :param cursor: the cursor object (dictionary rows)
+    :param find_sql: lookup query of the table
+    :param names: list of names
+    :return: dictionary of name -> id, for the names found
+    """
+    rows = select_rows(cursor, find_sql, names)
+    ids = {name: rows[sql_key(name)][ARTICLE_ID] for name in names if sql_key(name) in rows}
+    claimed = {sql_key(name) for name in ids}
+    if len(claimed) < len(rows):  # some rows matched names under other keys
+        for name in names:
+            if name not in ids:
+                cursor.execute(find_sql.format('%s'), [name])
+                row = cursor.fetchone()
+                if row is not None:
+                    ids[name] = row[ARTICLE_ID]
+    return ids
+
+
+def bulk_dimension_ids(names, find_sql, insert_sql, cursor, cache, fresh_ids, table, tally):
+    """
+    finds the ids of the names in a dimension table (Authors, Tags or Categories),
+    inserting the missing names with one multi-row statement
+    :param names: list of names
+    :param find_sql: lookup query of the table
+    :param insert_sql: multi-row insert of the table
+    :param cursor: the cursor object
+    :param cache: IdCache of the table or None
+    :param fresh_ids: list collecting (cache, name, id) to cache once the batch is committed
+    :param table: name of the table
+    :param tally: Counter of the rows inserted per table
+    :return: dictionary of name -> id
+    :raise pymysql.err.IntegrityError: if a name has no row even after it was inserted (the batch is then saved
+    article by article)
+    """
+    ids = {}
+    missing = []
+    for name in dict.fromkeys(names):
+        cached = cache.get(name) if cache is not None else None
+        if cached is None:
+            missing.append(name)
+        else:
+            ids[name] = cached
+    found = name_ids(cursor, find_sql, missing)
+    new_names = [name for name in missing if name not in found]
+    if new_names:
+        cursor.executemany(insert_sql, [[name] for name in new_names])
+        tally[table] += max(cursor.rowcount, 0)
+        found.update(name_ids(cursor, find_sql, new_names))
+    lost = [name for name in missing if name not in found]
+    if lost:
+        raise pymysql.err.IntegrityError(f'No {table} row matches {lost} after inserting them.')
+    if cache is not None:
+        fresh_ids += [(cache, name, found[name]) for name in missing]
+    ids.update(found)
+    return ids
+
+
+def bulk_insert_articles(articles, cursor, caches, fresh_ids, tally):
+    """
+    saves a batch of articles with one multi-row statement per table, and adds them to the aggregate tables.
+    Articles already stored are skipped (or updated if they changed since), as are articles whose summary
+    already belongs to another article.
+    :param articles: ArticleBatch
+    :param cursor: the cursor object
+    :param caches: dictionary of table name -> IdCache, or None
+    :param fresh_ids: list collecting (cache, name, id) to cache once the batch is committed
+    :param tally: Counter of the rows inserted per table and of the skipped and updated articles
+    :return: number of articles saved
+    """
+    caches = caches or {}
+    latest = {link: index for index, link in enumerate(articles.links)}  # index of the last copy of each url
+    stored = select_rows(cursor, FIND_ARTICLES_BY_URL_HASHES, [content_hash(link) for link in latest])
+    article_ids = {}
+    new_articles = []
+    for link, index in latest.items():
+        row = stored.get(sql_key(link))
+        if row is None:
+            new_articles.append(index)
+        elif articles.revalidated[index]:
+            article_ids[link] = update_article_rows(articles.row(index), row, cursor)
+            tally[METRIC_ARTICLES_UPDATED] += 1
+        else:
+            tally[METRIC_DUPLICATES_SKIPPED] += 1
+            coin_logger.debug(f'Duplicate data, will skip this article: {link}.')
+
+    if new_articles:
+        summary_hashes = {index: content_hash(articles.summaries[index]) for index in new_articles}
+        cursor.executemany(BULK_INSERT_SUMMARIES, [[articles.summaries[index], summary_hashes[index]]
+                                                   for index in new_articles])
+        tally[SUMMARIES_TABLE] += max(cursor.rowcount, 0)
+        summaries = select_rows(cursor, FIND_SUMMARIES_BY_HASHES, summary_hashes.values())
+        summary_ids = [row[ARTICLE_ID] for row in summaries.values()]
+        claimed = set()
+        if summary_ids:
+            cursor.execute(FIND_USED_SUMMARIES.format(', '.join(['%s'] * len(summary_ids))), summary_ids)
+            claimed = {row[ARTICLE_SUMMARY_ID] for row in cursor.fetchall()}
+        insertable = []
+        for index in new_articles:
+            summary_id = summaries.get(sql_key(articles.summaries[index]), {}).get(ARTICLE_ID)
+            if summary_id is None or summary_id in claimed:
+                tally[METRIC_DUPLICATES_SKIPPED] += 1
+                coin_logger.debug(f'Duplicate data, will skip this article: {articles.links[index]}.')
+                continue
+            claimed.add(summary_id)
+            link = articles.links[index]
+            insertable.append([articles.titles[index], summary_id, articles.published[index], link,
+                               content_hash(link)])
+        if insertable:
+            cursor.executemany(BULK_INSERT_ARTICLES, insertable)
+            tally[ARTICLES_TABLE] += len(insertable)
+            inserted = select_rows(cursor, FIND_ARTICLES_BY_URL_HASHES, [row[4] for row in insertable])
+            article_ids.update({row[3]: inserted[sql_key(row[3])][ARTICLE_ID] for row in insertable})
+
+    saved = [index for link, index in latest.items() if link in article_ids]
+    published = {article_ids[articles.links[index]]: articles.published[index] for index in saved}
+    dimensions = [
+        (articles.authors, FIND_AUTHORS_BY_NAMES, BULK_INSERT_AUTHORS, BULK_INSERT_ARTICLE_AUTHORS, AUTHORS_TABLE,
+         AUTHORS_ARTICLES_TABLE),
+        (articles.tags, FIND_TAGS_BY_NAMES, BULK_INSERT_TAGS, BULK_INSERT_ARTICLE_TAGS, TAGS_TABLE,
+         TAGS_ARTICLES_TABLE),
+        (articles.categories, FIND_CATEGORIES_BY_NAMES, BULK_INSERT_CATEGORIES, BULK_INSERT_ARTICLE_CATEGORIES,
+         CATEGORIES_TABLE, CATEGORIES_ARTICLES_TABLE),
+    ]
+    for names, find_sql, insert_sql, relationship_sql, table, relationship_table in dimensions:
+        ids = bulk_dimension_ids([name for index in saved for name in names[index]], find_sql, insert_sql,
+                                 cursor, caches.get(table), fresh_ids, table, tally)
+        pairs = {(article_ids[articles.links[index]], ids[name]) for index in saved for name in names[index]}
+        if pairs:
+            cursor.executemany(relationship_sql, sorted(pairs))
+            tally[relationship_table] += max(cursor.rowcount, 0)
+            update_aggregates(cursor, relationship_table, pairs, published)
+    return len(saved)
+
+
+def insert_batch(articles, connection, caches=None):
+    """
+    insert into database a batch of articles in one transaction, with multi-row statements.
+    If the bulk statements hit an integrity error the batch is rolled back and saved article by article.
+    The rows inserted per table are added to the run metrics once the batch is committed.
+    :param articles: ArticleBatch
+    :param connection: connection object, kept open by the caller for the whole run
+    :param caches: dictionary of table name -> IdCache of the author, tag and category ids, or None
+    :return: number of articles saved
+    :raise pymysql.err.Error: if the batch could not be saved (it is rolled back, so the connection can be used
+    for the next batch)
+    """
+    try:
+        connection.ping(reconnect=True)
+        fresh_ids = []
+        tally = Counter()
+        try:
+            with connection.cursor() as cursor:
+                saved = bulk_insert_articles(articles, cursor, caches, fresh_ids, tally)
+            connection.commit()
+        except pymysql.err.IntegrityError as err:
+            connection.rollback()
+            coin_logger.warning(f'Bulk insert failed ({err.args}), saving the batch article by article.')
+            fresh_ids = []
+            tally = Counter()
+            saved = sum(insert_data(article, connection, caches, tally, fresh_ids) for article in articles.rows())
+            connection.commit()
+        for cache, name, row_id in fresh_ids:
+            cache.put(name, row_id)
+        run_metrics.add_tally(tally)
+        log_batch_summary(len(articles), saved, tally)
+        return saved
+    except pymysql.err.Error as err:
+        coin_logger.error(f'Could not save the batch, rolling it back: {err.args}')
+        try:
+            connection.rollback()
+        except pymysql.err.Error:  # the connection is gone, and the server rolled the transaction back with it
+            pass
+        raise
+
+
+def log_batch_summary(size, saved, tally):
+    """
+    logs one line for a committed batch, in place of a line per row: the articles saved, updated and skipped as
+    duplicates and the rows inserted per table (a warning if duplicates were skipped)
+    :param size: number of articles of the batch
+    :param saved: number of articles saved
+    :param tally: Counter of the rows inserted per table and of the skipped and updated articles of the batch
+    """
+    rows = ', '.join(f'{table} {count}' for table, count in sorted(tally.items())
+                     if table not in METRIC_EVENTS and count)
+    duplicates = tally[METRIC_DUPLICATES_SKIPPED]
+    coin_logger.log(logging.WARNING if duplicates else logging.INFO,
+                    f'Saved a batch of {size} articles to database: {saved} saved '
+                    f'({tally[METRIC_ARTICLES_UPDATED]} updated), {duplicates} duplicates skipped; '
+                    f'rows inserted: {rows or "none"}.', extra=UNLIMITED)
+
+
 def insert_data_to_entity_table(sql, data, cursor, log_msg):
     """
     inserts one entity to its respective table
     :param sql: the sql insert command
     :param data: the data we're inserting
     :param cursor: the cursor object
-    :param log_msg: the log message we want to save to the log file
+    :param log_msg: the debug message of the row (the batch is summed up by log_batch_summary)
     :return: returns the id of the row
     """
     cursor.execute(sql, data)
-    coin_logger.info(log_msg)
+    coin_logger.debug(log_msg)
     return cursor.lastrowid
 
 
 def insert_many_to_many_entities(create_single_sql, find_sql, create_relationship_sql, entity_pk_name, partner_pk, data,
-                                 cursor, log_msg, log_single_entity, debug_msg):
+                                 cursor, log_msg, log_single_entity, debug_msg, cache=None, tally=None, tables=None,
+                                 fresh_ids=None):
     """
     saves the entities of a many to many relationship to their respective tables and their relationship table
     :param create_single_sql: the sql insert single entity command
@@ -464,75 +1398,422 @@ def insert_many_to_many_entities(create_single_sql, find_sql, create_relationshi
     :param partner_pk: the partner private key (that we're making the relationship with)
     :param data: the data
     :param cursor: the cursor object
-    :param log_msg: the log message when a relationship is created
-    :param log_single_entity: the log message when a entity is created
+    :param log_msg: the debug message when a relationship is created
+    :param log_single_entity: the debug message when a entity is created
     :param debug_msg: the debug message when the entity already exists
-    :return:
+    :param cache: IdCache of the entity table, consulted before the find query
+    :param tally: Counter of the rows inserted per table, or None
+    :param tables: names of the entity table and of the relationship table (counted in tally)
+    :param fresh_ids: list collecting (cache, name, id) to cache once the batch is committed, or None
+    :return: the ids of the entities
     """
+    ids = []
     for data_point in data:
-        cursor.execute(find_sql, [data_point])
-        result = cursor.fetchone()
-        if result is None:
-            cursor.execute(create_single_sql, [data_point])
-            coin_logger.info(log_single_entity)
-            data_point_id = cursor.lastrowid
-        else:
-            data_point_id = result[entity_pk_name]
+        data_point_id = cache.get(data_point) if cache is not None else None
+        if data_point_id is not None:
             coin_logger.debug(debug_msg)
+        else:
+            cursor.execute(find_sql, [data_point])
+            result = cursor.fetchone()
+            if result is None:
+                cursor.execute(create_single_sql, [data_point])
+                coin_logger.debug(log_single_entity)
+                data_point_id = cursor.lastrowid
+                if tally is not None:
+                    tally[tables[0]] += 1
+            else:
+                data_point_id = result[entity_pk_name]
+                coin_logger.debug(debug_msg)
+            if cache is not None and fresh_ids is not None:
+                fresh_ids.append((cache, data_point, data_point_id))
         cursor.execute(create_relationship_sql, [partner_pk, data_point_id])
-        coin_logger.info(log_msg)
+        if tally is not None:
+            tally[tables[1]] += 1
+        ids.append(data_point_id)
+        coin_logger.debug(log_msg)
+    return ids
 
 
-def insert_data(article, conn):
+def update_article_rows(article, existing, cursor):
+    """
+    updates the rows of an article that changed since it was saved and removes its relationships
+    (and its counts in the aggregate tables), so they can be saved again from the new data
+    :param article: ArticleRow of the changed article
+    :param existing: the saved article row (id, summary_id and publication_date)
+    :param cursor: the cursor object
+    :return: the id of the article row
     """
-    save article to database
-    :param article: article to save
+    article_id = existing[ARTICLE_ID]
+    remove_from_aggregates(cursor, article_id, existing[ARTICLE_PUBLICATION_DATE])
+    cursor.execute(UPDATE_SUMMARY, [article.get_summary(), content_hash(article.get_summary()),
+                                    existing[ARTICLE_SUMMARY_ID]])
+    cursor.execute(UPDATE_ARTICLE, [article.get_title(), article.get_date_published(), article_id])
+    for delete_sql in (DELETE_ARTICLE_AUTHORS, DELETE_ARTICLE_TAGS, DELETE_ARTICLE_CATEGORIES):
+        cursor.execute(delete_sql, [article_id])
+    coin_logger.debug(f'Updated changed article in database: {article.get_link()}.')
+    return article_id
+
+
+def insert_data(article, conn, caches=None, tally=None, fresh_ids=None):
+    """
+    save article to database (or update its rows if it was saved before and changed since),
+    and add it to the aggregate tables
+    :param article: ArticleRow of the article to save
     :param conn: connection object
+    :param caches: dictionary of table name -> IdCache of the author, tag and category ids, or None
+    :param tally: Counter of the rows inserted per table and of the skipped and updated articles, or None
+    :param fresh_ids: list collecting (cache, name, id) to cache once the batch is committed, or None
     :return: boolean if inserted new data
     """
+    caches = caches or {}
+    article_tally = Counter()
     try:
         with conn.cursor() as cursor:
-            summary_id = insert_data_to_entity_table(INSERT_INTO_SUMMARIES,
-                                                     article.get_summary(), cursor, 'Saved summary to database.')
-            article_id = insert_data_to_entity_table(INSERT_INTO_ARTICLES,
-                                                     [article.get_title(), summary_id, article.get_date_published(),
-                                                      article.get_link()],
-                                                     cursor, 'Saved article to database.')
-
-            insert_many_to_many_entities(INSERT_INTO_AUTHORS, FIND_AUTHOR, INSERT_INTO_RELATIONSHIP_ARTICLE_AUTHOR,
-                                         AUTHOR_ID, article_id, article.get_authors(), cursor,
-                                         'Saved author-article relationship to database.',
-                                         'Saved author to database.',
-                                         'Author exists already in database.')
-
-            insert_many_to_many_entities(INSERT_INTO_TAGS, FIND_TAG, INSERT_INTO_RELATIONSHIP_ARTICLE_TAG,
-                                         TAG_ID, article_id, article.get_tags(), cursor,
-                                         'Saved tag-article relationship to database.',
-                                         'Saved tag to database.',
-                                         'Tag exists already in database.')
-
-            insert_many_to_many_entities(INSERT_INTO_CATEGORY, FIND_CATEGORY, INSERT_INTO_RELATIONSHIP_ARTICLE_CATEGORY,
-                                         CATEGORY_ID, article_id, article.get_categories(), cursor,
-                                         'Saved category-article relationship to database.',
-                                         'Saved category to database.',
-                                         'Category exists already in database.')
+            existing = None
+            if article.is_revalidated():
+                cursor.execute(FIND_ARTICLE_BY_URL_HASH, [content_hash(article.get_link())])
+                existing = cursor.fetchone()
+            if existing is not None:
+                article_id = update_article_rows(article, existing, cursor)
+                article_tally[METRIC_ARTICLES_UPDATED] += 1
+            else:
+                summary_id = insert_data_to_entity_table(INSERT_INTO_SUMMARIES,
+                                                         [article.get_summary(), content_hash(article.get_summary())],
+                                                         cursor, 'Saved summary to database.')
+                article_id = insert_data_to_entity_table(INSERT_INTO_ARTICLES,
+                                                         [article.get_title(), summary_id,
+                                                          article.get_date_published(), article.get_link(),
+                                                          content_hash(article.get_link())],
+                                                         cursor, 'Saved article to database.')
+                article_tally.update([SUMMARIES_TABLE, ARTICLES_TABLE])
+
+            author_ids = insert_many_to_many_entities(INSERT_INTO_AUTHORS, FIND_AUTHOR,
+                                                      INSERT_INTO_RELATIONSHIP_ARTICLE_AUTHOR,
+                                                      AUTHOR_ID, article_id, article.get_authors(), cursor,
+                                                      'Saved author-article relationship to database.',
+                                                      'Saved author to database.',
+                                                      'Author exists already in database.', caches.get(AUTHORS_TABLE),
+                                                      article_tally, (AUTHORS_TABLE, AUTHORS_ARTICLES_TABLE),
+                                                      fresh_ids)
+
+            tag_ids = insert_many_to_many_entities(INSERT_INTO_TAGS, FIND_TAG, INSERT_INTO_RELATIONSHIP_ARTICLE_TAG,
+                                                   TAG_ID, article_id, article.get_tags(), cursor,
+                                                   'Saved tag-article relationship to database.',
+                                                   'Saved tag to database.',
+                                                   'Tag exists already in database.', caches.get(TAGS_TABLE),
+                                                   article_tally, (TAGS_TABLE, TAGS_ARTICLES_TABLE),
+                                                   fresh_ids)
+
+            category_ids = insert_many_to_many_entities(INSERT_INTO_CATEGORY, FIND_CATEGORY,
+                                                        INSERT_INTO_RELATIONSHIP_ARTICLE_CATEGORY,
+                                                        CATEGORY_ID, article_id, article.get_categories(), cursor,
+                                                        'Saved category-article relationship to database.',
+                                                        'Saved category to database.',
+                                                        'Category exists already in database.',
+                                                        caches.get(CATEGORIES_TABLE), article_tally,
+                                                        (CATEGORIES_TABLE, CATEGORIES_ARTICLES_TABLE),
+                                                        fresh_ids)
+            for links, ids in ((AUTHORS_ARTICLES_TABLE, author_ids), (TAGS_ARTICLES_TABLE, tag_ids),
+                               (CATEGORIES_ARTICLES_TABLE, category_ids)):
+                update_aggregates(cursor, links, [(article_id, partner_id) for partner_id in set(ids)],
+                                  {article_id: article.get_date_published()})
+        if tally is not None:
+            tally.update(article_tally)
         return True
     except pymysql.err.IntegrityError:
-        coin_logger.warning(f'Duplicate data, will skip this article: {article.get_link()}.')
+        if tally is not None:
+            tally[METRIC_DUPLICATES_SKIPPED] += 1
+        coin_logger.debug(f'Duplicate data, will skip this article: {article.get_link()}.')
         return False
 
 
+def open_stored_links(pipeline, host, user, password, database):
+    """
+    loads the urls of the articles the database storage already holds, to drop their links before anything is
+    downloaded (file storages keep one file per run, so nothing is skipped for them)
+    :param pipeline: dictionary with the storage and storage path of the run
+    :param host: url of database server
+    :param user: username of mysql
+    :param password: password of mysql
+    :param database: database to read from
+    :return: StoredLinks, or None for the file storages
+    """
+    storage = pipeline[PIPELINE_STORAGE]
+    try:
+        if storage == MYSQL_STORAGE:
+            return StoredLinks(pymysql.connect(host=host, user=user, password=password, database=database))
+        if storage == SQLITE_STORAGE:
+            return StoredLinks(SQLiteConnection(pipeline[PIPELINE_STORAGE_PATH]))
+    except pymysql.err.Error as err:
+        print(err.args, file=sys.stderr)
+        coin_logger.error(err.args)
+        exit(1)
+    return None
+
+
+def open_validators(pipeline, host, user, password, database):
+    """
+    opens the validators of the articles saved to the mysql database, for --revalidate
+    :param pipeline: dictionary with the storage and revalidate option of the run
+    :param host: url of database server
+    :param user: username of mysql
+    :param password: password of mysql
+    :param database: database the validators describe
+    :return: ValidatorStore, or None without --revalidate or with another storage
+    """
+    if not pipeline[PIPELINE_REVALIDATE] or pipeline[PIPELINE_STORAGE] != MYSQL_STORAGE:
+        return None
+    try:
+        return ValidatorStore(host, database, pymysql.connect(host=host, user=user, password=password,
+                                                              database=database))
+    except pymysql.err.Error as err:
+        print(err.args, file=sys.stderr)
+        coin_logger.error(err.args)
+        exit(1)
+
+
+def skip_stored_links(jobs, stored_links):
+    """
+    drops the links of the articles already stored from the jobs
+    :param jobs: list of ScrapeJob
+    :param stored_links: StoredLinks
+    """
+    links = [link for job in jobs for link in job.links]
+    new_links = set(stored_links.filter_new(links))
+    for job in jobs:
+        job.links = [link for link in job.links if link in new_links]
+    run_metrics.count(METRIC_KNOWN_URLS_SKIPPED, len(links) - len(new_links))
+    coin_logger.info(f'Skipping {len(links) - len(new_links)} already stored articles, {len(new_links)} left.')
+
+
+def checkpoint_run(categories, scrape_by, pipeline):
+    """
+    :param categories: list of category URL suffixes
+    :param scrape_by: dictionary that details how to scrape
+    :param pipeline: dictionary with the storage and storage path of the run
+    :return: dictionary identifying the run in its checkpoint, so --resume only continues the same run
+    """
+    return {CHECKPOINT_CATEGORIES: categories, CHECKPOINT_SCRAPE_TYPE: scrape_by[SCRAPE_BY_TYPE],
+            CHECKPOINT_SCRAPE_PARAMETER: str(scrape_by[SCRAPE_BY_PARAMETERS]),
+            CHECKPOINT_STORAGE: f'{pipeline[PIPELINE_STORAGE]}:{pipeline[PIPELINE_STORAGE_PATH]}'}
+
+
+def resumed_jobs(checkpoint, scrape_by):
+    """
+    builds the jobs of a run from its checkpoint: the links listed and not committed yet, with the dates
+    the listing gave them (so a -date run still cuts them), and the selenium listings that were still scrolling.
+    The articles committed count towards -num.
+    :param checkpoint: Checkpoint loaded from the stopped run
+    :param scrape_by: dictionary that details how to scrape
+    :return: list of ScrapeJob
+    """
+    jobs = []
+    for category in checkpoint.run[CHECKPOINT_CATEGORIES]:
+        state = checkpoint.jobs[category]
+        links = [link for link in state[CHECKPOINT_LINKS] if link not in checkpoint.committed]
+        listing_dates = {link: datetime.strptime(published, PUBLISHED_DATE_FORMAT)
+                         for link, published in state[CHECKPOINT_LISTING_DATES].items()}
+        job = ScrapeJob(category, links, scrape_by, listing_dates, state[CHECKPOINT_LISTING_URL])
+        job.scraped = job.articles = len(state[CHECKPOINT_LINKS]) - len(links)
+        jobs.append(job)
+    coin_logger.info(f'Resuming from {checkpoint.path}: {checkpoint.batches} batches ({len(checkpoint.committed)} '
+                     f'articles) committed, {sum(len(job.links) for job in jobs)} listed links left.')
+    return jobs
+
+
+def lock_daemon(path):
+    """
+    takes an exclusive lock on a file for as long as the process runs, so two daemons never overlap
+    :param path: lock file
+    :return: the open lock file, or None if another daemon holds the lock
+    """
+    lock_file = open(path, 'a')  # not 'w': that would truncate the pid of a running daemon before the lock is tried
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+class ScrapeDaemon:
+    """
+        Scrapes every category again every interval, only fetching the articles that are new since.
+        The browsers, the http connections, the storage connections, the id caches, the stored urls and the
+        validators stay open from one scrape to the next.
+
+        Each category has its own schedule, every interval plus or minus the jitter. A category whose previous
+        scrape is still running skips its turn. SIGINT and SIGTERM stop the daemon gracefully: no new scrapes
+        start, the running ones stop handing out batches and save the ones in flight, then everything is closed.
+
+        Attributes
+        ----------
+        categories : list of str
+            Category URL suffixes.
+        interval: float
+            Seconds between two scrapes of a category.
+        jitter: float
+            Fraction of the interval each delay is randomly moved by.
+        shutdown: threading.Event
+            Set to stop the daemon.
+
+        Methods
+        -------
+        run():
+            Schedules the scrapes until the daemon is stopped.
+
+        scrape(category):
+            Scrapes the new articles of a category once.
+        """
+
+    def __init__(self, categories, scrape_by, user, password, host, database, pipeline):
+        """
+        Constructs the daemon of the categories (nothing is opened until it runs).
+        """
+        self.categories = categories
+        self.scrape_by = scrape_by
+        self.connection_args = (user, password, host, database)
+        self.pipeline = pipeline
+        self.interval = pipeline[PIPELINE_INTERVAL]
+        self.jitter = pipeline[PIPELINE_JITTER]
+        self.shutdown = threading.Event()
+        self.running = {}
+        self.metrics_lock = threading.Lock()
+        self.warm = None
+        self.stored_links = None
+        self.validators = None
+
+    def next_delay(self):
+        """:return: seconds until the next scrape of a category"""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def scrape(self, category):
+        """
+        scrapes the new articles of a category once, then saves the run metrics
+        :param category: category URL suffix
+        """
+        user, password, host, database = self.connection_args
+        try:
+            jobs = get_jobs([category], self.scrape_by, self.pipeline[PIPELINE_LISTING])
+            if self.stored_links is not None:
+                skip_stored_links(jobs, self.stored_links)
+            scraper(jobs, BATCH, user, password, host, database, self.pipeline, self.validators, self.stored_links,
+                    self.warm, self.shutdown)
+        except (Exception, SystemExit) as err:  # a failed scrape is retried at the next interval
+            coin_logger.error(f'{category}: scrape failed ({err!r}), trying again at the next interval.')
+        finally:
+            with self.metrics_lock:
+                run_metrics.save(self.pipeline[PIPELINE_METRICS_REPORT], self.pipeline[PIPELINE_METRICS_PROMETHEUS])
+
+    def start_due(self, due):
+        """
+        starts the scrapes that are due, skipping the categories whose previous scrape is still running
+        :param due: dictionary of category -> time.monotonic() of its next scrape, moved on here
+        """
+        now = time.monotonic()
+        for category, start_at in due.items():
+            if start_at > now:
+                continue
+            due[category] = now + self.next_delay()
+            previous = self.running.get(category)
+            if previous is not None and previous.is_alive():
+                coin_logger.warning(f'{category}: the previous scrape is still running, skipping this one.')
+                continue
+            self.running[category] = threading.Thread(target=self.scrape, args=(category,), daemon=True)
+            self.running[category].start()
+
+    def run(self):
+        """
+        opens what the scrapes share and schedules them until SIGINT or SIGTERM
+        """
+        lock_file = lock_daemon(DAEMON_LOCK_FILE)
+        if lock_file is None:
+            print(f'Another daemon is running (lock file {DAEMON_LOCK_FILE}).', file=sys.stderr)
+            coin_logger.error(f'Another daemon is running (lock file {DAEMON_LOCK_FILE}).')
+            exit(1)
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *_: self.shutdown.set())
+        user, password, host, database = self.connection_args
+        try:
+            self.warm = WarmResources(self.pipeline, host, user, password, database)
+            if not self.pipeline[PIPELINE_REVALIDATE]:
+                self.stored_links = open_stored_links(self.pipeline, host, user, password, database)
+            self.validators = open_validators(self.pipeline, host, user, password, database)
+            # the first scrapes are spread over the jitter, so the categories don't all start together
+            due = {category: time.monotonic() + random.uniform(0, self.interval * self.jitter)
+                   for category in self.categories}
+            coin_logger.info(f'Daemon started: scraping {len(self.categories)} categories every '
+                             f'{self.interval} seconds.')
+            while not self.shutdown.is_set():
+                self.start_due(due)
+                self.shutdown.wait(max(0.0, min(due.values()) - time.monotonic()))
+        finally:
+            self.shutdown.set()
+            coin_logger.info('Daemon stopping: waiting for the running scrapes to save their batches.')
+            for thread in self.running.values():
+                thread.join()
+            if self.warm is not None:
+                self.warm.close()
+            if self.stored_links is not None:
+                self.stored_links.close()
+            if self.validators is not None:
+                self.validators.close()
+            lock_file.close()
+            coin_logger.info('Daemon stopped.')
+
+
 def main():
-    """Receives Coindesk topic category and number of articles to print as command parameters.
-    Uses selenium to retrieve the required html script.
+    """Receives Coindesk topic categories and number of articles to print as command parameters.
+    Reads the category listing over http (or with selenium) to get the article urls.
     Scrapes and prints each article for the following data:
         Title, Summary, Author, Link, Tags and Date-Time"""
     before = time.time()
-    category, scrap_by, username, password, host, database = welcome()
-    html = get_html(URL + category, scrap_by)
-    scraper(html, BATCH, scrap_by, username, password, host, database)
+    categories, scrap_by, username, password, host, database, pipeline = welcome()
+    shared_http_session()  # gevent patches the sockets here, on the main thread, before any worker starts
+    if pipeline[PIPELINE_DAEMON]:
+        ScrapeDaemon(categories, scrap_by, username, password, host, database, pipeline).run()
+        return
+    stored_links = None
+    validators = None
+    run = checkpoint_run(categories, scrap_by, pipeline)
+    checkpoint = Checkpoint()
+    try:
+        resuming = pipeline[PIPELINE_RESUME] and checkpoint.load(run)
+        if resuming:
+            jobs = resumed_jobs(checkpoint, scrap_by)
+        else:
+            if pipeline[PIPELINE_RESUME]:
+                coin_logger.warning(f'No checkpoint of this run in {checkpoint.path}, starting from scratch.')
+            jobs = get_jobs(categories, scrap_by, pipeline[PIPELINE_LISTING])
+        if not pipeline[PIPELINE_REVALIDATE]:
+            with run_metrics.stage(STAGE_SKIP_INDEX):
+                stored_links = open_stored_links(pipeline, host, username, password, database)
+                if stored_links is not None:
+                    skip_stored_links(jobs, stored_links)
+        if not resuming:
+            checkpoint.start(run, jobs)
+        validators = open_validators(pipeline, host, username, password, database)
+        scraper(jobs, BATCH, username, password, host, database, pipeline, validators, stored_links,
+                checkpoint=checkpoint)
+        checkpoint.clear()
+    except pymysql.err.Error as err:  # a batch could not be saved (it was rolled back and logged)
+        print(err.args, file=sys.stderr)
+        exit(1)
+    finally:
+        if stored_links is not None:
+            stored_links.close()
+        if validators is not None:
+            validators.close()
+        run_metrics.save(pipeline[PIPELINE_METRICS_REPORT], pipeline[PIPELINE_METRICS_PROMETHEUS])
+        log_queue_handler.stop()
     after = time.time()
-    print(f"\nScraping took {round(after - before, 3)} seconds.")
+    # stdout only carries the articles unless they are printed as tables
+    print(f"\nScraping took {round(after - before, 3)} seconds.",
+          file=sys.stdout if pipeline[PIPELINE_OUTPUT] == TABLE_OUTPUT else sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,64 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from config import *
+
+
+def period_start(published, period):
+    """
+    :param published: publication date of an article (datetime, or its text as sqlite returns it)
+    :param period: DAY_PERIOD or WEEK_PERIOD
+    :return: the first day of the period the article was published in (weeks start on Monday)
+    """
+    if isinstance(published, str):
+        published = datetime.fromisoformat(published)
+    day = published.date() if isinstance(published, datetime) else published
+    if period == WEEK_PERIOD:
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def aggregate_of(links):
+    """
+    :param links: relationship table name
+    :return: (aggregate table, partner id column, period) counting the relationship table
+    """
+    for table, relationship_table, column, period in AGGREGATES:
+        if relationship_table == links:
+            return table, column, period
+    raise KeyError(links)
+
+
+def update_aggregates(cursor, links, pairs, published, sign=1):
+    """
+    adds (or removes) articles to the aggregate counting a relationship table, with one statement per call
+    :param cursor: the cursor object
+    :param links: relationship table the pairs were inserted into (or deleted from)
+    :param pairs: iterable of (article id, partner id)
+    :param published: dictionary of article id -> publication date
+    :param sign: 1 to add the articles, -1 to remove them
+    """
+    table, column, period = aggregate_of(links)
+    counts = Counter((partner_id, period_start(published[article_id], period)) for article_id, partner_id in pairs)
+    if not counts:
+        return
+    if sign > 0:
+        cursor.executemany(INCREMENT_AGGREGATE.format(table=table, column=column),
+                           [[partner_id, start, count] for (partner_id, start), count in counts.items()])
+    else:
+        cursor.executemany(DECREMENT_AGGREGATE.format(table=table, column=column),
+                           [[count, partner_id, start] for (partner_id, start), count in counts.items()])
+
+
+def remove_from_aggregates(cursor, article_id, published):
+    """
+    removes a stored article from every aggregate, before its relationships are deleted
+    :param cursor: the cursor object
+    :param article_id: id of the article row
+    :param published: the stored publication date of the article
+    """
+    for _, links, column, _ in AGGREGATES:
+        cursor.execute(FIND_ARTICLE_PARTNERS.format(column=column, links=links), [article_id])
+        partners = [row[PARTNER_ID] for row in cursor.fetchall()]
+        update_aggregates(cursor, links, [(article_id, partner_id) for partner_id in partners],
+                          {article_id: published}, sign=-1)
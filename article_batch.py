@@ -0,0 +1,200 @@
+import textwrap as tw
+from datetime import datetime
+
+from config import *
+
+
+class ArticleBatch:
+    """
+        The articles of a batch, stored column by column: one list per field, filled straight from each page's
+        json payload as it is extracted, so a batch holds no page, soup or payload once it is built.
+        The parse stage, stop_condition, the printing and the storage sinks all work on the batch.
+
+        Attributes
+        ----------
+        links : list of str
+            Urls of the articles (the webpage of each article).
+        titles: list of str
+            Article titles.
+        summaries: list of str
+            Article summaries.
+        authors: list of lists of str
+            Article author(s).
+        tags: list of lists of str
+            Article hashtags.
+        published: list of datetime
+            Date and time each article was published.
+        categories: list of lists of str
+            Categories each article falls under.
+        revalidated: list of bool
+            True for the articles saved before and changed since (their rows are updated instead of inserted).
+
+        Methods
+        -------
+        append(link, data, revalidated):
+            Adds the article of an extracted page.
+
+        truncate(size):
+            Keeps the first size articles.
+
+        select(indexes):
+            Returns a new batch of the articles at the indexes.
+
+        row(index):
+            Returns an ArticleRow view of one article.
+
+        rows():
+            Yields an ArticleRow view of every article.
+
+        table(index, number):
+            Returns the table printed for one article.
+        """
+    __slots__ = ('links', 'titles', 'summaries', 'authors', 'tags', 'published', 'categories', 'revalidated')
+
+    def __init__(self):
+        """
+        Constructs an empty batch.
+        """
+        for column in self.__slots__:
+            setattr(self, column, [])
+
+    def __len__(self):
+        return len(self.links)
+
+    def append(self, link, data, revalidated=False):
+        """
+        adds the article of an extracted page, keeping only the fields the scraper saves
+        :param link: url of the article
+        :param data: dictionary of the article fields returned by extract_article_data
+        :param revalidated: boolean if the article was saved before and changed since
+        """
+        self.links.append(link)
+        self.titles.append(data[TITLE_TAG])
+        self.summaries.append(data[SUMMARY_TAG])
+        self.authors.append([author[AUTHOR_NAME_TAG] for author in data[AUTHORS_TAG]])
+        self.tags.append([tag[TAG_NAME_TAG] for tag in data[TAGS_TAG]])
+        self.published.append(datetime.strptime(data[PUBLISHED_DATE_TAG], PUBLISHED_DATE_FORMAT))
+        self.categories.append(data[TAXONOMY_TAG][CATEGORY_TAG])
+        self.revalidated.append(revalidated)
+
+    def truncate(self, size):
+        """
+        :param size: number of articles to keep, from the start of the batch
+        """
+        for column in self.__slots__:
+            del getattr(self, column)[size:]
+
+    def select(self, indexes):
+        """
+        :param indexes: iterable of article indexes
+        :return: new ArticleBatch of the articles at the indexes, in their order
+        """
+        indexes = list(indexes)
+        selected = ArticleBatch()
+        for column in self.__slots__:
+            values = getattr(self, column)
+            setattr(selected, column, [values[index] for index in indexes])
+        return selected
+
+    def row(self, index):
+        """
+        :param index: article index
+        :return: ArticleRow of the article
+        """
+        return ArticleRow(self, index)
+
+    def rows(self):
+        """:return: generator of the ArticleRow of every article"""
+        return (ArticleRow(self, index) for index in range(len(self)))
+
+    def table(self, index, number):
+        """
+        :param index: article index
+        :param number: number shown in the header of the table
+        :return: the table printed for the article
+        """
+        from tabulate import tabulate
+        return tabulate(tabular_data=[
+            ['Title', self.titles[index]],
+            ['Summary', '\n'.join(tw.wrap(self.summaries[index], width=90))],
+            ['Author', ', '.join(self.authors[index])],
+            ['Categories', ', '.join(self.categories[index])],
+            ['Link', self.links[index]],
+            ['Tags', ', '.join(self.tags[index])],
+            ['Date/Time Published', self.published[index]]
+        ],
+            headers=['#', number],
+            tablefmt='plain')
+
+
+class ArticleRow:
+    """
+        A view of one article of an ArticleBatch, for the code saving articles one at a time.
+        It holds no data of its own.
+
+        Methods
+        -------
+        get_title(self):
+            Returns article title
+
+        get_summary(self):
+            Returns article summary
+
+        get_link(self):
+            Returns URL to article page
+
+        get_tags(self):
+            Returns article tags
+
+        get_date_published(self):
+            Returns date and time article was published
+
+        get_categories(self):
+            Returns article category
+
+        get_authors(self):
+            Returns article author(s)
+
+        is_revalidated(self):
+            Returns if the article was saved before and changed since
+        """
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        """
+        Constructs the view of the article at index of the batch.
+        """
+        self.batch = batch
+        self.index = index
+
+    def get_title(self):
+        """:return: article title (str)"""
+        return self.batch.titles[self.index]
+
+    def get_summary(self):
+        """:return: article summary"""
+        return self.batch.summaries[self.index]
+
+    def get_link(self):
+        """:return: url (str) to article webpage"""
+        return self.batch.links[self.index]
+
+    def get_tags(self):
+        """:return: article tags (list)"""
+        return self.batch.tags[self.index]
+
+    def get_date_published(self):
+        """:return: date and time article was published."""
+        return self.batch.published[self.index]
+
+    def get_categories(self):
+        """:return: the categories the article belongs to"""
+        return self.batch.categories[self.index]
+
+    def get_authors(self):
+        """:return: the authors that wrote the article"""
+        return self.batch.authors[self.index]
+
+    def is_revalidated(self):
+        """:return: if the article was saved before and changed since (bool)"""
+        return self.batch.revalidated[self.index]
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the __NEXT_DATA__ extraction: the previous full BeautifulSoup parse
+against the byte-slicing fast path in extractor.py.
+
+Usage:
+    python benchmarks/extractor_benchmark.py [-n REPEAT] [saved_article.html ...]
+
+Without files a synthetic article page of roughly the size of a coindesk.com article is used.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import *
+from extractor import extract_article_data
+from bs4 import BeautifulSoup
+
+
+def synthetic_article_page():
+    """:return: bytes of an article page with a realistic amount of markup around the __NEXT_DATA__ script"""
+    data = {TITLE_TAG: 'Bitcoin Benchmark Article', SUMMARY_TAG: 'A summary ' * 20,
+            AUTHORS_TAG: [{AUTHOR_NAME_TAG: 'Satoshi Nakamoto'}], TAGS_TAG: [{TAG_NAME_TAG: 'Bitcoin'}] * 8,
+            PUBLISHED_DATE_TAG: '2021-07-11T10:00:00', TAXONOMY_TAG: {CATEGORY_TAG: ['Tech']},
+            'body': '<p>paragraph</p>' * 400}
+    payload = json.dumps({PROPERTIES_TAG: {INITIAL_PROPERTIES_TAG: {PAGE_PROPERTIES: {DATA_TAG: data}}}})
+    body = '<div class="row"><a href="/tech/">Tech</a><span class="time">Jul 11, 2021</span></div>' * 1500
+    return (f'<html><head><title>x</title></head><body>{body}'
+            f'<{SCRIPT_TAG} id="{SCRIPT_ID}" type="{SCRIPT_TYPE}">{payload}</{SCRIPT_TAG}></body></html>').encode()
+
+
+def soup_path(content):
+    """the extraction as scrape_articles did it before the fast path"""
+    props = json.loads(BeautifulSoup(content, 'html.parser').find(SCRIPT_TAG, id=SCRIPT_ID, type=SCRIPT_TYPE)
+                       .string)[PROPERTIES_TAG][INITIAL_PROPERTIES_TAG][PAGE_PROPERTIES]
+    return props.get(DATA_TAG)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages', nargs='*', help='saved article html files')
+    parser.add_argument('-n', '--repeat', type=int, default=20, help='extractions per page and path')
+    args = parser.parse_args()
+    pages = [open(path, 'rb').read() for path in args.pages] or [synthetic_article_page()]
+
+    for content in pages:
+        assert extract_article_data(content)[TITLE_TAG] == soup_path(content)[TITLE_TAG]
+    soup_time = sum(timeit.timeit(lambda: soup_path(page), number=args.repeat) for page in pages)
+    fast_time = sum(timeit.timeit(lambda: extract_article_data(page), number=args.repeat) for page in pages)
+    extractions = args.repeat * len(pages)
+    print(json.dumps({
+        'pages': len(pages),
+        'bytes_per_page': sum(map(len, pages)) // len(pages),
+        'soup_ms_per_page': round(soup_time / extractions * 1000, 3),
+        'fast_ms_per_page': round(fast_time / extractions * 1000, 3),
+        'speedup': round(soup_time / fast_time, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Start-up benchmark of the entry points: how long each one takes to start, how much of it is spent importing,
+which of the slow modules it imports and which log files it creates. Each entry point runs in a fresh
+interpreter, in an empty directory:
+    scraper_module      importing Coindesk-Scraper.py (without running it)
+    scraper_help        Coindesk-Scraper.py --help
+    sql_script_help     sql_script.py --help
+
+Usage:
+    python benchmarks/import_benchmark.py [-n REPEAT] [-o OUTPUT]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from config import COIN_DESK_LOG_FILE, SQL_LOG_FILE
+
+SLOW_MODULES = ['bs4', 'gevent', 'grequests', 'numpy', 'pandas', 'pyarrow', 'pymysql', 'requests', 'selenium',
+                'tabulate']
+SCRAPER_FILE = os.path.join(REPO_DIR, 'Coindesk-Scraper.py')
+ENTRY_POINTS = {
+    'scraper_module': ['-c', f'import importlib.util, sys; sys.path.insert(0, {REPO_DIR!r}); '
+                             f'spec = importlib.util.spec_from_file_location("scraper", {SCRAPER_FILE!r}); '
+                             f'spec.loader.exec_module(importlib.util.module_from_spec(spec))'],
+    'scraper_help': [SCRAPER_FILE, '--help'],
+    'sql_script_help': [os.path.join(REPO_DIR, 'sql_script.py'), '--help'],
+}
+
+
+def run_entry_point(arguments):
+    """
+    runs an entry point once with -X importtime, in an empty directory
+    :param arguments: arguments of the python interpreter
+    :return: (wall milliseconds, import milliseconds, slow modules imported, log files created)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        finished = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, cwd=directory,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        wall = (time.perf_counter() - start) * 1000
+        log_files = sorted(set(os.listdir(directory)) & {COIN_DESK_LOG_FILE, SQL_LOG_FILE})
+    imported_us = 0
+    slow_modules = set()
+    for line in finished.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():  # the header line
+            continue
+        if not name.startswith('  '):  # top-level imports include the time of their own imports
+            imported_us += int(cumulative)
+        package = name.strip().split('.')[0]
+        if package in SLOW_MODULES:
+            slow_modules.add(package)
+    return round(wall, 1), round(imported_us / 1000, 1), sorted(slow_modules), log_files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='runs per entry point (fastest is reported)')
+    parser.add_argument('-o', '--output', help='json file to write the results to (default: stdout)')
+    args = parser.parse_args()
+
+    results = {}
+    for entry_point, arguments in ENTRY_POINTS.items():
+        runs = [run_entry_point(arguments) for _ in range(args.repeat)]
+        wall, imported, slow_modules, log_files = min(runs)
+        results[entry_point] = {'wall_ms': wall, 'import_ms': imported, 'slow_modules': slow_modules,
+                                'log_files': log_files}
+    report = json.dumps({'python': sys.version.split()[0], 'repeat': args.repeat, 'entry_points': results},
+                        indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Offline throughput benchmark of the scraper stages, with no coindesk.com, Chrome or MySQL involved.
+A corpus of listing and article pages is replayed by a local http server and the batches are saved
+to an in-memory SQLite database (see standins.py).
+
+Each stage is timed separately at several corpus sizes and the results are printed as json,
+so two runs (e.g. before and after a change) can be compared:
+    crawl_listing       reading the listing pages over http
+    story_links         turning the story hrefs the selenium listing collects into article urls
+    scrape_articles     downloading and extracting the article pages into an ArticleBatch
+                        (scrape_articles_peak_kib is the peak memory it allocates)
+    insert_batch        saving the articles batch by batch (bulk statements)
+    insert_data         saving the articles one by one (the fallback path)
+
+Usage:
+    python benchmarks/scraper_benchmark.py [-s SIZE ...] [-n REPEAT] [--corpus DIR] [-o OUTPUT]
+    python benchmarks/scraper_benchmark.py --record DIR --listing-path /category/tech [--count COUNT]
+
+Without --corpus a synthetic corpus as large as the largest size is written to a temporary directory.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from config import *
+from extractor import extract_page_properties, listing_entries
+import standins
+
+SCRAPER_FILE = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'Coindesk-Scraper.py')
+DEFAULT_SIZES = [10, 50, 200]
+SERVER_START_SECONDS = 10
+
+
+def load_scraper():
+    """:return: the Coindesk-Scraper.py module (its file name is not importable)"""
+    spec = importlib.util.spec_from_file_location('coindesk_scraper', SCRAPER_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def free_port():
+    """:return: a port nothing listens on"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(corpus, port):
+    """
+    starts the corpus server in its own process and waits until it accepts connections
+    :param corpus: corpus directory
+    :param port: port to listen on
+    :return: the server process
+    """
+    server = subprocess.Popen([sys.executable, os.path.join(BENCHMARKS_DIR, 'standins.py'), corpus, str(port)])
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError(f'The corpus server did not start on port {port}.')
+
+
+def best_time(function, repeat):
+    """
+    :param function: function without arguments, returning the value of its last call
+    :param repeat: number of calls
+    :return: (fastest call in milliseconds, value of the last call)
+    """
+    timings = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 3), value
+
+
+def record_corpus(scraper, directory, listing_path, count):
+    """
+    downloads the listing pages of a category and the first count articles into a corpus directory
+    :param scraper: the Coindesk-Scraper.py module
+    :param directory: corpus directory
+    :param listing_path: site path of the category listing, e.g. /category/tech
+    :param count: number of articles to record
+    """
+    os.makedirs(directory, exist_ok=True)
+    listing_pages = {}
+    links = []
+    page_number = 1
+    while len(links) < count:
+        path = standins.listing_page_path(listing_path, page_number)
+        pages = scraper.fetch_pages([URL + path])
+        if not pages:
+            break
+        content = pages[0][1].content
+        new_links = [link for link, _ in listing_entries(extract_page_properties(content)) if link not in links]
+        if not new_links:
+            break
+        file_name = f'listing_{page_number}.html'
+        with open(os.path.join(directory, file_name), 'wb') as page_file:
+            page_file.write(content)
+        listing_pages[path] = file_name
+        links += new_links
+        page_number += 1
+    articles = {}
+    for url, response in scraper.fetch_pages(links[:count]):
+        file_name = f'article_{len(articles)}.html'
+        with open(os.path.join(directory, file_name), 'wb') as page_file:
+            page_file.write(response.content)
+        articles[url[len(URL):]] = file_name
+    standins.write_manifest(directory, listing_path, listing_pages, articles)
+    print(f'Recorded {len(listing_pages)} listing pages and {len(articles)} articles to {directory}.')
+
+
+def benchmark_size(scraper, base_url, manifest, size, repeat):
+    """
+    times every stage on the first size articles of the corpus
+    :param scraper: the Coindesk-Scraper.py module
+    :param base_url: url of the corpus server
+    :param manifest: corpus manifest
+    :param size: number of articles
+    :param repeat: runs per stage (the fastest one is reported)
+    :return: dictionary of stage -> milliseconds, with the counts each stage produced
+    """
+    paths = list(manifest[standins.MANIFEST_ARTICLES])[:size]
+    urls = [base_url + path for path in paths]
+    scrape_by = {SCRAPE_BY_TYPE: NUM_SCRAPE_TYPE, SCRAPE_BY_PARAMETERS: size}
+    results = {}
+
+    def crawl():
+        scraper.governors.clear()
+        return scraper.crawl_listing(base_url + manifest[standins.MANIFEST_LISTING], scrape_by) or []
+
+    def scrape():
+        scraper.governors.clear()
+        return scraper.scrape_articles(urls)
+
+    results['crawl_listing_ms'], entries = best_time(crawl, repeat)
+    results['story_links_ms'], links = best_time(lambda: scraper.story_links(paths), repeat)
+    results['scrape_articles_ms'], articles = best_time(scrape, repeat)
+    tracemalloc.start()
+    scrape()
+    results['scrape_articles_peak_kib'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    tracemalloc.stop()
+
+    def save(save_batch):
+        connection = standins.SQLiteConnection()
+        indexes = range(len(articles))
+        saved = sum(save_batch(articles.select(indexes[start:start + BATCH]), connection)
+                    for start in range(0, len(articles), BATCH))
+        return saved, connection.statements
+
+    def save_one_by_one(batch, connection):
+        saved = sum(scraper.insert_data(article, connection) for article in batch.rows())
+        connection.commit()
+        return saved
+
+    results['insert_batch_ms'], (saved, batch_statements) = best_time(
+        lambda: save(lambda batch, connection: scraper.insert_batch(batch, connection, scraper.dimension_caches())),
+        repeat)
+    results['insert_data_ms'], (_, single_statements) = best_time(lambda: save(save_one_by_one), repeat)
+    results.update({
+        'listing_entries': len(entries),
+        'story_links': len(links),
+        'articles': len(articles),
+        'saved': saved,
+        'insert_batch_statements': batch_statements,
+        'insert_data_statements': single_statements,
+        'articles_per_second': round(len(articles) / (results['scrape_articles_ms'] + results['insert_batch_ms'])
+                                     * 1000, 1),
+    })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='corpus sizes to time')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='runs per stage and size (fastest is reported)')
+    parser.add_argument('--corpus', help='recorded corpus directory (default: synthetic corpus)')
+    parser.add_argument('-o', '--output', help='json file to write the results to (default: stdout)')
+    parser.add_argument('--record', metavar='DIR', help='record a corpus from coindesk.com into DIR and exit')
+    parser.add_argument('--listing-path', default=DEFAULT_PREFIX + 'tech', help='category listing to record')
+    parser.add_argument('--count', type=int, default=max(DEFAULT_SIZES), help='number of articles to record')
+    args = parser.parse_args()
+    scraper = load_scraper()
+
+    if args.record:
+        record_corpus(scraper, args.record, args.listing_path, args.count)
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = temp_dir
+            standins.write_synthetic_corpus(corpus, max(args.sizes))
+        manifest = standins.read_manifest(corpus)
+        port = free_port()
+        server = start_server(corpus, port)
+        try:
+            available = len(manifest[standins.MANIFEST_ARTICLES])
+            sizes = sorted(size for size in set(args.sizes) if size <= available)
+            report = {
+                'started': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'corpus': args.corpus or 'synthetic',
+                'corpus_articles': available,
+                'skipped_sizes': sorted(size for size in set(args.sizes) if size > available),
+                'repeat': args.repeat,
+                'batch': BATCH,
+                'sizes': {str(size): benchmark_size(scraper, f'http://127.0.0.1:{port}', manifest, size, args.repeat)
+                          for size in sizes},
+            }
+        finally:
+            server.kill()
+            server.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Local stand-ins used by the offline benchmarks: a corpus of listing and article pages on disk,
+an http server replaying it, and (from sinks.py) an in-memory SQLiteConnection answering the scraper's pymysql calls.
+
+A corpus directory holds the pages and a manifest.json naming the file of each listing page and article path.
+It is either recorded from coindesk.com once (scraper_benchmark.py --record) or synthesized.
+
+Usage (the benchmark starts the server itself, in its own process so gevent's patching stays out of it):
+    python benchmarks/standins.py corpus_dir port
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import *
+from sinks import SQLiteConnection
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_LISTING = 'listing'
+MANIFEST_LISTING_PAGES = 'listing_pages'
+MANIFEST_ARTICLES = 'articles'
+SYNTHETIC_LISTING = '/category/synthetic'
+SYNTHETIC_AUTHORS = ['Satoshi Nakamoto', 'Vitalik Buterin', 'Hal Finney', 'Nick Szabo', 'Adam Back']
+SYNTHETIC_TAGS = ['Bitcoin', 'Ethereum', 'DeFi', 'NFT', 'Regulation', 'Mining', 'Stablecoins', 'Markets']
+SYNTHETIC_CATEGORIES = ['Tech', 'Business', 'Markets', 'Policy']
+
+
+def next_data_page(props, body):
+    """
+    :param props: next.js page properties
+    :param body: markup around the __NEXT_DATA__ script
+    :return: bytes of a page embedding the properties the way coindesk.com does
+    """
+    payload = json.dumps({PROPERTIES_TAG: {INITIAL_PROPERTIES_TAG: {PAGE_PROPERTIES: props}}})
+    return (f'<html><head><title>CoinDesk</title></head><body>{body}'
+            f'<{SCRIPT_TAG} id="{SCRIPT_ID}" type="{SCRIPT_TYPE}">{payload}</{SCRIPT_TAG}></body></html>').encode()
+
+
+def story_stack_page(paths):
+    """
+    :param paths: article site paths
+    :return: the story stack markup of a listing page, holding the stories of the paths
+    """
+    stories = ''.join(f'<div class="text-content"><a title="story" href="{path}"><h4>Story</h4></a>'
+                      f'<a href="/tag/bitcoin/">Bitcoin</a><span class="time">Jul 11, 2021</span></div>'
+                      for path in paths)
+    return f'<html><body><nav>menu</nav><div class="story-stack">{stories}</div></body></html>'
+
+
+def listing_page_path(listing, page_number):
+    """
+    :param listing: site path of the category listing
+    :param page_number: listing page number (from 1)
+    :return: site path of the page, as crawl_listing requests it
+    """
+    return listing if page_number == 1 else f'{listing}?{LISTING_PAGE_PARAM}={page_number}'
+
+
+def write_manifest(directory, listing, listing_pages, articles):
+    """
+    :param directory: corpus directory
+    :param listing: site path of the category listing
+    :param listing_pages: dictionary of listing page path -> file name
+    :param articles: dictionary of article path -> file name, in listing order
+    """
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump({MANIFEST_LISTING: listing, MANIFEST_LISTING_PAGES: listing_pages, MANIFEST_ARTICLES: articles},
+                  manifest_file, indent=1)
+
+
+def read_manifest(directory):
+    """
+    :param directory: corpus directory
+    :return: dictionary with the listing path, the listing pages and the articles of the corpus
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_synthetic_corpus(directory, size):
+    """
+    writes a corpus of size distinct articles (with a shared pool of authors, tags and categories)
+    and the listing pages embedding them, ARTICLES_PER_PAGE per page
+    :param directory: corpus directory
+    :param size: number of articles
+    """
+    os.makedirs(directory, exist_ok=True)
+    published = datetime(2021, 7, 11, 10)
+    articles = {}
+    entries = []
+    for number in range(size):
+        date_published = (published - timedelta(hours=number)).strftime(PUBLISHED_DATE_FORMAT)
+        data = {TITLE_TAG: f'Synthetic Article {number}',
+                SUMMARY_TAG: f'Summary of synthetic article {number}. ' + 'Crypto markets moved. ' * 8,
+                AUTHORS_TAG: [{AUTHOR_NAME_TAG: SYNTHETIC_AUTHORS[number % len(SYNTHETIC_AUTHORS)]}],
+                TAGS_TAG: [{TAG_NAME_TAG: SYNTHETIC_TAGS[(number + shift) % len(SYNTHETIC_TAGS)]} for shift in range(4)],
+                PUBLISHED_DATE_TAG: date_published,
+                TAXONOMY_TAG: {CATEGORY_TAG: [SYNTHETIC_CATEGORIES[number % len(SYNTHETIC_CATEGORIES)]]},
+                'body': '<p>paragraph</p>' * 200}
+        path = f'/synthetic-article-{number}'
+        file_name = f'article_{number}.html'
+        with open(os.path.join(directory, file_name), 'wb') as page_file:
+            page_file.write(next_data_page({DATA_TAG: data}, '<div class="row"><p>related</p></div>' * 300))
+        articles[path] = file_name
+        entries.append({'url': path, PUBLISHED_DATE_TAG: date_published + '.000Z', TITLE_TAG: data[TITLE_TAG]})
+    listing_pages = {}
+    for page_number, start in enumerate(range(0, size, ARTICLES_PER_PAGE), start=1):
+        file_name = f'listing_{page_number}.html'
+        with open(os.path.join(directory, file_name), 'wb') as page_file:
+            page_file.write(next_data_page({'sections': [{'stories': entries[start:start + ARTICLES_PER_PAGE]}]},
+                                           story_stack_page([])))
+        listing_pages[listing_page_path(SYNTHETIC_LISTING, page_number)] = file_name
+    write_manifest(directory, SYNTHETIC_LISTING, listing_pages, articles)
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests with the corpus pages (404 for unknown paths).
+    """
+    directory = '.'
+    pages = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        file_name = self.pages.get(self.path.rstrip('/') or '/')
+        if file_name is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        with open(os.path.join(self.directory, file_name), 'rb') as page_file:
+            body = page_file.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CorpusServer(ThreadingHTTPServer):
+    """
+    Threading http server with a listen backlog deep enough for the scraper's concurrent requests, which past
+    the default backlog of 5 would stall on SYN retries and time the server instead of the scraper.
+    """
+    request_queue_size = 128
+
+
+def serve_corpus(directory, port):
+    """
+    serves a corpus on localhost until the process is stopped
+    :param directory: corpus directory
+    :param port: port to listen on
+    """
+    CorpusHandler.directory = directory
+    manifest = read_manifest(directory)
+    CorpusHandler.pages = {**manifest[MANIFEST_LISTING_PAGES], **manifest[MANIFEST_ARTICLES]}
+    CorpusServer(('127.0.0.1', port), CorpusHandler).serve_forever()
+
+
+if __name__ == '__main__':
+    serve_corpus(sys.argv[1], int(sys.argv[2]))
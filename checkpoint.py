@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+
+from config import *
+
+
+class Checkpoint:
+    """
+        A small json file recording how far a run got, so a run that died can be resumed with --resume
+        without listing, downloading or saving again what it already did.
+
+        It holds the run it belongs to (categories and scrape mode), the links each category's listing
+        discovered (and the url of a selenium listing that was still scrolling), the number of batches
+        committed and the urls of the articles committed. It is rewritten atomically whenever one of them
+        changes and removed once the run completed.
+
+        Attributes
+        ----------
+        path : str
+            Json file of the checkpoint.
+        run: dict
+            Categories and scrape mode of the run.
+        jobs: dict
+            Category -> {CHECKPOINT_CATEGORY: category, CHECKPOINT_LINKS: list of the urls discovered,
+        CHECKPOINT_LISTING_DATES: url -> publication date (PUBLISHED_DATE_FORMAT) of the urls the listing dates,
+        CHECKPOINT_LISTING_URL: url of the listing if it was still scrolling, or None}.
+        committed: set
+            Urls of the articles committed.
+        batches: int
+            Number of batches committed.
+
+        Methods
+        -------
+        load(run):
+            Reads the checkpoint left by a run, if it is the same run.
+
+        start(run, jobs):
+            Starts the checkpoint of a new run.
+
+        record_job(job):
+            Saves the links, listing dates and listing state of a job.
+
+        commit(urls):
+            Records a committed batch.
+
+        clear():
+            Removes the checkpoint of a completed run.
+        """
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        """
+        Constructs an empty checkpoint (nothing is read or written yet).
+        """
+        self.path = path
+        self.run = None
+        self.jobs = {}
+        self.committed = set()
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def load(self, run):
+        """
+        reads the checkpoint a previous run left behind
+        :param run: dictionary describing the run to resume (categories and scrape mode)
+        :return: boolean if the checkpoint exists and belongs to the same run
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+        except (OSError, ValueError) as err:
+            coin_logger.warning(f'Could not read {self.path}, starting from scratch: {err}')
+            return False
+        if saved[CHECKPOINT_RUN] != run:
+            coin_logger.warning(f'{self.path} belongs to another run ({saved[CHECKPOINT_RUN]}), starting from scratch.')
+            return False
+        self.run = run
+        self.jobs = {job[CHECKPOINT_CATEGORY]: job for job in saved[CHECKPOINT_JOBS]}
+        self.committed = set(saved[CHECKPOINT_COMMITTED])
+        self.batches = saved[CHECKPOINT_BATCHES]
+        return True
+
+    def start(self, run, jobs):
+        """
+        starts the checkpoint of a run, replacing the one of any previous run
+        :param run: dictionary describing the run (categories and scrape mode)
+        :param jobs: list of ScrapeJob
+        """
+        with self.lock:
+            self.run = run
+            self.jobs = {job.category: self.job_state(job) for job in jobs}
+            self.save()
+
+    def record_job(self, job, listing_open=None):
+        """
+        saves the links, listing dates and listing state of a job (called as its selenium listing discovers links).
+        The links only grow: those of a resumed job are added to the ones its first run discovered.
+        :param job: ScrapeJob
+        :param listing_open: boolean if a resumed run has to scroll the listing again, None for job.listing_open
+        """
+        with self.lock:
+            state = self.job_state(job, listing_open)
+            if job.category in self.jobs:
+                state[CHECKPOINT_LINKS] = list(dict.fromkeys(self.jobs[job.category][CHECKPOINT_LINKS]
+                                                             + state[CHECKPOINT_LINKS]))
+                state[CHECKPOINT_LISTING_DATES] = {**self.jobs[job.category][CHECKPOINT_LISTING_DATES],
+                                                   **state[CHECKPOINT_LISTING_DATES]}
+            self.jobs[job.category] = state
+            self.save()
+
+    def commit(self, urls):
+        """
+        records a committed batch
+        :param urls: urls of the articles of the batch
+        """
+        with self.lock:
+            self.committed.update(urls)
+            self.batches += 1
+            self.save()
+
+    def clear(self):
+        """removes the checkpoint of a completed run"""
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    @staticmethod
+    def job_state(job, listing_open=None):
+        """
+        :param job: ScrapeJob
+        :param listing_open: boolean if a resumed run has to scroll the listing again, None for job.listing_open
+        :return: dictionary of the job's category, links, listing dates and open listing url
+        """
+        if listing_open is None:
+            listing_open = job.listing_open
+        return {CHECKPOINT_CATEGORY: job.category, CHECKPOINT_LINKS: list(job.links),
+                CHECKPOINT_LISTING_DATES: {link: published.strftime(PUBLISHED_DATE_FORMAT)
+                                           for link, published in job.listing_dates.items()},
+                CHECKPOINT_LISTING_URL: job.listing_url if listing_open else None}
+
+    def save(self):
+        """writes the checkpoint (called under the lock), replacing the file atomically"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump({CHECKPOINT_RUN: self.run, CHECKPOINT_JOBS: list(self.jobs.values()),
+                       CHECKPOINT_BATCHES: self.batches, CHECKPOINT_COMMITTED: sorted(self.committed)},
+                      checkpoint_file)
+        os.replace(temp_path, self.path)
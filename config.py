@@ -1,7 +1,13 @@
 import logging
+
+from log_queue import queue_logging
+
 # logging defaults
 COIN_DESK_LOG_FILE = 'coindesk.log'
 SQL_LOG_FILE = 'sql.log'
+# Records let through per call site (message type) and window; errors are never dropped
+LOG_RATE_LIMIT = 20
+LOG_RATE_WINDOW = 60
 coin_logger = logging.getLogger('articles')
 coin_logger.setLevel(logging.INFO)
 sql_logger = logging.getLogger('database-creation')
@@ -9,17 +15,19 @@ sql_logger.setLevel(logging.INFO)
 formatter = logging.Formatter(
     '%(asctime)s-%(levelname)s-FILE:%(filename)s-FUNC:%(funcName)s-LINE:%(lineno)d-%(message)s')
 
-# Coin Logger for log file
-file_handler = logging.FileHandler(COIN_DESK_LOG_FILE)
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-coin_logger.addHandler(file_handler)
+# Coin Logger for log file (delay: the file is only opened once the first record is written)
+coin_file_handler = logging.FileHandler(COIN_DESK_LOG_FILE, delay=True)
+coin_file_handler.setLevel(logging.INFO)
+coin_file_handler.setFormatter(formatter)
 
 # SQL Logger for log file
-file_handler = logging.FileHandler(SQL_LOG_FILE)
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-sql_logger.addHandler(file_handler)
+sql_file_handler = logging.FileHandler(SQL_LOG_FILE, delay=True)
+sql_file_handler.setLevel(logging.INFO)
+sql_file_handler.setFormatter(formatter)
+
+# Both files are written by a background thread from a queue, started by the first record
+log_queue_handler = queue_logging([(coin_logger, coin_file_handler), (sql_logger, sql_file_handler)],
+                                  LOG_RATE_LIMIT, LOG_RATE_WINDOW)
 
 
 # SQL defaults
@@ -85,12 +93,133 @@ CATEGORIES_ARTICLES_RELATIONSHIP_CREATION = f"""CREATE TABLE IF NOT EXISTS {CATE
             )
             """
 
+# Aggregate tables for trend analysis, kept up to date by the scraper's write path.
+# One row per partner (tag, author or category) and period: the number of articles published in it.
+TAG_DAILY_TABLE = 'Tag_daily'
+AUTHOR_WEEKLY_TABLE = 'Author_weekly'
+CATEGORY_DAILY_TABLE = 'Category_daily'
+DAY_PERIOD = 'day'
+WEEK_PERIOD = 'week'
+# (aggregate table, relationship table it counts, partner id column, period)
+AGGREGATES = [
+    (TAG_DAILY_TABLE, TAGS_ARTICLES_TABLE, 'tag_id', DAY_PERIOD),
+    (AUTHOR_WEEKLY_TABLE, AUTHORS_ARTICLES_TABLE, 'author_id', WEEK_PERIOD),
+    (CATEGORY_DAILY_TABLE, CATEGORIES_ARTICLES_TABLE, 'category_id', DAY_PERIOD),
+]
+# Start of the period of an article in sql (weeks start on Monday)
+PERIOD_SQL = {DAY_PERIOD: 'DATE(a.publication_date)',
+              WEEK_PERIOD: 'DATE(a.publication_date) - INTERVAL WEEKDAY(a.publication_date) DAY'}
+AGGREGATE_CREATION = """CREATE TABLE IF NOT EXISTS {table} ({column} INT,
+            period_start DATE,
+            articles INT NOT NULL DEFAULT 0,
+            PRIMARY KEY ({column}, period_start)
+            )
+            """
+PERIOD_INDEX = '{table}_period'
+ADD_PERIOD_INDEX = f'ALTER TABLE {{table}} ADD INDEX {PERIOD_INDEX} (period_start, {{column}})'
+INCREMENT_AGGREGATE = """INSERT INTO {table} ({column}, period_start, articles) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE articles = articles + VALUES(articles)"""
+DECREMENT_AGGREGATE = 'UPDATE {table} SET articles = articles - %s WHERE {column} = %s AND period_start = %s'
+FIND_ARTICLE_PARTNERS = 'SELECT {column} AS id FROM {links} WHERE article_id = %s'
+CLEAR_AGGREGATE = 'DELETE FROM {table}'
+BACKFILL_AGGREGATE = f"""INSERT INTO {{table}} ({{column}}, period_start, articles)
+            SELECT l.{{column}}, {{period}}, COUNT(*) FROM {{links}} AS l
+            JOIN {ARTICLES_TABLE} AS a ON a.id = l.article_id
+            GROUP BY l.{{column}}, {{period}}"""
+
+SCHEMA_MIGRATIONS_TABLE = 'Schema_migrations'
+SCHEMA_MIGRATIONS_CREATION = f"""CREATE TABLE IF NOT EXISTS {SCHEMA_MIGRATIONS_TABLE} (version INT PRIMARY KEY,
+            name VARCHAR(200),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+APPLIED_MIGRATIONS = f'SELECT version FROM {SCHEMA_MIGRATIONS_TABLE}'
+RECORD_MIGRATION = f'INSERT INTO {SCHEMA_MIGRATIONS_TABLE} (version, name) VALUES (%s, %s)'
+MIGRATION_VERSION = 'version'
+
+# Schema migrations: {table} is the dimension / relationship table, {column} the name column or partner id
+# Dimension tables: point the links of duplicate names at the oldest row, delete the duplicates, add a unique index
+REPOINT_DUPLICATE_NAMES = """UPDATE {links} AS l
+            JOIN {table} AS d ON l.{link_column} = d.id
+            JOIN (SELECT {column}, MIN(id) AS keep_id FROM {table} GROUP BY {column}) AS k ON k.{column} = d.{column}
+            SET l.{link_column} = k.keep_id
+            WHERE l.{link_column} <> k.keep_id"""
+DELETE_DUPLICATE_NAMES = """DELETE d FROM {table} AS d
+            JOIN (SELECT {column}, MIN(id) AS keep_id FROM {table} GROUP BY {column}) AS k ON k.{column} = d.{column}
+            WHERE d.id <> k.keep_id"""
+UNIQUE_NAME_INDEX = '{table}_{column}_unique'
+ADD_UNIQUE_NAME = f'ALTER TABLE {{table}} ADD UNIQUE INDEX {UNIQUE_NAME_INDEX} ({{column}})'
+# Relationship tables: keep one row per pair, add the composite primary key and the reverse lookup index
+COPY_DISTINCT_LINKS = """CREATE TEMPORARY TABLE {table}_distinct AS
+            SELECT DISTINCT article_id, {column} FROM {table}
+            WHERE article_id IS NOT NULL AND {column} IS NOT NULL"""
+DELETE_LINKS = 'DELETE FROM {table}'
+RESTORE_DISTINCT_LINKS = 'INSERT INTO {table} (article_id, {column}) SELECT article_id, {column} FROM {table}_distinct'
+DROP_DISTINCT_LINKS = 'DROP TEMPORARY TABLE {table}_distinct'
+PRIMARY_KEY_INDEX = 'PRIMARY'
+ADD_LINK_PRIMARY_KEY = 'ALTER TABLE {table} ADD PRIMARY KEY (article_id, {column})'
+LINK_ARTICLE_INDEX = '{table}_{column}_article'
+ADD_LINK_ARTICLE_INDEX = f'ALTER TABLE {{table}} ADD INDEX {LINK_ARTICLE_INDEX} ({{column}}, article_id)'
+# Hash keys: the uniqueness of a long text column moves to a fixed-width digest of it ({hash_column}),
+# filled by the scraper and, for the rows saved before, by the backfill of the migration
+HASH_DIGEST_SIZE = 16
+HASH_BACKFILL_CHUNK = 10000
+HASH_INDEX = '{table}_{hash_column}_unique'
+ADD_HASH_COLUMN = 'ALTER TABLE {table} ADD COLUMN {hash_column} BINARY(16) NULL'
+# The backfill pages through the primary key, so no chunk rescans the rows hashed before it
+SELECT_UNHASHED = '''SELECT id, {column} AS value FROM {table}
+            WHERE id > %s AND {hash_column} IS NULL AND {column} IS NOT NULL ORDER BY id LIMIT %s'''
+SET_HASH = 'UPDATE {table} SET {hash_column} = %s WHERE id = %s'
+FIND_DUPLICATE_HASHES = '''SELECT GROUP_CONCAT(id) AS ids FROM {table} WHERE {hash_column} IS NOT NULL
+            GROUP BY {hash_column} HAVING COUNT(*) > 1 LIMIT 10'''
+ADD_HASH_KEY = f'ALTER TABLE {{table}} ADD UNIQUE INDEX {HASH_INDEX} ({{hash_column}})'
+DROP_TEXT_KEY = 'ALTER TABLE {table} DROP INDEX {column}'
+SQLITE_HASH_KEY = f'CREATE UNIQUE INDEX IF NOT EXISTS {HASH_INDEX} ON {{table}} ({{hash_column}})'
+# Checks of the migration steps that can't be repeated (mysql commits every ALTER TABLE, so a migration stopped
+# halfway is run again from its first step)
+FIND_COLUMN = 'SHOW COLUMNS FROM {table} LIKE %s'
+FIND_INDEX = 'SHOW INDEX FROM {table} WHERE Key_name = %s'
+URL_HASH = 'url_hash'
+SUMMARY_HASH = 'summary_hash'
+# (table, text column, hash column)
+HASH_KEYS = [(ARTICLES_TABLE, 'url', URL_HASH), (SUMMARIES_TABLE, 'summary', SUMMARY_HASH)]
+
+# Streaming export of sql_script.py (--export)
+CSV_EXPORT = 'csv'
+JSONL_EXPORT = 'jsonl'
+PARQUET_EXPORT = 'parquet'
+EXPORT_DIR = 'export'
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_LIST_SEPARATOR = '|'
+EXPORTED_TABLES = [ARTICLES_TABLE, SUMMARIES_TABLE, AUTHORS_TABLE, TAGS_TABLE, CATEGORIES_TABLE,
+                   AUTHORS_ARTICLES_TABLE, TAGS_ARTICLES_TABLE, CATEGORIES_ARTICLES_TABLE,
+                   TAG_DAILY_TABLE, AUTHOR_WEEKLY_TABLE, CATEGORY_DAILY_TABLE]
+SELECT_ALL = 'SELECT {columns} FROM {table}'
+# The exported columns of the tables that are not exported whole (the hash keys are left out)
+EXPORTED_COLUMNS = {ARTICLES_TABLE: 'id, title, publication_date, url, summary_id', SUMMARIES_TABLE: 'id, summary'}
+# One row per article; the names of each article are found through the primary keys of the relationship tables
+ARTICLE_VIEW_NAME = 'article_view'
+ARTICLE_VIEW_LIST_COLUMNS = ('authors', 'tags', 'categories')
+ARTICLE_VIEW = f'''SELECT a.id, a.title, a.publication_date, a.url, s.summary,
+            (SELECT GROUP_CONCAT(au.name ORDER BY au.name SEPARATOR '{EXPORT_LIST_SEPARATOR}')
+             FROM {AUTHORS_ARTICLES_TABLE} AS aa JOIN {AUTHORS_TABLE} AS au ON au.id = aa.author_id
+             WHERE aa.article_id = a.id) AS authors,
+            (SELECT GROUP_CONCAT(t.name ORDER BY t.name SEPARATOR '{EXPORT_LIST_SEPARATOR}')
+             FROM {TAGS_ARTICLES_TABLE} AS ta JOIN {TAGS_TABLE} AS t ON t.id = ta.tag_id
+             WHERE ta.article_id = a.id) AS tags,
+            (SELECT GROUP_CONCAT(c.category ORDER BY c.category SEPARATOR '{EXPORT_LIST_SEPARATOR}')
+             FROM {CATEGORIES_ARTICLES_TABLE} AS ca JOIN {CATEGORIES_TABLE} AS c ON c.id = ca.category_id
+             WHERE ca.article_id = a.id) AS categories
+            FROM {ARTICLES_TABLE} AS a JOIN {SUMMARIES_TABLE} AS s ON s.id = a.summary_id
+            ORDER BY a.id'''
+# The GROUP_CONCAT lists are cut at group_concat_max_len (1024 bytes by default)
+RAISE_GROUP_CONCAT_MAX_LEN = 'SET SESSION group_concat_max_len = @@max_allowed_packet'
 
 
 # SQL INSERT scripts
-INSERT_INTO_SUMMARIES = f'''INSERT INTO {SUMMARIES_TABLE} (summary) VALUES (%s)'''
-INSERT_INTO_ARTICLES = f'''INSERT INTO {ARTICLES_TABLE} (title,summary_id,publication_date,url)
-            VALUES (%s, %s, %s, %s)'''
+INSERT_INTO_SUMMARIES = f'''INSERT INTO {SUMMARIES_TABLE} (summary, summary_hash) VALUES (%s, %s)'''
+INSERT_INTO_ARTICLES = f'''INSERT INTO {ARTICLES_TABLE} (title,summary_id,publication_date,url,url_hash)
+            VALUES (%s, %s, %s, %s, %s)'''
 FIND_AUTHOR = f'SELECT id FROM {AUTHORS_TABLE} WHERE name = %s'
 INSERT_INTO_AUTHORS = f'INSERT INTO {AUTHORS_TABLE} (name) VALUES (%s)'
 INSERT_INTO_RELATIONSHIP_ARTICLE_AUTHOR = f'INSERT INTO {AUTHORS_ARTICLES_TABLE} VALUES (%s, %s)'
@@ -101,11 +230,78 @@ FIND_CATEGORY = f'SELECT id FROM {CATEGORIES_TABLE} WHERE category = %s'
 INSERT_INTO_CATEGORY = f'INSERT INTO {CATEGORIES_TABLE} (category) VALUES (%s)'
 INSERT_INTO_RELATIONSHIP_ARTICLE_CATEGORY = f'INSERT INTO {CATEGORIES_ARTICLES_TABLE} VALUES (%s, %s)'
 
+# SQL bulk scripts (one statement per table and batch, {} is filled with %s placeholders)
+# Urls and summaries are looked up by their hash keys
+FIND_ARTICLES_BY_URL_HASHES = f'''SELECT id, summary_id, publication_date, url AS value FROM {ARTICLES_TABLE}
+            WHERE url_hash IN ({{}})'''
+BULK_INSERT_SUMMARIES = f'''INSERT INTO {SUMMARIES_TABLE} (summary, summary_hash) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE summary_hash = summary_hash'''
+FIND_SUMMARIES_BY_HASHES = f'SELECT id, summary AS value FROM {SUMMARIES_TABLE} WHERE summary_hash IN ({{}})'
+FIND_USED_SUMMARIES = f'SELECT summary_id FROM {ARTICLES_TABLE} WHERE summary_id IN ({{}})'
+BULK_INSERT_ARTICLES = f'''INSERT INTO {ARTICLES_TABLE} (title, summary_id, publication_date, url, url_hash)
+            VALUES (%s, %s, %s, %s, %s)'''
+FIND_AUTHORS_BY_NAMES = f'SELECT id, name AS value FROM {AUTHORS_TABLE} WHERE name IN ({{}})'
+BULK_INSERT_AUTHORS = f'INSERT INTO {AUTHORS_TABLE} (name) VALUES (%s) ON DUPLICATE KEY UPDATE name = name'
+FIND_TAGS_BY_NAMES = f'SELECT id, name AS value FROM {TAGS_TABLE} WHERE name IN ({{}})'
+BULK_INSERT_TAGS = f'INSERT INTO {TAGS_TABLE} (name) VALUES (%s) ON DUPLICATE KEY UPDATE name = name'
+FIND_CATEGORIES_BY_NAMES = f'SELECT id, category AS value FROM {CATEGORIES_TABLE} WHERE category IN ({{}})'
+BULK_INSERT_CATEGORIES = f'''INSERT INTO {CATEGORIES_TABLE} (category) VALUES (%s)
+            ON DUPLICATE KEY UPDATE category = category'''
+BULK_INSERT_ARTICLE_AUTHORS = f'''INSERT INTO {AUTHORS_ARTICLES_TABLE} (article_id, author_id) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE author_id = author_id'''
+BULK_INSERT_ARTICLE_TAGS = f'''INSERT INTO {TAGS_ARTICLES_TABLE} (article_id, tag_id) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE tag_id = tag_id'''
+BULK_INSERT_ARTICLE_CATEGORIES = f'''INSERT INTO {CATEGORIES_ARTICLES_TABLE} (article_id, category_id) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE category_id = category_id'''
+
+# SQL UPDATE scripts (articles that changed since they were saved)
+FIND_ARTICLE_BY_URL_HASH = f'SELECT id, summary_id, publication_date FROM {ARTICLES_TABLE} WHERE url_hash = %s'
+UPDATE_SUMMARY = f'UPDATE {SUMMARIES_TABLE} SET summary = %s, summary_hash = %s WHERE id = %s'
+UPDATE_ARTICLE = f'UPDATE {ARTICLES_TABLE} SET title = %s, publication_date = %s WHERE id = %s'
+DELETE_ARTICLE_AUTHORS = f'DELETE FROM {AUTHORS_ARTICLES_TABLE} WHERE article_id = %s'
+DELETE_ARTICLE_TAGS = f'DELETE FROM {TAGS_ARTICLES_TABLE} WHERE article_id = %s'
+DELETE_ARTICLE_CATEGORIES = f'DELETE FROM {CATEGORIES_ARTICLES_TABLE} WHERE article_id = %s'
+
+# SQL scripts of the skip index (urls already stored)
+COUNT_ARTICLES = f'SELECT COUNT(*) FROM {ARTICLES_TABLE}'
+SELECT_ARTICLE_URLS = f'SELECT url FROM {ARTICLES_TABLE}'
+FIND_STORED_URLS = f'SELECT url FROM {ARTICLES_TABLE} WHERE url_hash IN ({{}})'
+
+# Lookups of the scraper whose query plans --explain shows (the IN lookups with two values)
+EXPLAIN = 'EXPLAIN '
+EXPLAINED_IN_VALUES = ', '.join(['%s'] * 2)
+EXPLAINED_LOOKUPS = [
+    ('find tag', FIND_TAG, ['bitcoin']),
+    ('find category', FIND_CATEGORY, ['Tech']),
+    ('find author', FIND_AUTHOR, ['Satoshi Nakamoto']),
+    ('find tags', FIND_TAGS_BY_NAMES.format(EXPLAINED_IN_VALUES), ['bitcoin', 'ethereum']),
+    ('find categories', FIND_CATEGORIES_BY_NAMES.format(EXPLAINED_IN_VALUES), ['Tech', 'Markets']),
+    ('find authors', FIND_AUTHORS_BY_NAMES.format(EXPLAINED_IN_VALUES), ['Satoshi Nakamoto', 'Vitalik Buterin']),
+    ('find articles by url', FIND_ARTICLES_BY_URL_HASHES.format(EXPLAINED_IN_VALUES), [bytes(HASH_DIGEST_SIZE)] * 2),
+    ('find summaries', FIND_SUMMARIES_BY_HASHES.format(EXPLAINED_IN_VALUES), [bytes(HASH_DIGEST_SIZE)] * 2),
+    ('articles of a tag', f'''SELECT a.id FROM {TAGS_TABLE} AS t
+            JOIN {TAGS_ARTICLES_TABLE} AS ta ON ta.tag_id = t.id
+            JOIN {ARTICLES_TABLE} AS a ON a.id = ta.article_id WHERE t.name = %s''', ['bitcoin']),
+    ('tags of an article', f'SELECT tag_id FROM {TAGS_ARTICLES_TABLE} WHERE article_id = %s', [1]),
+    ('articles of an author', f'SELECT article_id FROM {AUTHORS_ARTICLES_TABLE} WHERE author_id = %s', [1]),
+    ('articles of a category', f'SELECT article_id FROM {CATEGORIES_ARTICLES_TABLE} WHERE category_id = %s', [1]),
+]
+
+# SQL scripts preloading the id caches (most recent rows first)
+SELECT_RECENT_AUTHORS = f'SELECT id, name FROM {AUTHORS_TABLE} ORDER BY id DESC LIMIT %s'
+SELECT_RECENT_TAGS = f'SELECT id, name FROM {TAGS_TABLE} ORDER BY id DESC LIMIT %s'
+SELECT_RECENT_CATEGORIES = f'SELECT id, category FROM {CATEGORIES_TABLE} ORDER BY id DESC LIMIT %s'
+
 
 # Table field names
+ARTICLE_ID = 'id'
+ARTICLE_SUMMARY_ID = 'summary_id'
+ARTICLE_PUBLICATION_DATE = 'publication_date'
+LOOKUP_VALUE = 'value'
 AUTHOR_ID = 'id'
 TAG_ID = 'id'
 CATEGORY_ID = 'id'
+PARTNER_ID = 'id'
 
 # PATH = "C:\Program Files (x86)\chromedriver.exe"
 ARTICLE_LINK_INDEX = 1
@@ -118,10 +314,126 @@ ARG_OPTION = 1
 MAX_ARTICLES = 1000
 ARTICLES_PER_HOME = 9
 ARTICLES_PER_PAGE = 12
+LISTING_PAGE_PARAM = 'page'
+LISTING_LINK_TAGS = ('url', 'link', 'slug')
+LISTING_DATE_LENGTH = 19
 DEFAULT_PREFIX = '/category/'
-SLEEPTIME = 3
 BATCH = 10
 
+# Article fetching: AIMD concurrency governor per host (replaces hand-tuned batch sleeps)
+FETCH_TIMEOUT = 30
+FETCH_RETRIES = 3
+# Client errors counted as missing articles (the other 4xx, but 429, count as fetch failures; neither is retried)
+NOT_FOUND_STATUSES = (404, 410)
+GOVERNOR_INITIAL_LIMIT = 4
+GOVERNOR_MIN_LIMIT = 1
+GOVERNOR_MAX_LIMIT = 32
+GOVERNOR_INCREASE_STEP = 1
+GOVERNOR_DECREASE_FACTOR = 0.5
+GOVERNOR_LATENCY_TOLERANCE = 2.0
+# Weight of the latest round in the moving (EWMA) baseline of the round median latencies
+GOVERNOR_BASELINE_WEIGHT = 0.2
+GOVERNOR_LATENCY_WINDOW = 200
+GOVERNOR_BACKOFF_SECONDS = 2
+# Connections kept open by the shared http session: hosts, and connections per host (the governor's maximum)
+HTTP_POOL_HOSTS = 4
+HTTP_POOL_SIZE = GOVERNOR_MAX_LIMIT
+
+# Conditional GET (--revalidate): validators of saved article urls, one json line per committed url of a database
+# (or a line forgetting all the urls of a dropped database)
+VALIDATORS_FILE = 'validators.jsonl'
+ETAG_KEY = 'etag'
+LAST_MODIFIED_KEY = 'last_modified'
+VALIDATORS_DATABASE_KEY = 'database'
+VALIDATORS_URL_KEY = 'url'
+VALIDATORS_DROPPED_KEY = 'dropped'
+# The file is compacted when it's read with more than this many lines per live entry
+VALIDATORS_COMPACT_RATIO = 2
+
+# Skip index of stored article urls
+KNOWN_URLS_SET_LIMIT = 200000
+BLOOM_ERROR_RATE = 0.001
+
+# name -> id caches of the Authors, Tags and Categories tables
+ID_CACHE_SIZE = 10000
+
+# Run metrics: json report and Prometheus text file written at the end of every run
+METRICS_REPORT_FILE = 'metrics.json'
+METRICS_PROMETHEUS_FILE = 'metrics.prom'
+METRICS_PREFIX = 'coindesk'
+FETCH_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_SELENIUM_LISTING = 'selenium_listing'
+STAGE_HTTP_LISTING = 'http_listing'
+STAGE_SKIP_INDEX = 'skip_index'
+STAGE_CACHE_PRELOAD = 'cache_preload'
+STAGE_FETCH = 'fetch'
+STAGE_EXTRACT = 'extract'
+STAGE_PARSE = 'parse'
+STAGE_WRITE = 'write'
+METRIC_NOT_FOUND = 'not_found'
+METRIC_NOT_MODIFIED = 'not_modified'
+METRIC_DUPLICATES_SKIPPED = 'duplicates_skipped'
+METRIC_KNOWN_URLS_SKIPPED = 'known_urls_skipped'
+METRIC_CROSS_LISTED_SKIPPED = 'cross_listed_skipped'
+METRIC_ARTICLES_UPDATED = 'articles_updated'
+METRIC_FETCH_FAILURES = 'fetch_failures'
+METRIC_EVENTS = (METRIC_NOT_FOUND, METRIC_NOT_MODIFIED, METRIC_DUPLICATES_SKIPPED, METRIC_KNOWN_URLS_SKIPPED,
+                 METRIC_CROSS_LISTED_SKIPPED, METRIC_ARTICLES_UPDATED, METRIC_FETCH_FAILURES)
+
+# Storage sinks the writers save the batches to
+MYSQL_STORAGE = 'mysql'
+SQLITE_STORAGE = 'sqlite'
+JSONL_STORAGE = 'jsonl'
+PARQUET_STORAGE = 'parquet'
+SQLITE_FILE = DATABASE + '.sqlite'
+RUN_FILES_DIR = 'runs'
+RUN_FILE_PREFIX = 'articles-'
+RUN_FILE_TIME_FORMAT = '%Y%m%d-%H%M%S'
+JSONL_EXTENSION = '.jsonl'
+PARQUET_EXTENSION = '.parquet'
+# Columns of the articles written by the file sinks
+ARTICLE_TITLE = 'title'
+ARTICLE_SUMMARY = 'summary'
+ARTICLE_URL = 'url'
+ARTICLE_PUBLISHED = 'publication_date'
+ARTICLE_AUTHORS = 'authors'
+ARTICLE_TAGS = 'tags'
+ARTICLE_CATEGORIES = 'categories'
+ARTICLE_COLUMNS = (ARTICLE_TITLE, ARTICLE_SUMMARY, ARTICLE_URL, ARTICLE_PUBLISHED, ARTICLE_AUTHORS, ARTICLE_TAGS,
+                   ARTICLE_CATEGORIES)
+# Keys sql_script.py's migrations add in mysql, created up front in SQLite
+SQLITE_UNIQUE_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS {table}_unique ON {table} ({columns})'
+SQLITE_UNIQUE_KEYS = [(TAGS_TABLE, 'name'), (CATEGORIES_TABLE, 'category'),
+                      (TAGS_ARTICLES_TABLE, 'article_id, tag_id'),
+                      (AUTHORS_ARTICLES_TABLE, 'article_id, author_id'),
+                      (CATEGORIES_ARTICLES_TABLE, 'article_id, category_id')]
+
+# Pipeline defaults (fetch -> parse -> write stages)
+FETCH_WORKERS = 2
+WRITER_WORKERS = 1
+QUEUE_DEPTH = 2
+QUEUE_POLL_SECONDS = 0.5
+
+# Daemon mode: every category is scraped again every interval, plus or minus the jitter (a fraction of it)
+DAEMON_INTERVAL_SECONDS = 900
+DAEMON_JITTER = 0.1
+DAEMON_LOCK_FILE = 'coindesk-scraper.lock'
+
+# Checkpoint of the current run, resumed with --resume
+CHECKPOINT_FILE = 'checkpoint.json'
+CHECKPOINT_RUN = 'run'
+CHECKPOINT_JOBS = 'jobs'
+CHECKPOINT_CATEGORY = 'category'
+CHECKPOINT_LINKS = 'links'
+CHECKPOINT_LISTING_DATES = 'listing_dates'
+CHECKPOINT_LISTING_URL = 'listing_url'
+CHECKPOINT_BATCHES = 'batches_committed'
+CHECKPOINT_COMMITTED = 'committed'
+CHECKPOINT_CATEGORIES = 'categories'
+CHECKPOINT_SCRAPE_TYPE = 'scrape_type'
+CHECKPOINT_SCRAPE_PARAMETER = 'scrape_parameter'
+CHECKPOINT_STORAGE = 'storage'
+
 # Scraping metadata tags
 SCRIPT_TAG = 'script'
 SCRIPT_ID = '__NEXT_DATA__'
@@ -146,9 +458,68 @@ TODAY = 'Today'
 YESTERDAY = 'Yesterday'
 date_format = '%b %d, %Y'
 
+# Selenium listing: a headless Chrome that skips images, fonts and third-party scripts,
+# and waits on the story stack growing rather than for fixed times
+SELENIUM_WAIT_SECONDS = 10
+SELENIUM_POLL_SECONDS = 0.1
+HEADLESS_CHROME_ARGUMENTS = ['--headless', '--disable-gpu', '--disable-extensions', '--mute-audio',
+                             '--blink-settings=imagesEnabled=false', '--window-size=1280,2000']
+CHROME_PREFERENCES = {'profile.managed_default_content_settings.images': 2}
+PAGE_LOAD_STRATEGY = 'eager'  # don't wait for the subresources of the page, only for its DOM
+BLOCKED_URL_PATTERNS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.woff', '*.woff2',
+                        '*.ttf', '*.mp4', '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+                        '*googlesyndication.com*', '*amazon-adsystem.com*', '*facebook.net*', '*facebook.com*',
+                        '*twitter.com*', '*scorecardresearch.com*', '*chartbeat.*', '*hotjar.com*',
+                        '*cookielaw.org*', '*onetrust.com*', '*taboola.com*', '*outbrain.com*', '*youtube.com*']
+MORE_BUTTON_CLASS = 'cta-story-stack'
+# [number of stories loaded, text of the last story's time], read in one call
+STORY_STATE_SCRIPT = """var stories = document.getElementsByClassName('text-content');
+var times = document.getElementsByClassName('time');
+return [stories.length, times.length ? times[times.length - 1].textContent.trim() : ''];"""
+# Collects the hrefs of the story links as the story stack renders them, from the nodes added to it only.
+# Returns false when the page has no story stack.
+WATCH_STORY_LINKS_SCRIPT = """var stack = document.querySelector('div.story-stack');
+if (!stack) return false;
+window.storyLinks = [];
+var collect = function (node) {
+    if (node.nodeType !== 1) return;
+    var anchors = node.matches('a[title]') ? [node] : node.querySelectorAll('a[title]');
+    for (var i = 0; i < anchors.length; i++) window.storyLinks.push(anchors[i].getAttribute('href'));
+};
+collect(stack);
+new MutationObserver(function (mutations) {
+    mutations.forEach(function (mutation) { mutation.addedNodes.forEach(collect); });
+}).observe(stack, {childList: true, subtree: true});
+return true;"""
+# Returns the hrefs collected since the last call
+TAKE_STORY_LINKS_SCRIPT = 'var links = window.storyLinks || []; window.storyLinks = []; return links;'
+
 # CLI scrape_by Constants
 SCRAPE_BY_TYPE = 'type'
 SCRAPE_BY_FUNCTION = 'function'
 SCRAPE_BY_PARAMETERS = 'parameters'
+ALL_CATEGORIES = 'all'
 NUM_SCRAPE_TYPE = 'num'
 DATE_SCRAPE_TYPE = 'date'
+
+# CLI pipeline Constants
+PIPELINE_FETCH_WORKERS = 'fetch_workers'
+PIPELINE_WRITER_WORKERS = 'writer_workers'
+PIPELINE_QUEUE_DEPTH = 'queue_depth'
+PIPELINE_LISTING = 'listing'
+PIPELINE_REVALIDATE = 'revalidate'
+PIPELINE_METRICS_REPORT = 'metrics_report'
+PIPELINE_METRICS_PROMETHEUS = 'metrics_prometheus'
+PIPELINE_STORAGE = 'storage'
+PIPELINE_STORAGE_PATH = 'storage_path'
+PIPELINE_SHOW_BROWSER = 'show_browser'
+PIPELINE_DAEMON = 'daemon'
+PIPELINE_INTERVAL = 'interval'
+PIPELINE_JITTER = 'jitter'
+PIPELINE_RESUME = 'resume'
+PIPELINE_OUTPUT = 'output'
+HTTP_LISTING = 'http'
+SELENIUM_LISTING = 'selenium'
+TABLE_OUTPUT = 'table'
+NDJSON_OUTPUT = 'ndjson'
+NO_OUTPUT = 'none'
@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+
+import pymysql.cursors
+
+from config import *
+from sinks import load_pyarrow
+
+
+class ChunkWriter:
+    """
+        Writes the rows of one query to a file, chunk by chunk, so only one chunk is ever held in memory.
+
+        Attributes
+        ----------
+        path : str
+            Export file.
+        columns: list of str
+            Column names of the rows.
+        list_columns: set of str
+            Columns holding EXPORT_LIST_SEPARATOR separated names, written as lists where the format has them.
+        rows: int
+            Number of rows written so far.
+
+        Methods
+        -------
+        write(chunk):
+            Writes a chunk of rows (tuples in column order).
+
+        close():
+            Flushes and closes the file.
+        """
+
+    def __init__(self, path, columns, list_columns=()):
+        """
+        Opens the export file.
+        """
+        self.path = path
+        self.columns = columns
+        self.list_columns = set(list_columns) & set(columns)
+        self.rows = 0
+
+    def split_lists(self, chunk):
+        """
+        :param chunk: list of row tuples
+        :return: list of dictionaries, with the list columns split into lists
+        """
+        records = []
+        for row in chunk:
+            record = dict(zip(self.columns, row))
+            for column in self.list_columns:
+                record[column] = record[column].split(EXPORT_LIST_SEPARATOR) if record[column] else []
+            records.append(record)
+        return records
+
+    def write(self, chunk):
+        """
+        :param chunk: list of row tuples in column order
+        """
+        self.write_chunk(chunk)
+        self.rows += len(chunk)
+
+    def write_chunk(self, chunk):
+        """writes a chunk of rows in the format of the writer"""
+        raise NotImplementedError
+
+    def close(self):
+        """flushes and closes the file"""
+        self.file.close()
+
+
+class CsvWriter(ChunkWriter):
+    """
+        Writes a csv file with a header row. List columns keep their EXPORT_LIST_SEPARATOR separated form.
+        """
+
+    def __init__(self, path, columns, list_columns=()):
+        super().__init__(path, columns, list_columns)
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_chunk(self, chunk):
+        self.writer.writerows(chunk)
+
+
+class JsonLinesWriter(ChunkWriter):
+    """
+        Writes one json object per row.
+        """
+
+    def __init__(self, path, columns, list_columns=()):
+        super().__init__(path, columns, list_columns)
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_chunk(self, chunk):
+        self.file.write(''.join(json.dumps(record, default=str, ensure_ascii=False) + '\n'
+                                for record in self.split_lists(chunk)))
+
+
+class ParquetWriter(ChunkWriter):
+    """
+        Writes a parquet file, one row group per chunk. The schema is taken from the first chunk
+        (columns that are empty in it are written as strings). Needs pyarrow.
+        """
+
+    def __init__(self, path, columns, list_columns=()):
+        pyarrow = load_pyarrow()
+        super().__init__(path, columns, list_columns)
+        self.pyarrow = pyarrow
+        self.writer = None
+
+    def write_chunk(self, chunk):
+        pyarrow = self.pyarrow
+        table = pyarrow.Table.from_pylist(self.split_lists(chunk))
+        if self.writer is None:
+            schema = pyarrow.schema([field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type)
+                                     else field for field in table.schema])
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        pyarrow = self.pyarrow
+        if self.writer is None:  # no rows, still leave a readable file with the columns
+            schema = pyarrow.schema([(column, pyarrow.string()) for column in self.columns])
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, schema)
+        self.writer.close()
+
+
+EXPORT_WRITERS = {CSV_EXPORT: CsvWriter, JSONL_EXPORT: JsonLinesWriter, PARQUET_EXPORT: ParquetWriter}
+
+
+def export_query(connection, sql, path, export_format, chunk_size=EXPORT_CHUNK_SIZE, list_columns=()):
+    """
+    streams the rows of a query to a file with an unbuffered server-side cursor, chunk_size rows at a time
+    :param connection: pymysql connection
+    :param sql: the query
+    :param path: export file
+    :param export_format: CSV_EXPORT, JSONL_EXPORT or PARQUET_EXPORT
+    :param chunk_size: number of rows fetched and written at a time
+    :param list_columns: columns holding EXPORT_LIST_SEPARATOR separated names
+    :return: number of rows exported
+    """
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(sql)
+        writer = EXPORT_WRITERS[export_format](path, [column[0] for column in cursor.description], list_columns)
+        try:
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        finally:
+            writer.close()
+    return writer.rows
+
+
+def export_database(connection, tables, directory, export_format, chunk_size=EXPORT_CHUNK_SIZE, article_view=False):
+    """
+    exports tables (and optionally the denormalized article view) to one file each
+    :param connection: pymysql connection
+    :param tables: names of the tables to export
+    :param directory: export directory (created if needed)
+    :param export_format: CSV_EXPORT, JSONL_EXPORT or PARQUET_EXPORT
+    :param chunk_size: number of rows fetched and written at a time
+    :param article_view: also export one row per article with its summary, authors, tags and categories
+    :return: dictionary of export file -> number of rows
+    """
+    os.makedirs(directory, exist_ok=True)
+    queries = [(table, SELECT_ALL.format(columns=EXPORTED_COLUMNS.get(table, '*'), table=table), ())
+               for table in tables]
+    if article_view:
+        with connection.cursor() as cursor:  # the lists of an article would be cut at 1024 bytes otherwise
+            cursor.execute(RAISE_GROUP_CONCAT_MAX_LEN)
+        queries.append((ARTICLE_VIEW_NAME, ARTICLE_VIEW, ARTICLE_VIEW_LIST_COLUMNS))
+    exported = {}
+    for name, sql, list_columns in queries:
+        path = os.path.join(directory, name + '.' + export_format)
+        exported[path] = export_query(connection, sql, path, export_format, chunk_size, list_columns)
+        sql_logger.info(f'Exported {exported[path]} rows of {name} to {path}.')
+    return exported
@@ -0,0 +1,138 @@
+import json
+from datetime import datetime
+
+from config import *
+
+SCRIPT_ID_MARKER = f'id="{SCRIPT_ID}"'.encode()
+SCRIPT_OPEN = f'<{SCRIPT_TAG}'.encode()
+SCRIPT_CLOSE = f'</{SCRIPT_TAG}>'.encode()
+ARTICLE_FIELDS = (TITLE_TAG, SUMMARY_TAG, AUTHORS_TAG, TAGS_TAG, PUBLISHED_DATE_TAG, TAXONOMY_TAG)
+
+
+def slice_next_data(content):
+    """
+    finds the __NEXT_DATA__ script in the raw page bytes without building a parse tree
+    :param content: page content (bytes)
+    :return: the script payload (bytes) or None if the script could not be located
+    """
+    marker = content.find(SCRIPT_ID_MARKER)
+    if marker == -1:
+        return None
+    tag_start = content.rfind(SCRIPT_OPEN, 0, marker)
+    tag_end = content.find(b'>', marker)
+    if tag_start == -1 or tag_end == -1 or SCRIPT_TYPE.encode() not in content[tag_start:tag_end]:
+        return None
+    payload_end = content.find(SCRIPT_CLOSE, tag_end)
+    if payload_end == -1:
+        return None
+    return content[tag_end + 1:payload_end]
+
+
+def soup_next_data(content):
+    """
+    finds the __NEXT_DATA__ script with BeautifulSoup (slow path, used when slicing fails)
+    :param content: page content (bytes)
+    :return: the script payload (str), or None if the page has no such script (an error or captcha page,
+    a truncated body)
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    script = soup.find(SCRIPT_TAG, id=SCRIPT_ID, type=SCRIPT_TYPE)
+    payload = None if script is None or script.string is None else str(script.string)  # a copy, not a tree node
+    soup.decompose()  # the tree is freed now instead of once its reference cycles are collected
+    return payload
+
+
+def page_properties(payload):
+    """
+    :param payload: __NEXT_DATA__ json text
+    :return: the page properties of the next.js payload
+    """
+    return json.loads(payload)[PROPERTIES_TAG][INITIAL_PROPERTIES_TAG][PAGE_PROPERTIES]
+
+
+def extract_page_properties(content):
+    """
+    extracts the next.js page properties of a page.
+    Slices the json payload straight out of the bytes and only falls back to BeautifulSoup
+    if the fast path cannot find or decode it.
+    :param content: page content (bytes)
+    :return: the page properties (dict), or None if the page carries no readable next.js data
+    """
+    payload = slice_next_data(content)
+    try:
+        return page_properties(payload)
+    except (TypeError, ValueError, KeyError):
+        coin_logger.debug('Fast __NEXT_DATA__ extraction failed, falling back to BeautifulSoup.')
+    payload = soup_next_data(content)
+    try:
+        return page_properties(payload)
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def extract_article_data(content):
+    """
+    extracts the article fields named in config.py from an article page
+    :param content: page content (bytes)
+    :return: dictionary of the article fields, or None if the page is an internal 404 (no data) or has no
+    next.js data at all
+    """
+    props = extract_page_properties(content)
+    if props is None or DATA_TAG not in props:
+        return None
+    data = props[DATA_TAG]
+    return {field: data[field] for field in ARTICLE_FIELDS}
+
+
+def article_link(value):
+    """
+    turns a link found in listing data into an article url
+    :param value: absolute url, site path or slug
+    :return: article url, or None if the value doesn't point to an article page
+    """
+    if not isinstance(value, str) or not value:
+        return None
+    if value.startswith(URL):
+        value = value[len(URL):]
+    elif value.startswith('http'):
+        return None
+    if not value.startswith('/'):
+        value = '/' + value
+    if value.count('/') != 1:  # an article path is a single slug; section hrefs (/markets/) end with a slash
+        return None
+    return URL + value
+
+
+def listing_date(value):
+    """
+    :param value: published date from the listing data
+    :return: datetime, or None if it isn't in PUBLISHED_DATE_FORMAT
+    """
+    try:
+        return datetime.strptime(value[:LISTING_DATE_LENGTH], PUBLISHED_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def listing_entries(props):
+    """
+    walks the page properties of a listing page and collects the articles it embeds,
+    i.e. every object with a publication date and a link
+    :param props: page properties of a listing page
+    :return: list of (url, publication datetime or None) in page order, without duplicates
+    """
+    entries = {}
+    stack = [props]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            if PUBLISHED_DATE_TAG in node:
+                links = (article_link(node.get(tag)) for tag in LISTING_LINK_TAGS)
+                url = next((link for link in links if link is not None), None)
+                if url is not None and url not in entries:
+                    entries[url] = listing_date(node[PUBLISHED_DATE_TAG])
+            stack.extend(reversed(list(node.values())))
+    return list(entries.items())
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from config import *
+
+
+class ConcurrencyGovernor:
+    """
+        An AIMD (additive increase, multiplicative decrease) limit on the requests in flight to one host.
+
+        Attributes
+        ----------
+        host : str
+            Host the limit applies to.
+        limit: int
+            Number of requests currently allowed in flight.
+        in_flight: int
+            Number of requests currently in flight.
+        backoff_until: float
+            time.monotonic() value before which no new request is allowed (set by 429/5xx responses).
+        baseline_latency: float
+            Moving average (EWMA) of the median latency of the rounds, the latency the rounds are compared to.
+        round_peak: int
+            Most requests in flight at once during the current round.
+
+        Methods
+        -------
+        acquire(wanted):
+            Blocks until at least one slot is free and returns the number of slots granted (at most wanted).
+
+        release(latency, status):
+            Frees a slot and records the latency and status of the finished request.
+
+        p95_latency():
+            Returns the 95th percentile latency of the recent requests.
+
+        snapshot():
+            Returns the current limit and observed latency and error figures as a dictionary.
+        """
+
+    def __init__(self, host, initial=GOVERNOR_INITIAL_LIMIT, minimum=GOVERNOR_MIN_LIMIT,
+                 maximum=GOVERNOR_MAX_LIMIT):
+        """
+        Constructs the governor of a host, starting at the initial limit.
+        """
+        self.host = host
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.backoff_until = 0.0
+        self.latencies = deque(maxlen=GOVERNOR_LATENCY_WINDOW)
+        self.baseline_latency = None
+        self.requests = 0
+        self.errors = 0
+        self.round_latencies = []
+        self.round_errors = 0
+        self.round_peak = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, wanted):
+        """
+        waits for free slots (and for any backoff to pass) and takes as many as are free, up to wanted
+        :param wanted: number of requests the caller would like to send
+        :return: number of slots granted (at least 1)
+        """
+        with self.condition:
+            while True:
+                wait = self.backoff_until - time.monotonic()
+                if wait <= 0 and self.in_flight < self.limit:
+                    break
+                self.condition.wait(timeout=wait if wait > 0 else None)
+            granted = max(1, min(wanted, self.limit - self.in_flight))
+            self.in_flight += granted
+            self.round_peak = max(self.round_peak, self.in_flight)
+            return granted
+
+    def release(self, latency, status, retry_after=None):
+        """
+        frees the slot of a finished request and adjusts the limit once a full round of requests finished
+        :param latency: seconds the request took, or None if it failed without a response
+        :param status: http status code, or None if it failed without a response
+        :param retry_after: seconds the server asked us to wait (Retry-After header), if any
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.requests += 1
+            failed = status is None or status == 429 or status >= 500
+            if failed:  # counted once, as an error: its latency says nothing about the host's load
+                self.errors += 1
+                self.round_errors += 1
+                pause = retry_after if retry_after is not None else GOVERNOR_BACKOFF_SECONDS
+                self.backoff_until = max(self.backoff_until, time.monotonic() + pause)
+            elif latency is not None:
+                self.latencies.append(latency)
+                self.round_latencies.append(latency)
+            if len(self.round_latencies) + self.round_errors >= self.limit:
+                self.adjust()
+            self.condition.notify_all()
+
+    def adjust(self):
+        """
+        ends the current round: halves the limit if the round had errors or its median latency rose past the
+        tolerance of the moving baseline, otherwise raises it by one if the round was saturated (its requests in
+        flight reached the limit), so a limit the callers never use doesn't grow towards the maximum. A round only holds about limit requests, so
+        its median is compared rather than a high percentile (which would be the round's slowest request).
+        Must be called while holding the condition.
+        """
+        round_median = percentile(self.round_latencies, 50)
+        rising = (round_median is not None and self.baseline_latency is not None
+                  and round_median > self.baseline_latency * GOVERNOR_LATENCY_TOLERANCE)
+        if self.round_errors or rising:
+            self.limit = max(self.minimum, int(self.limit * GOVERNOR_DECREASE_FACTOR))
+            coin_logger.warning(f'Backing off {self.host}: limit {self.limit}, '
+                                f'{self.round_errors} errors, median {round_median}s.')
+        elif self.round_peak >= self.limit:
+            self.limit = min(self.maximum, self.limit + GOVERNOR_INCREASE_STEP)
+        if round_median is not None:
+            self.baseline_latency = round_median if self.baseline_latency is None else (
+                GOVERNOR_BASELINE_WEIGHT * round_median + (1 - GOVERNOR_BASELINE_WEIGHT) * self.baseline_latency)
+        self.round_latencies = []
+        self.round_errors = 0
+        self.round_peak = self.in_flight
+
+    def p95_latency(self):
+        """:return: 95th percentile latency in seconds of the recent requests (None before the first one)"""
+        with self.condition:
+            return percentile(self.latencies, 95)
+
+    def snapshot(self):
+        """:return: dictionary with the current limit and the observed latency and error figures"""
+        with self.condition:
+            return {
+                'host': self.host,
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'errors': self.errors,
+                'mean_latency': sum(self.latencies) / len(self.latencies) if self.latencies else None,
+                'p95_latency': percentile(self.latencies, 95),
+            }
+
+
+def percentile(values, pct):
+    """
+    nearest-rank percentile
+    :param values: iterable of numbers
+    :param pct: percentile between 0 and 100
+    :return: the percentile, or None if there are no values
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(0, -(-len(ordered) * pct // 100) - 1)
+    return ordered[int(rank)]
+
+
+governors = {}
+governors_lock = threading.Lock()
+
+
+def governor_for(url):
+    """
+    returns the governor of the url's host, creating it on first use
+    :param url: url that is about to be requested
+    :return: ConcurrencyGovernor
+    """
+    host = urlparse(url).netloc
+    with governors_lock:
+        if host not in governors:
+            governors[host] = ConcurrencyGovernor(host)
+        return governors[host]
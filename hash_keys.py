@@ -0,0 +1,46 @@
+import hashlib
+
+from config import *
+
+
+def sql_key(value):
+    """
+    :param value: string compared by mysql
+    :return: the key mysql's case insensitive, trailing space ignoring comparison sees
+    """
+    return value.casefold().rstrip()
+
+
+def content_hash(value):
+    """
+    :param value: url or summary
+    :return: fixed-width digest (HASH_DIGEST_SIZE bytes) of the value's sql_key, so the values mysql
+    compares as equal share a hash
+    """
+    return hashlib.blake2b(sql_key(value).encode(), digest_size=HASH_DIGEST_SIZE).digest()
+
+
+def hash_backfill(table, column, hash_column):
+    """
+    step of a migration filling the hash column of the rows saved before it existed. It pages through the primary
+    key HASH_BACKFILL_CHUNK rows at a time and commits each chunk, so the row locks are only held for one chunk
+    and a backfill stopped halfway carries on where it stopped.
+    :param table: table of the column
+    :param column: text column hashed
+    :param hash_column: hash column filled
+    :return: function of a cursor (dictionary rows) running the backfill
+    """
+    names = dict(table=table, column=column, hash_column=hash_column)
+
+    def backfill(cursor):
+        last_id = 0
+        while True:
+            cursor.execute(SELECT_UNHASHED.format(**names), [last_id, HASH_BACKFILL_CHUNK])
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            cursor.executemany(SET_HASH.format(**names),
+                               [[content_hash(row[LOOKUP_VALUE]), row[ARTICLE_ID]] for row in rows])
+            cursor.connection.commit()
+            last_id = rows[-1][ARTICLE_ID]
+    return backfill
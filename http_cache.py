@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+
+import pymysql
+import pymysql.cursors
+
+from config import *
+from hash_keys import content_hash, sql_key
+
+
+def database_key(host, database):
+    """
+    :param host: url of database server
+    :param database: name of the database
+    :return: the key of the database's validators in the file
+    """
+    return f'{host}/{database}'
+
+
+def read_validators(path):
+    """
+    replays the validators file, compacting it if most of its lines are superseded
+    :param path: json lines file of the validators
+    :return: dictionary of database key -> {url -> validators}
+    """
+    databases = {}
+    lines = 0
+    try:
+        with open(path) as validators_file:
+            for line in validators_file:
+                record = json.loads(line)
+                lines += 1
+                urls = databases.setdefault(record[VALIDATORS_DATABASE_KEY], {})
+                if record.get(VALIDATORS_DROPPED_KEY):
+                    urls.clear()
+                else:
+                    urls[record[VALIDATORS_URL_KEY]] = {ETAG_KEY: record[ETAG_KEY],
+                                                        LAST_MODIFIED_KEY: record[LAST_MODIFIED_KEY]}
+    except (OSError, ValueError, KeyError) as err:
+        coin_logger.warning(f'Could not read {path}, revalidation starts from scratch: {err}')
+        return {}
+    if lines > VALIDATORS_COMPACT_RATIO * max(1, sum(len(urls) for urls in databases.values())):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as validators_file:
+            for key, urls in databases.items():
+                validators_file.writelines(validator_line(key, url, known) for url, known in urls.items())
+        os.replace(temp_path, path)
+    return databases
+
+
+def validator_line(key, url, known):
+    """
+    :param key: database key
+    :param url: article url
+    :param known: {ETAG_KEY: str, LAST_MODIFIED_KEY: str}
+    :return: json line of the validators file
+    """
+    return json.dumps({VALIDATORS_DATABASE_KEY: key, VALIDATORS_URL_KEY: url, **known}) + '\n'
+
+
+def forget_database(host, database, path=VALIDATORS_FILE):
+    """
+    forgets the validators of a database that is dropped or reset, so its urls are never requested conditionally
+    :param host: url of database server
+    :param database: name of the database
+    :param path: json lines file of the validators
+    """
+    if os.path.exists(path):
+        with open(path, 'a') as validators_file:
+            validators_file.write(json.dumps({VALIDATORS_DATABASE_KEY: database_key(host, database),
+                                              VALIDATORS_DROPPED_KEY: True}) + '\n')
+
+
+class ValidatorStore:
+    """
+        A file-backed store of the ETag / Last-Modified validators of the article urls saved to one mysql
+        database, used by --revalidate.
+
+        Validators of a downloaded page are only staged; they are kept (and appended to the file)
+        once the article is committed to the database. Before a batch is requested, the database is asked
+        which of its urls are stored, and only those are requested conditionally, so a 304 never stands
+        for an article the database doesn't hold (after a reset, or with another -db / -host).
+
+        Attributes
+        ----------
+        path : str
+            Json lines file holding the validators of every database.
+        key: str
+            Host and name of the database.
+        connection: pymysql connection
+            Connection to the database, confirming which urls are stored.
+        validators: dict
+            url -> {ETAG_KEY: str, LAST_MODIFIED_KEY: str} of the committed articles.
+        staged: dict
+            Validators of downloaded articles that were not committed yet.
+
+        Methods
+        -------
+        conditional_headers(urls):
+            Returns the If-None-Match / If-Modified-Since headers of the stored urls of a batch.
+
+        stage(url, response):
+            Keeps the validators of a downloaded page until the article is committed.
+
+        commit(urls):
+            Stores the staged validators of the committed urls and appends them to the file.
+
+        close():
+            Closes the connection.
+        """
+
+    def __init__(self, host, database, connection, path=VALIDATORS_FILE):
+        """
+        Loads the validators previous runs saved for the database.
+        """
+        self.path = path
+        self.key = database_key(host, database)
+        self.connection = connection
+        self.validators = read_validators(path).get(self.key, {}) if os.path.exists(path) else {}
+        self.staged = {}
+        self.lock = threading.Lock()
+
+    def conditional_headers(self, urls):
+        """
+        :param urls: article urls of a batch
+        :return: dictionary of url -> conditional request headers, for the urls with validators the database
+        confirms are stored
+        """
+        with self.lock:
+            known = {url: self.validators[url] for url in urls if url in self.validators}
+            if not known:
+                return {}
+            self.connection.ping(reconnect=True)
+            with self.connection.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute(FIND_STORED_URLS.format(', '.join(['%s'] * len(known))),
+                               [content_hash(url) for url in known])
+                stored = {sql_key(row[0]) for row in cursor.fetchall()}
+        headers = {}
+        for url, validators in known.items():
+            if sql_key(url) not in stored:
+                continue
+            headers[url] = {}
+            if validators.get(ETAG_KEY):
+                headers[url]['If-None-Match'] = validators[ETAG_KEY]
+            if validators.get(LAST_MODIFIED_KEY):
+                headers[url]['If-Modified-Since'] = validators[LAST_MODIFIED_KEY]
+        return headers
+
+    def stage(self, url, response):
+        """
+        keeps the validators of a downloaded page until its article is committed
+        :param url: article url
+        :param response: requests response (200)
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            with self.lock:
+                self.staged[url] = {ETAG_KEY: etag, LAST_MODIFIED_KEY: last_modified}
+
+    def commit(self, urls):
+        """
+        stores the staged validators of the committed urls and appends them to the file
+        :param urls: urls of the articles that were committed to the database
+        """
+        with self.lock:
+            committed = [url for url in urls if url in self.staged]
+            if not committed:
+                return
+            for url in committed:
+                self.validators[url] = self.staged.pop(url)
+            with open(self.path, 'a') as validators_file:
+                validators_file.writelines(validator_line(self.key, url, self.validators[url]) for url in committed)
+
+    def close(self):
+        """closes the connection"""
+        self.connection.close()
+
+
+def is_revalidation(response):
+    """
+    :param response: requests response
+    :return: boolean if the request carried validators, i.e. a 200 answer means the page changed
+    """
+    headers = response.request.headers
+    return 'If-None-Match' in headers or 'If-Modified-Since' in headers
@@ -0,0 +1,130 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pymysql
+import pymysql.cursors
+
+from config import *
+
+
+class IdCache:
+    """
+        A bounded name -> id cache of one dimension table (Authors, Tags or Categories),
+        evicting the least recently used names.
+
+        Attributes
+        ----------
+        table : str
+            Name of the cached table.
+        max_size: int
+            Number of names kept.
+        hits: int
+            Lookups answered from the cache.
+        misses: int
+            Lookups that had to go to the database.
+
+        Methods
+        -------
+        get(name):
+            Returns the cached id of a name, or None.
+
+        put(name, row_id):
+            Caches the id of a name.
+
+        preload(connection):
+            Fills the cache with the most recent rows of the table in one query.
+
+        hit_rate():
+            Returns the share of lookups answered from the cache.
+        """
+
+    def __init__(self, table, preload_sql, max_size=ID_CACHE_SIZE):
+        """
+        Constructs an empty cache of a table.
+        """
+        self.table = table
+        self.preload_sql = preload_sql
+        self.max_size = max_size
+        self.ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """
+        :param name: author name, tag or category
+        :return: id of the row, or None if the name is not cached
+        """
+        with self.lock:
+            row_id = self.ids.get(name)
+            if row_id is None:
+                self.misses += 1
+                return None
+            self.ids.move_to_end(name)
+            self.hits += 1
+            return row_id
+
+    def put(self, name, row_id):
+        """
+        caches the id of a name, evicting the least recently used name if the cache is full
+        :param name: author name, tag or category
+        :param row_id: id of its row
+        """
+        with self.lock:
+            self.ids[name] = row_id
+            self.ids.move_to_end(name)
+            if len(self.ids) > self.max_size:
+                self.ids.popitem(last=False)
+
+    def preload(self, connection):
+        """
+        fills the cache with the most recent rows of the table
+        :param connection: pymysql connection
+        """
+        with connection.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(self.preload_sql, [self.max_size])
+            rows = cursor.fetchall()
+        for row_id, name in reversed(rows):  # oldest first, so the newest rows are the last evicted
+            self.put(name, row_id)
+
+    def hit_rate(self):
+        """:return: share of lookups answered from the cache (0 before the first lookup)"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return f'{self.table} id cache: {len(self.ids)} names, hit rate {self.hit_rate():.1%} ' \
+               f'({self.hits} hits, {self.misses} misses)'
+
+
+def dimension_caches():
+    """
+    :return: dictionary of table name -> empty IdCache for Authors, Tags and Categories
+    """
+    return {
+        AUTHORS_TABLE: IdCache(AUTHORS_TABLE, SELECT_RECENT_AUTHORS),
+        TAGS_TABLE: IdCache(TAGS_TABLE, SELECT_RECENT_TAGS),
+        CATEGORIES_TABLE: IdCache(CATEGORIES_TABLE, SELECT_RECENT_CATEGORIES),
+    }
+
+
+def preload_caches(caches, host, user, password, database):
+    """
+    fills the id caches from the database in bulk, one query per table
+    :param caches: dictionary of table name -> IdCache
+    :param host: url of database server
+    :param user: username of mysql
+    :param password: password of mysql
+    :param database: database to read from
+    """
+    try:
+        with pymysql.connect(host=host, user=user, password=password, database=database) as connection_instance:
+            for cache in caches.values():
+                cache.preload(connection_instance)
+    except pymysql.err.Error as err:
+        print(err.args, file=sys.stderr)
+        coin_logger.error(err.args)
+        exit(1)
+    coin_logger.info('Preloaded id caches: ' + ', '.join(f'{table} {len(cache.ids)}'
+                                                          for table, cache in caches.items()))
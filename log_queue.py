@@ -0,0 +1,130 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+
+# extra= of the records the RateLimitFilter never drops (the per-batch summaries)
+UNLIMITED_ATTRIBUTE = 'unlimited'
+UNLIMITED = {UNLIMITED_ATTRIBUTE: True}
+
+
+class RateLimitFilter(logging.Filter):
+    """
+        Lets through at most limit records per window seconds from each call site (one message type), so a message
+        logged for every article or link can't flood the log. Records at level or above always pass, as do the
+        records logged with extra=UNLIMITED. The number of records dropped in a window is added to the first record
+        let through after it.
+
+        Attributes
+        ----------
+        limit : int
+            Records let through per call site and window.
+        window: float
+            Seconds of a window.
+        level: int
+            Level from which records are never dropped.
+        sites: dict
+            (file, line) of a call site -> [start of its window, records let through, records dropped].
+        """
+
+    def __init__(self, limit, window, level=logging.ERROR):
+        """
+        Constructs a filter with no call site seen yet.
+        """
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.level = level
+        self.sites = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        """
+        :param record: LogRecord
+        :return: boolean if the record is logged
+        """
+        if record.levelno >= self.level or getattr(record, UNLIMITED_ATTRIBUTE, False):
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            site = self.sites.get(key)
+            dropped = 0
+            if site is None or record.created - site[0] >= self.window:
+                dropped = site[2] if site is not None else 0
+                site = self.sites[key] = [record.created, 0, 0]
+            if site[1] >= self.limit:
+                site[2] += 1
+                return False
+            site[1] += 1
+        if dropped:
+            record.msg = f'{record.msg} ({dropped} more like it were dropped in the previous {self.window:g}s)'
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+        Hands the records to a queue, which a background thread writes to the log handlers. The thread is only
+        started by the first record queued, so importing the loggers (or running with -h) starts no thread, and it
+        is stopped (the queue drained) by stop() or when the interpreter exits.
+
+        Attributes
+        ----------
+        targets : list
+            Handlers writing the records of the queue.
+        listener: QueueListener or None
+            Thread writing the queue, None until the first record.
+
+        Methods
+        -------
+        stop():
+            Writes the records left in the queue and stops the thread.
+        """
+
+    def __init__(self, log_queue, targets):
+        """
+        Constructs a handler with no thread started yet.
+        """
+        super().__init__(log_queue)
+        self.targets = targets
+        self.listener = None
+
+    def enqueue(self, record):
+        """
+        :param record: LogRecord, prepared for the queue
+        """
+        with self.lock:
+            if self.listener is None:
+                self.listener = logging.handlers.QueueListener(self.queue, *self.targets,
+                                                               respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.stop)
+        super().enqueue(record)
+
+    def stop(self):
+        """writes the records left in the queue and stops the thread (a later record starts it again)"""
+        with self.lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+
+def queue_logging(routes, rate_limit, rate_window):
+    """
+    makes the loggers hand their records to a queue, which a background thread writes to the log files, so a
+    caller never waits for the disk. The records of each call site are rate limited (RateLimitFilter) before
+    they are queued. The thread is started by the first record (LazyQueueHandler).
+    :param routes: list of (logger, handler): the records of each logger are written by its handler
+    :param rate_limit: records let through per call site and window
+    :param rate_window: seconds of a window
+    :return: the LazyQueueHandler of the loggers
+    """
+    handlers = []
+    for logger, handler in routes:
+        handler.addFilter(logging.Filter(logger.name))  # the listener passes every record to every handler
+        handlers.append(handler)
+    queue_handler = LazyQueueHandler(queue.SimpleQueue(), handlers)
+    queue_handler.addFilter(RateLimitFilter(rate_limit, rate_window))
+    for logger, _ in routes:
+        logger.addHandler(queue_handler)
+    return queue_handler
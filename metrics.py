@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from config import *
+
+
+class RunMetrics:
+    """
+        Counters and timings of one scraper run, cheap enough to be always on
+        (a lock and a few additions per batch or request).
+
+        Stage times add up the wall time every thread spent in a stage, so concurrent stages
+        (several fetch workers) may add up to more than the run took.
+
+        Attributes
+        ----------
+        stage_seconds : dict
+            Stage name -> seconds spent in it.
+        stage_calls: Counter
+            Stage name -> number of times it ran.
+        latency_buckets: list of int
+            Number of page requests per FETCH_LATENCY_BUCKETS bucket (the last one is +Inf).
+        bytes_downloaded: int
+            Bytes of the pages downloaded.
+        responses: Counter
+            Http status -> number of responses ('none' for failed requests).
+        rows: Counter
+            Table -> number of rows inserted.
+        counters: Counter
+            Event -> number of times it happened (METRIC_* names: duplicates skipped, 404s, ...).
+
+        Methods
+        -------
+        stage(name):
+            Context manager timing a stage.
+
+        observe_fetch(latency, status, size):
+            Records one downloaded page.
+
+        count(event, amount):
+            Adds to an event counter.
+
+        add_tally(tally):
+            Adds the rows a committed batch inserted per table, and the events it counted.
+
+        report():
+            Returns the metrics as a dictionary.
+
+        prometheus():
+            Returns the metrics in the Prometheus text exposition format.
+
+        save(report_path, prometheus_path):
+            Writes the json report and the Prometheus text file.
+        """
+
+    def __init__(self):
+        """
+        Constructs empty metrics, starting the run clock.
+        """
+        self.started = time.time()
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = Counter()
+        self.latency_buckets = [0] * (len(FETCH_LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.bytes_downloaded = 0
+        self.responses = Counter()
+        self.rows = Counter()
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        times the code run inside the with block as part of a stage
+        :param name: stage name (STAGE_* of config.py)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stage_seconds[name] += elapsed
+                self.stage_calls[name] += 1
+
+    def observe_fetch(self, latency, status, size):
+        """
+        records one finished request
+        :param latency: seconds the request took, or None if it failed without a response
+        :param status: http status code, or None if it failed without a response
+        :param size: bytes of the response body
+        """
+        with self.lock:
+            self.responses[str(status).lower()] += 1
+            self.bytes_downloaded += size
+            if latency is not None:
+                self.latency_buckets[bisect_left(FETCH_LATENCY_BUCKETS, latency)] += 1
+                self.latency_sum += latency
+
+    def count(self, event, amount=1):
+        """
+        :param event: event name (METRIC_* of config.py)
+        :param amount: number of times it happened
+        """
+        if amount:
+            with self.lock:
+                self.counters[event] += amount
+
+    def add_tally(self, tally):
+        """
+        :param tally: Counter of table -> rows inserted and METRIC_EVENTS event -> count, of a committed batch
+        """
+        with self.lock:
+            for key, amount in tally.items():
+                (self.counters if key in METRIC_EVENTS else self.rows)[key] += amount
+
+    def report(self):
+        """:return: dictionary of the metrics, as written to the json report"""
+        with self.lock:
+            return {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'wall_seconds': round(time.time() - self.started, 3),
+                'stages': {name: {'seconds': round(seconds, 3), 'calls': self.stage_calls[name]}
+                           for name, seconds in self.stage_seconds.items()},
+                'fetch_latency': {
+                    'buckets': dict(zip([str(bound) for bound in FETCH_LATENCY_BUCKETS] + ['+Inf'],
+                                        self.latency_buckets)),
+                    'count': sum(self.latency_buckets),
+                    'sum_seconds': round(self.latency_sum, 3),
+                },
+                'bytes_downloaded': self.bytes_downloaded,
+                'responses': dict(self.responses),
+                'rows_inserted': dict(self.rows),
+                'counters': dict(self.counters),
+            }
+
+    def prometheus(self):
+        """:return: the metrics in the Prometheus text exposition format"""
+        with self.lock:
+            lines = [f'# HELP {METRICS_PREFIX}_stage_seconds_total Wall time spent in each scraper stage.',
+                     f'# TYPE {METRICS_PREFIX}_stage_seconds_total counter']
+            lines += [f'{METRICS_PREFIX}_stage_seconds_total{{stage="{name}"}} {seconds:.6f}'
+                      for name, seconds in sorted(self.stage_seconds.items())]
+            lines += [f'# HELP {METRICS_PREFIX}_fetch_latency_seconds Latency of the page requests.',
+                      f'# TYPE {METRICS_PREFIX}_fetch_latency_seconds histogram']
+            cumulative = 0
+            for bound, observed in zip([str(bound) for bound in FETCH_LATENCY_BUCKETS] + ['+Inf'],
+                                       self.latency_buckets):
+                cumulative += observed
+                lines.append(f'{METRICS_PREFIX}_fetch_latency_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f'{METRICS_PREFIX}_fetch_latency_seconds_sum {self.latency_sum:.6f}',
+                      f'{METRICS_PREFIX}_fetch_latency_seconds_count {cumulative}',
+                      f'# HELP {METRICS_PREFIX}_downloaded_bytes_total Bytes of the pages downloaded.',
+                      f'# TYPE {METRICS_PREFIX}_downloaded_bytes_total counter',
+                      f'{METRICS_PREFIX}_downloaded_bytes_total {self.bytes_downloaded}',
+                      f'# HELP {METRICS_PREFIX}_responses_total Responses per http status.',
+                      f'# TYPE {METRICS_PREFIX}_responses_total counter']
+            lines += [f'{METRICS_PREFIX}_responses_total{{status="{status}"}} {count}'
+                      for status, count in sorted(self.responses.items())]
+            lines += [f'# HELP {METRICS_PREFIX}_rows_inserted_total Rows inserted per table.',
+                      f'# TYPE {METRICS_PREFIX}_rows_inserted_total counter']
+            lines += [f'{METRICS_PREFIX}_rows_inserted_total{{table="{table}"}} {count}'
+                      for table, count in sorted(self.rows.items())]
+            for event, count in sorted(self.counters.items()):
+                lines += [f'# TYPE {METRICS_PREFIX}_{event}_total counter',
+                          f'{METRICS_PREFIX}_{event}_total {count}']
+        return '\n'.join(lines) + '\n'
+
+    def save(self, report_path=METRICS_REPORT_FILE, prometheus_path=METRICS_PROMETHEUS_FILE):
+        """
+        writes the json report and the Prometheus text file, each replaced atomically
+        so a scraper (e.g. node_exporter's textfile collector) never reads half a file
+        :param report_path: json report file
+        :param prometheus_path: Prometheus text file
+        """
+        for path, text in ((report_path, json.dumps(self.report(), indent=2) + '\n'),
+                           (prometheus_path, self.prometheus())):
+            temp_path = path + '.tmp'
+            with open(temp_path, 'w') as metrics_file:
+                metrics_file.write(text)
+            os.replace(temp_path, path)
+        coin_logger.info(f'Saved run metrics to {report_path} and {prometheus_path}.')
+
+
+run_metrics = RunMetrics()  # metrics of the current run, shared by every stage
@@ -0,0 +1,345 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from datetime import date, datetime
+
+import pymysql.cursors
+import pymysql.err
+
+from config import *
+from hash_keys import hash_backfill
+from metrics import run_metrics
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, date.isoformat)
+
+
+class StorageSink:
+    """
+        Where the writers save the article batches. Every sink writes a whole batch at once.
+
+        Methods
+        -------
+        write_batch(articles):
+            Saves a batch of articles and returns the number saved.
+
+        close():
+            Flushes and releases the sink.
+        """
+
+    def write_batch(self, articles):
+        """
+        :param articles: ArticleBatch
+        :return: number of articles saved
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """flushes and releases the sink"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DatabaseSink(StorageSink):
+    """
+        Saves the batches to the normalized schema of config.py, over a MySQL connection or a SQLiteConnection.
+        The batches of the writers sharing the sink are saved one at a time.
+        """
+
+    def __init__(self, connection, insert_batch, caches=None):
+        """
+        :param connection: pymysql connection, or SQLiteConnection
+        :param insert_batch: function saving a batch over the connection (insert_batch of Coindesk-Scraper.py)
+        :param caches: dictionary of table name -> IdCache, or None
+        """
+        self.connection = connection
+        self.insert_batch = insert_batch
+        self.caches = caches
+        self.lock = threading.Lock()
+
+    def write_batch(self, articles):
+        with self.lock:
+            return self.insert_batch(articles, self.connection, self.caches)
+
+    def close(self):
+        self.connection.close()
+
+
+def article_columns(articles):
+    """
+    :param articles: ArticleBatch
+    :return: dictionary of the batch columns, in the column order of ARTICLE_COLUMNS
+    """
+    return dict(zip(ARTICLE_COLUMNS, (articles.titles, articles.summaries, articles.links, articles.published,
+                                      articles.authors, articles.tags, articles.categories)))
+
+
+def article_record(articles, index):
+    """
+    :param articles: ArticleBatch
+    :param index: index of the article in the batch
+    :return: dictionary of the article fields, in the column order of ARTICLE_COLUMNS
+    """
+    return {column: values[index] for column, values in article_columns(articles).items()}
+
+
+def ndjson_lines(articles):
+    """
+    :param articles: ArticleBatch
+    :return: one json object per article, each on its own line (str)
+    """
+    return ''.join(json.dumps(article_record(articles, index), default=str, ensure_ascii=False) + '\n'
+                   for index in range(len(articles)))
+
+
+class FileSink(StorageSink):
+    """
+        Appends the batches of a run to one file, shared by the writers.
+        Articles already written in the run are skipped.
+
+        Attributes
+        ----------
+        path : str
+            File of the run.
+        written: set
+            Urls of the articles written so far.
+        """
+
+    def __init__(self, path):
+        """
+        :param path: file of the run (its directory is created if needed)
+        """
+        self.path = path
+        self.written = set()
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write_batch(self, articles):
+        with self.lock:
+            kept = []
+            for index, link in enumerate(articles.links):
+                if link in self.written:
+                    continue
+                self.written.add(link)
+                kept.append(index)
+            if kept:
+                self.write_records(articles.select(kept))
+        run_metrics.add_tally(Counter({ARTICLES_TABLE: len(kept),
+                                       METRIC_DUPLICATES_SKIPPED: len(articles) - len(kept)}))
+        coin_logger.info(f'Saved {len(kept)} articles to {self.path}.')
+        return len(kept)
+
+    def write_records(self, articles):
+        """
+        writes the articles not written yet (called under the sink lock)
+        :param articles: ArticleBatch
+        """
+        raise NotImplementedError
+
+
+class JsonLinesSink(FileSink):
+    """
+        Writes one json object per article (pandas.read_json(path, lines=True) loads the file).
+        """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write_records(self, articles):
+        self.file.write(ndjson_lines(articles))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def load_pyarrow():
+    """
+    imports pyarrow when a parquet file is opened (the parquet sink or export), since it is optional
+    :return: the pyarrow module, with pyarrow.parquet loaded
+    """
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet files need pyarrow: pip install pyarrow')
+    return pyarrow
+
+
+class ParquetSink(FileSink):
+    """
+        Writes the articles as a parquet file, one row group per batch (pandas.read_parquet(path) loads it).
+        Needs pyarrow.
+        """
+
+    def __init__(self, path):
+        pyarrow = load_pyarrow()
+        super().__init__(path)
+        self.pyarrow = pyarrow
+        names = pyarrow.list_(pyarrow.string())
+        self.schema = pyarrow.schema([(ARTICLE_TITLE, pyarrow.string()), (ARTICLE_SUMMARY, pyarrow.string()),
+                                      (ARTICLE_URL, pyarrow.string()), (ARTICLE_PUBLISHED, pyarrow.timestamp('s')),
+                                      (ARTICLE_AUTHORS, names), (ARTICLE_TAGS, names), (ARTICLE_CATEGORIES, names)])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_records(self, articles):
+        self.writer.write_table(self.pyarrow.Table.from_pydict(article_columns(articles), schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def run_file(directory, extension):
+    """
+    :param directory: directory of the run files
+    :param extension: file extension of the sink
+    :return: path of a new file named after the start of the run
+    """
+    return os.path.join(directory, f'{RUN_FILE_PREFIX}{datetime.now().strftime(RUN_FILE_TIME_FORMAT)}{extension}')
+
+
+def sqlite_statement(sql):
+    """
+    :param sql: mysql statement of config.py
+    :return: the sqlite equivalent
+    """
+    sql = re.sub(r'ON DUPLICATE KEY UPDATE (\w+) = \1 \+ VALUES\(\1\)',  # counters of the aggregate tables
+                 r'ON CONFLICT DO UPDATE SET \1 = \1 + excluded.\1', sql)
+    sql = re.sub(r'ON DUPLICATE KEY UPDATE .*', 'ON CONFLICT DO NOTHING', sql, flags=re.S)
+    sql = re.sub(r'(VARCHAR\(\d+\))', r'\1 COLLATE NOCASE', sql, flags=re.I)  # mysql compares names case-insensitively
+    return sql.replace('%s', '?').replace('INT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+
+
+class SQLiteCursor:
+    """
+    The subset of the pymysql cursor the scraper uses, over a sqlite cursor.
+    """
+
+    def __init__(self, connection, dictionary_rows):
+        self.connection = connection
+        self.cursor = connection.database.cursor()
+        self.dictionary_rows = dictionary_rows
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def run(self, method, sql, args):
+        self.connection.statements += 1
+        try:
+            method(sqlite_statement(sql), args)
+        except sqlite3.IntegrityError as err:
+            raise pymysql.err.IntegrityError(*err.args)
+        except sqlite3.Error as err:
+            raise pymysql.err.OperationalError(*err.args)
+        self.lastrowid = self.cursor.lastrowid
+        self.rowcount = self.cursor.rowcount
+
+    def execute(self, sql, args=None):
+        if args is None:
+            args = []
+        elif isinstance(args, (str, int)):
+            args = [args]
+        self.run(self.cursor.execute, sql, list(args))
+
+    def executemany(self, sql, rows):
+        self.run(self.cursor.executemany, sql, [list(row) for row in rows])
+
+    def row(self, values):
+        if values is None or not self.dictionary_rows:
+            return values
+        return dict(zip([column[0] for column in self.cursor.description], values))
+
+    def fetchone(self):
+        return self.row(self.cursor.fetchone())
+
+    def fetchall(self):
+        return [self.row(values) for values in self.cursor.fetchall()]
+
+    def fetchmany(self, size):
+        return [self.row(values) for values in self.cursor.fetchmany(size)]
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def __iter__(self):
+        return (self.row(values) for values in self.cursor)
+
+
+class SQLiteConnection:
+    """
+        A SQLite database with the scraper's schema (as it is after the migrations of sql_script.py, the hash
+        keys are added to a file created before them),
+        answering the pymysql connection calls of the write path, so insert_batch saves to it unchanged.
+        Errors are raised as the pymysql errors the write path handles.
+
+        Attributes
+        ----------
+        path : str
+            Database file, or ':memory:'.
+        statements : int
+            Number of statements executed.
+        """
+
+    def __init__(self, path=':memory:'):
+        """
+        Opens the database, creating the tables and keys that don't exist yet.
+        """
+        self.path = path
+        self.database = sqlite3.connect(path, check_same_thread=False)
+        self.statements = 0
+        for creation in (AUTHORS_CREATION, SUMMARIES_CREATION, CATEGORIES_CREATION, TAGS_CREATION,
+                         ARTICLES_CREATION, TAGS_ARTICLES_RELATIONSHIP_CREATION,
+                         AUTHORS_ARTICLES_RELATIONSHIP_CREATION, CATEGORIES_ARTICLES_RELATIONSHIP_CREATION):
+            self.database.execute(sqlite_statement(creation))
+        for table, _, column, _ in AGGREGATES:
+            self.database.execute(AGGREGATE_CREATION.format(table=table, column=column))
+        for table, columns in SQLITE_UNIQUE_KEYS:
+            self.database.execute(SQLITE_UNIQUE_INDEX.format(table=table, columns=columns))
+        for table, column, hash_column in HASH_KEYS:
+            names = dict(table=table, column=column, hash_column=hash_column)
+            if hash_column not in [row[1] for row in self.database.execute(f'PRAGMA table_info({table})')]:
+                self.database.execute(ADD_HASH_COLUMN.format(**names))
+                with self.cursor() as cursor:  # a file saved before the hash keys
+                    hash_backfill(table, column, hash_column)(cursor)
+            self.database.execute(SQLITE_HASH_KEY.format(**names))
+        self.database.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def cursor(self, cursor_class=None):
+        return SQLiteCursor(self, cursor_class in (None, pymysql.cursors.DictCursor, pymysql.cursors.SSDictCursor))
+
+    def ping(self, reconnect=False):
+        pass
+
+    def commit(self):
+        self.database.commit()
+
+    def rollback(self):
+        self.database.rollback()
+
+    def close(self):
+        self.database.close()
+
+    def count(self, table):
+        """:return: number of rows of a table"""
+        return self.database.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
@@ -0,0 +1,171 @@
+import hashlib
+import math
+import threading
+
+import pymysql
+import pymysql.cursors
+
+from config import *
+from hash_keys import content_hash, sql_key
+
+
+class BloomFilter:
+    """
+        A compact set of strings with no false negatives and a bounded rate of false positives.
+
+        Attributes
+        ----------
+        size : int
+            Number of bits.
+        hashes: int
+            Number of bit positions set per item.
+        bits: bytearray
+            The bit array.
+
+        Methods
+        -------
+        add(item):
+            Adds a string to the filter.
+        """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        """
+        Sizes the filter for capacity items at the given false positive rate.
+        """
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        """
+        :param item: string
+        :return: the bit positions of the item (double hashing over one blake2b digest)
+        """
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        """adds a string to the filter"""
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class KnownUrlIndex:
+    """
+        The urls already stored in the Articles table, loaded once at startup so links can be skipped
+        before their pages are downloaded.
+
+        Small tables are held as a set. Above KNOWN_URLS_SET_LIMIT rows a Bloom filter is used instead,
+        and its positives are confirmed with a single query per batch of links, so a new article is
+        never skipped by mistake.
+
+        Methods
+        -------
+        filter_new(links, connection):
+            Returns the links that are not stored yet, in their original order.
+
+        add(urls):
+            Adds urls stored since the index was loaded.
+        """
+
+    def __init__(self, urls, count):
+        """
+        Builds the index from an iterable of count stored urls.
+        """
+        self.count = count
+        self.exact = count <= KNOWN_URLS_SET_LIMIT
+        if self.exact:
+            self.urls = set(urls)
+        else:
+            self.urls = BloomFilter(count)
+            for url in urls:
+                self.urls.add(url)
+
+    def filter_new(self, links, connection=None):
+        """
+        :param links: list of article urls
+        :param connection: pymysql connection used to confirm Bloom filter positives
+        :return: the links that are not stored yet, in their original order
+        """
+        maybe_known = [link for link in links if link in self.urls]
+        if self.exact or not maybe_known:
+            known = set(maybe_known)
+        else:
+            with connection.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute(FIND_STORED_URLS.format(', '.join(['%s'] * len(maybe_known))),
+                               [content_hash(link) for link in maybe_known])
+                stored = {sql_key(row[0]) for row in cursor.fetchall()}
+            known = {link for link in maybe_known if sql_key(link) in stored}
+        return [link for link in links if link not in known]
+
+    def add(self, urls):
+        """adds urls stored since the index was loaded"""
+        for url in urls:
+            self.urls.add(url)
+
+
+def load_known_urls(connection):
+    """
+    streams the urls of the Articles table into a KnownUrlIndex
+    :param connection: pymysql connection
+    :return: KnownUrlIndex
+    """
+    with connection.cursor(pymysql.cursors.Cursor) as cursor:
+        cursor.execute(COUNT_ARTICLES)
+        count = cursor.fetchone()[0]
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(SELECT_ARTICLE_URLS)
+        index = KnownUrlIndex((row[0] for row in cursor), count)
+    coin_logger.info(f'Loaded {count} stored article urls ({"set" if index.exact else "bloom filter"}).')
+    return index
+
+
+class StoredLinks:
+    """
+        The articles a database storage already holds, for the whole run: the stored urls are loaded once,
+        and the links the listings find (also while they are still scrolling) are filtered against them.
+
+        Methods
+        -------
+        filter_new(links):
+            Returns the links that are not stored yet, in their original order.
+
+        add(links):
+            Records the links of articles saved during the run.
+
+        close():
+            Closes the connection.
+        """
+
+    def __init__(self, connection):
+        """
+        Loads the stored urls over a connection that is kept to confirm Bloom filter positives.
+        """
+        self.connection = connection
+        self.index = load_known_urls(connection)
+        self.lock = threading.Lock()
+
+    def filter_new(self, links):
+        """
+        :param links: list of article urls
+        :return: the links that are not stored yet, in their original order
+        """
+        with self.lock:
+            self.connection.ping(reconnect=True)
+            return self.index.filter_new(list(links), self.connection)
+
+    def add(self, links):
+        """
+        :param links: list of the urls of articles saved during the run
+        """
+        with self.lock:
+            self.index.add(links)
+
+    def close(self):
+        """closes the connection"""
+        self.connection.close()
@@ -1,7 +1,9 @@
 import pymysql
 import argparse
-import pandas as pd
 from config import *
+from exporter import export_database
+from hash_keys import hash_backfill
+from http_cache import forget_database
 # pd.set_option('display.max_rows', None)
 
 
@@ -35,6 +37,218 @@ def initialize_database(user, password, host, database):
             sql_logger.info("Created author-articles Relationship table if doesn't exist already.")
             cursor_instance.execute(CATEGORIES_ARTICLES_RELATIONSHIP_CREATION)
             sql_logger.info("Created categories-articles Relationship table if doesn't exist already.")
+            for table, _, column, _ in AGGREGATES:
+                cursor_instance.execute(AGGREGATE_CREATION.format(table=table, column=column))
+                sql_logger.info(f"Created {table} aggregate table if doesn't exist already.")
+            cursor_instance.execute(SCHEMA_MIGRATIONS_CREATION)
+            sql_logger.info("Created schema migrations table if doesn't exist already.")
+
+
+def dimension_migration(table, column, links, link_column):
+    """
+    statements making the names of a dimension table unique: the links of duplicate names are pointed
+    at the oldest row, the duplicates are deleted and a unique index is added (unless it was already)
+    :param table: dimension table
+    :param column: name column
+    :param links: relationship table of the dimension
+    :param link_column: id column of the dimension in the relationship table
+    :return: list of sql statements and steps
+    """
+    names = dict(table=table, column=column, links=links, link_column=link_column)
+    return [REPOINT_DUPLICATE_NAMES.format(**names), DELETE_DUPLICATE_NAMES.format(**names),
+            unless_found(FIND_INDEX.format(**names), [UNIQUE_NAME_INDEX.format(**names)],
+                         ADD_UNIQUE_NAME.format(**names))]
+
+
+def relationship_migration(table, column):
+    """
+    statements keeping one row per pair of a relationship table and adding its composite primary key
+    and an index for the lookups from the partner to the articles (unless they were already)
+    :param table: relationship table
+    :param column: id column of the partner table
+    :return: list of sql statements and steps
+    """
+    names = dict(table=table, column=column)
+    return [statement.format(**names) for statement in (COPY_DISTINCT_LINKS, DELETE_LINKS, RESTORE_DISTINCT_LINKS,
+                                                        DROP_DISTINCT_LINKS)] + [
+        unless_found(FIND_INDEX.format(**names), [PRIMARY_KEY_INDEX], ADD_LINK_PRIMARY_KEY.format(**names)),
+        unless_found(FIND_INDEX.format(**names), [LINK_ARTICLE_INDEX.format(**names)],
+                     ADD_LINK_ARTICLE_INDEX.format(**names))]
+
+
+def aggregate_rebuild():
+    """
+    statements recomputing every aggregate table from the articles and their relationship tables
+    :return: list of sql statements
+    """
+    statements = []
+    for table, links, column, period in AGGREGATES:
+        names = dict(table=table, links=links, column=column, period=PERIOD_SQL[period])
+        statements += [CLEAR_AGGREGATE.format(**names), BACKFILL_AGGREGATE.format(**names)]
+    return statements
+
+
+def aggregate_migration():
+    """
+    steps adding the period index of every aggregate table (unless it was already) and filling the tables
+    :return: list of steps and sql statements
+    """
+    steps = []
+    for table, _, column, _ in AGGREGATES:
+        names = dict(table=table, column=column)
+        steps.append(unless_found(FIND_INDEX.format(**names), [PERIOD_INDEX.format(**names)],
+                                  ADD_PERIOD_INDEX.format(**names)))
+    return steps + aggregate_rebuild()
+
+
+def unless_found(check_sql, check_args, statement):
+    """
+    step of a migration running a statement only if a check finds no row, so the migration can be run again
+    after it stopped halfway (mysql commits every ALTER TABLE)
+    :param check_sql: query finding the column or index the statement adds
+    :param check_args: arguments of the query
+    :param statement: sql statement
+    :return: function of a cursor running the step
+    """
+    def step(cursor):
+        cursor.execute(check_sql, check_args)
+        if not cursor.fetchall():
+            cursor.execute(statement)
+    return step
+
+
+def if_found(check_sql, check_args, statement):
+    """
+    step of a migration running a statement only if a check finds a row (the column or index it drops)
+    :param check_sql: query finding the column or index
+    :param check_args: arguments of the query
+    :param statement: sql statement
+    :return: function of a cursor running the step
+    """
+    def step(cursor):
+        cursor.execute(check_sql, check_args)
+        if cursor.fetchall():
+            cursor.execute(statement)
+    return step
+
+
+def unique_hash_check(table, column, hash_column):
+    """
+    step of a migration stopping it before the unique index of a hash column is added if rows share a hash:
+    their values only differ in case or trailing spaces (a NO PAD collation kept 'x' and 'x ' apart)
+    :param table: table of the column
+    :param column: text column hashed
+    :param hash_column: hash column
+    :return: function of a cursor running the check
+    """
+    def check(cursor):
+        cursor.execute(FIND_DUPLICATE_HASHES.format(table=table, hash_column=hash_column))
+        duplicates = [row['ids'] for row in cursor.fetchall()]
+        if duplicates:
+            raise pymysql.err.IntegrityError(f'Rows of {table} share a {column} up to case and trailing spaces '
+                                             f'(ids {"; ".join(duplicates)}). Merge them and run sql_script.py '
+                                             f'again to finish the migration.')
+    return check
+
+
+def hash_key_migration():
+    """
+    steps moving the uniqueness of Articles.url and Summaries.summary to fixed-width hash columns: the columns
+    are added, filled for the rows already stored, given a unique index, and the unique indexes of the long
+    text columns are dropped. Every step can be run again.
+    :return: list of functions of a cursor
+    """
+    steps = []
+    for table, column, hash_column in HASH_KEYS:
+        names = dict(table=table, column=column, hash_column=hash_column)
+        steps += [unless_found(FIND_COLUMN.format(**names), [hash_column], ADD_HASH_COLUMN.format(**names)),
+                  hash_backfill(table, column, hash_column),
+                  unique_hash_check(table, column, hash_column),
+                  unless_found(FIND_INDEX.format(**names), [HASH_INDEX.format(**names)], ADD_HASH_KEY.format(**names)),
+                  if_found(FIND_INDEX.format(**names), [column], DROP_TEXT_KEY.format(**names))]
+    return steps
+
+
+MIGRATIONS = [
+    (1, 'unique Tags.name', dimension_migration(TAGS_TABLE, 'name', TAGS_ARTICLES_TABLE, 'tag_id')),
+    (2, 'unique Categories.category',
+     dimension_migration(CATEGORIES_TABLE, 'category', CATEGORIES_ARTICLES_TABLE, 'category_id')),
+    (3, 'primary key of Tags_in_articles', relationship_migration(TAGS_ARTICLES_TABLE, 'tag_id')),
+    (4, 'primary key of Authors_in_articles', relationship_migration(AUTHORS_ARTICLES_TABLE, 'author_id')),
+    (5, 'primary key of Categories_in_articles', relationship_migration(CATEGORIES_ARTICLES_TABLE, 'category_id')),
+    (6, 'aggregate tables', aggregate_migration()),
+    (7, 'hash keys of Articles.url and Summaries.summary', hash_key_migration()),
+]
+
+
+def apply_migrations(user, password, host, database):
+    """
+    brings an existing database up to the latest schema, applying the migrations it's missing in order
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to migrate
+    :return: list of the versions applied
+    """
+    applied_now = []
+    with pymysql.connect(host=host, user=user, password=password, database=database,
+                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
+        with connection_instance.cursor() as cursor:
+            cursor.execute(APPLIED_MIGRATIONS)
+            applied = {row[MIGRATION_VERSION] for row in cursor.fetchall()}
+            for version, name, statements in MIGRATIONS:
+                if version in applied:
+                    continue
+                for statement in statements:
+                    if callable(statement):  # a step running its own statements (check, guarded ALTER, backfill)
+                        statement(cursor)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute(RECORD_MIGRATION, [version, name])
+                connection_instance.commit()
+                applied_now.append(version)
+                sql_logger.info(f'Applied migration {version}: {name}.')
+    return applied_now
+
+
+def rebuild_aggregates(user, password, host, database):
+    """
+    recomputes the aggregate tables from scratch in one transaction (the scraper keeps them up to date
+    incrementally, this repairs them after rows were changed by hand)
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to rebuild the aggregates of
+    """
+    with pymysql.connect(host=host, user=user, password=password, database=database,
+                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
+        with connection_instance.cursor() as cursor:
+            for statement in aggregate_rebuild():
+                cursor.execute(statement)
+        connection_instance.commit()
+    sql_logger.info(f'Rebuilt the aggregate tables of {database}.')
+
+
+def explain_lookups(user, password, host, database):
+    """
+    prints the query plans of the scraper's lookups
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to explain the lookups on
+    """
+    import pandas as pd
+    with pymysql.connect(host=host, user=user, password=password, database=database,
+                         cursorclass=pymysql.cursors.DictCursor) as connection_instance:
+        with connection_instance.cursor() as cursor:
+            for name, sql, parameters in EXPLAINED_LOOKUPS:
+                print(name, ':')
+                try:
+                    cursor.execute(EXPLAIN + sql, parameters)
+                except pymysql.err.OperationalError as err:  # e.g. a hash column before its migration
+                    print(err.args, '\n')
+                    continue
+                print(pd.DataFrame(cursor.fetchall()), '\n')
 
 
 def show_and_describe_tables(user, password, host, database):
@@ -46,6 +260,7 @@ def show_and_describe_tables(user, password, host, database):
     :param database: database to save to
     :return:
     """
+    import pandas as pd
     with pymysql.connect(host=host, user=user, password=password, database=database,
                          cursorclass=pymysql.cursors.DictCursor) as connection_instance:
         with connection_instance.cursor() as cursor:
@@ -60,6 +275,26 @@ def show_and_describe_tables(user, password, host, database):
                 print(pd.DataFrame(cursor.fetchall()), '\n')
 
 
+def export_tables(user, password, host, database, directory, export_format, chunk_size, article_view):
+    """
+    streams every table (and optionally the denormalized article view) to files, chunk by chunk,
+    so memory use doesn't grow with the size of the tables
+    :param user: username of mysql
+    :param password: password of mysql
+    :param host: url of database server
+    :param database: database to export
+    :param directory: export directory
+    :param export_format: CSV_EXPORT, JSONL_EXPORT or PARQUET_EXPORT
+    :param chunk_size: number of rows fetched and written at a time
+    :param article_view: also export one row per article with its summary, authors, tags and categories
+    """
+    with pymysql.connect(host=host, user=user, password=password, database=database) as connection_instance:
+        exported = export_database(connection_instance, EXPORTED_TABLES, directory, export_format, chunk_size,
+                                   article_view)
+    for path, rows in exported.items():
+        print(f'{path}: {rows} rows')
+
+
 def drop_database(user, password, host, database):
     """
     delete the whole database
@@ -73,6 +308,7 @@ def drop_database(user, password, host, database):
                          cursorclass=pymysql.cursors.DictCursor) as connection_instance:
         with connection_instance.cursor() as cursor:
             cursor.execute(f'DROP DATABASE {database}')
+    forget_database(host, database)
     sql_logger.info(f'Deleted the database {database}.')
 
 
@@ -87,6 +323,7 @@ def reset_database(user, password, host, database):
     """
     drop_database(user, password, host, database)
     initialize_database(user, password, host, database)
+    apply_migrations(user, password, host, database)
     sql_logger.info(f'Reset the database {database}.')
 
 
@@ -100,19 +337,51 @@ def main():
     parser.add_argument('--print', help='Show the created DB and its tables', action='store_true')
     parser.add_argument('--delete', help='Clean database for tests', action='store_true')
     parser.add_argument('--reset', help='Reset database for tests', action='store_true')
+    parser.add_argument('--explain', help="Show the query plans of the scraper's lookups before and after "
+                                          "applying the pending migrations", action='store_true')
+    parser.add_argument('--rebuild-aggregates', action='store_true',
+                        help='Recompute the aggregate tables (articles per tag per day, per author per week '
+                             'and per category per day) from the articles')
+    parser.add_argument('--export', nargs='?', const=EXPORT_DIR, metavar='directory',
+                        help=f'Stream every table to a file in the directory (default {EXPORT_DIR}), '
+                             f'chunk by chunk with a server-side cursor')
+    parser.add_argument('--format', choices=[CSV_EXPORT, JSONL_EXPORT, PARQUET_EXPORT], default=CSV_EXPORT,
+                        help='File format of --export (parquet needs pyarrow)')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, metavar='rows',
+                        help='Number of rows --export fetches and writes at a time')
+    parser.add_argument('--article-view', action='store_true',
+                        help='With --export, also export one row per article joined with its summary, '
+                             'authors, tags and categories')
     args = parser.parse_args()
     try:
         initialize_database(args.username, args.password, args.host, args.database)
+        if args.explain:
+            print('Query plans before migrating:\n')
+            explain_lookups(args.username, args.password, args.host, args.database)
+        applied = apply_migrations(args.username, args.password, args.host, args.database)
+        if args.explain:
+            if applied:
+                print(f'Query plans after applying migrations {applied}:\n')
+                explain_lookups(args.username, args.password, args.host, args.database)
+            else:
+                print('No pending migrations, the plans above are the current ones.')
         if args.reset:
             reset_database(args.username, args.password, args.host, args.database)
+        if args.rebuild_aggregates:
+            rebuild_aggregates(args.username, args.password, args.host, args.database)
         if args.print:
             show_and_describe_tables(args.username, args.password, args.host, args.database)
+        if args.export:
+            export_tables(args.username, args.password, args.host, args.database, args.export, args.format,
+                          args.chunk_size, args.article_view)
         if args.delete:
             drop_database(args.username, args.password, args.host, args.database)
     except pymysql.err.Error as err:
         sql_logger.error(err.args)
         print(err.args)
         exit(1)
+    finally:
+        log_queue_handler.stop()
 
 
 if __name__ == '__main__':